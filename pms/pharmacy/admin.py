@@ -1,9 +1,164 @@
 from django.contrib import admin
-from .models import Medicine, Supplier, Customer, Order, OrderItem, SupplierRequest
-
-admin.site.register(Medicine)
-admin.site.register(Supplier)
-admin.site.register(Customer)
-admin.site.register(Order)
-admin.site.register(OrderItem)
-admin.site.register(SupplierRequest)
\ No newline at end of file
+from django.contrib.admin.utils import lookup_spawns_duplicates
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.functional import cached_property
+
+from .models import Branch, Medicine, Supplier, Customer, Order, OrderItem, SupplierRequest, Doctor, Appointment, Prescription
+
+# Rows counted at most for a changelist; a larger result only pages up to here
+# unless the database can estimate the size of the whole table
+COUNT_LIMIT = 10000
+
+
+def estimated_rows(model, using):
+    """The planner's row count of model's table, or None where the database keeps none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        query, params = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [connection.ops.quote_name(table)]
+    elif connection.vendor == 'sqlite':
+        # Only present once ANALYZE has run; the first number of each entry is the table's row count
+        query, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    rows = int(float(str(row[0]).split()[0]))
+    return rows if rows > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts a large table in full: an unfiltered list
+    takes the table statistics' estimate, and other counts stop at COUNT_LIMIT.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > COUNT_LIMIT:
+                return estimate
+        return queryset[:COUNT_LIMIT].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelists that stay fast on large tables: no full count next to the
+    filtered one, estimated page counts, and a search that is an index range
+    over the '^' prefix fields, or a primary key lookup for a numeric term.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        prefixed = [field[1:] for field in self.get_search_fields(request) if field.startswith('^')]
+        if not term or not prefixed:
+            return super().get_search_results(request, queryset, search_term)
+        # '^' would compile to a LIKE that neither SQLite nor PostgreSQL serves
+        # from a plain index; a range over the lowercased term is, from the
+        # Lower('name') indexes, and still matches regardless of case
+        term = term.lower()
+        match = Q()
+        for i, field in enumerate(prefixed):
+            queryset = queryset.alias(**{f'_search_{i}': Lower(field)})
+            match |= Q(**{f'_search_{i}__gte': term, f'_search_{i}__lt': term + '\uffff'})
+        return queryset.filter(match), any(lookup_spawns_duplicates(self.opts, field) for field in prefixed)
+
+
+@admin.register(Branch)
+class BranchAdmin(LargeTableAdmin):
+    list_display = ('name', 'address')
+    search_fields = ('^name',)
+    ordering = ('name',)
+    filter_horizontal = ('staff',)
+
+
+@admin.register(Medicine)
+class MedicineAdmin(LargeTableAdmin):
+    list_display = ('name', 'price', 'expiry_date', 'updated_at')
+    search_fields = ('^name',)
+    ordering = ('name',)
+
+
+@admin.register(Supplier)
+class SupplierAdmin(LargeTableAdmin):
+    list_display = ('name', 'contact_person', 'email', 'phone')
+    search_fields = ('^name',)
+    ordering = ('name',)
+
+
+@admin.register(Customer)
+class CustomerAdmin(LargeTableAdmin):
+    list_display = ('name', 'email', 'phone', 'user')
+    list_select_related = ('user',)
+    search_fields = ('^name',)
+    ordering = ('name',)
+    autocomplete_fields = ('user',)
+
+
+@admin.register(Doctor)
+class DoctorAdmin(LargeTableAdmin):
+    list_display = ('name', 'specialization', 'phone', 'user')
+    list_select_related = ('user',)
+    search_fields = ('^name',)
+    ordering = ('name',)
+    autocomplete_fields = ('user',)
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'customer', 'branch', 'order_date', 'total_amount', 'status')
+    list_select_related = ('customer', 'branch')
+    search_fields = ('^customer__name',)
+    autocomplete_fields = ('customer', 'branch')
+    date_hierarchy = 'order_date'
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'order', 'medicine', 'quantity', 'unit_price', 'line_total')
+    list_select_related = ('order__customer', 'medicine')
+    search_fields = ('^medicine__name',)
+    autocomplete_fields = ('order', 'medicine')
+
+
+@admin.register(Appointment)
+class AppointmentAdmin(LargeTableAdmin):
+    list_display = ('id', 'customer', 'doctor', 'date', 'status')
+    list_select_related = ('customer', 'doctor')
+    search_fields = ('^customer__name', '^doctor__name')
+    autocomplete_fields = ('customer', 'doctor')
+    date_hierarchy = 'date'
+
+
+@admin.register(SupplierRequest)
+class SupplierRequestAdmin(LargeTableAdmin):
+    list_display = ('id', 'supplier', 'medicine', 'branch', 'quantity', 'status', 'created_at')
+    list_select_related = ('supplier', 'medicine', 'branch')
+    search_fields = ('^supplier__name', '^medicine__name')
+    autocomplete_fields = ('supplier', 'medicine', 'branch')
+    date_hierarchy = 'created_at'
+
+
+@admin.register(Prescription)
+class PrescriptionAdmin(LargeTableAdmin):
+    list_display = ('id', 'doctor', 'patient', 'date_created', 'status')
+    list_select_related = ('doctor', 'patient')
+    search_fields = ('^patient__username', '^doctor__username')
+    autocomplete_fields = ('doctor', 'patient')
+    date_hierarchy = 'date_created'
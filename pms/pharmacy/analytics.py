@@ -0,0 +1,211 @@
+import threading
+import time
+from datetime import date
+from uuid import uuid4
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, OrderItem
+
+# Seconds after which the cube is rebuilt from scratch, picking up cancellations and deleted items
+FULL_RELOAD_INTERVAL = 3600
+# Rows fetched per round trip while loading
+LOAD_CHUNK_SIZE = 5000
+# Replaced by invalidate(); every process reloads its cube once it sees a new one
+VERSION_KEY = 'pharmacy:sales-cube-version'
+
+EPOCH = date(1970, 1, 1)
+
+COLUMNS = (
+    ('item_id', np.int64),
+    ('order_id', np.int64),
+    ('day', np.int32),  # days since 1970-01-01, local time
+    ('hour', np.int8),
+    ('medicine_id', np.int64),
+    ('customer_id', np.int64),
+    ('qty', np.int32),
+    ('amount', np.float64),
+)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY)
+    return version
+
+
+def _day_number(value):
+    return (value - EPOCH).days
+
+
+class SalesCube:
+    """
+    Column-oriented, in-memory copy of non-cancelled order lines, archived
+    ones included.
+
+    New lines are appended incrementally on every query; the whole cube is
+    reloaded when invalidate() has been called in any process or
+    FULL_RELOAD_INTERVAL has passed. Each worker process holds its own cube.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._data = {name: np.empty(1024, dtype=dtype) for name, dtype in COLUMNS}
+        self._size = 0
+        self._last_item_id = 0
+        self._loaded_at = None
+        self._version = None
+
+    def invalidate(self):
+        # Through the shared cache so other processes reload too, once the change is visible to them
+        transaction.on_commit(lambda: cache.delete(VERSION_KEY))
+
+    def _append(self, rows, track=True):
+        if not rows:
+            return
+        needed = self._size + len(rows)
+        capacity = len(self._data['item_id'])
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            for name, dtype in COLUMNS:
+                grown = np.empty(capacity, dtype=dtype)
+                grown[:self._size] = self._data[name][:self._size]
+                self._data[name] = grown
+        for position, (name, dtype) in enumerate(COLUMNS):
+            self._data[name][self._size:needed] = np.fromiter((row[position] for row in rows), dtype=dtype, count=len(rows))
+        self._size = needed
+        if track:
+            self._last_item_id = rows[-1][0]
+
+    def _load_archived(self):
+        # Walk archived orders and their items side by side, both sorted by order id
+        orders = ArchivedOrder.objects.exclude(status='Cancelled')\
+            .values_list('pk', 'order_date', 'customer_id').order_by('pk').iterator(chunk_size=LOAD_CHUNK_SIZE)
+        items = ArchivedOrderItem.objects.values_list('pk', 'order_id', 'medicine_id', 'quantity', 'unit_price')\
+            .order_by('order_id', 'pk').iterator(chunk_size=LOAD_CHUNK_SIZE)
+        order = next(orders, None)
+        rows = []
+        for pk, order_id, medicine_id, qty, price in items:
+            while order is not None and order[0] < order_id:
+                order = next(orders, None)
+            if order is None:
+                break
+            if order[0] != order_id:
+                continue
+            ordered_at = timezone.localtime(order[1])
+            rows.append((pk, order_id, _day_number(ordered_at.date()), ordered_at.hour, medicine_id, order[2], qty, float(price * qty)))
+            if len(rows) >= LOAD_CHUNK_SIZE:
+                self._append(rows, track=False)
+                rows = []
+        self._append(rows, track=False)
+
+    def refresh(self):
+        """Pull in new order lines and return a consistent snapshot of every column."""
+        with self._lock:
+            version = _version()
+            if version != self._version or time.monotonic() - self._loaded_at > FULL_RELOAD_INTERVAL:
+                self._reset()
+                self._loaded_at = time.monotonic()
+                self._version = version
+                self._load_archived()
+
+            lines = OrderItem.objects.filter(pk__gt=self._last_item_id).exclude(order__status='Cancelled')\
+                .values_list('pk', 'order_id', 'order__order_date', 'medicine_id', 'order__customer_id', 'quantity', 'line_total')\
+                .order_by('pk')
+            rows = []
+            for pk, order_id, ordered_at, medicine_id, customer_id, qty, line_total in lines.iterator(chunk_size=LOAD_CHUNK_SIZE):
+                ordered_at = timezone.localtime(ordered_at)
+                rows.append((pk, order_id, _day_number(ordered_at.date()), ordered_at.hour, medicine_id, customer_id, qty, float(line_total)))
+                if len(rows) >= LOAD_CHUNK_SIZE:
+                    self._append(rows)
+                    rows = []
+            self._append(rows)
+            return {name: self._data[name][:self._size] for name, _ in COLUMNS}
+
+    def _columns(self, start=None, end=None):
+        """Return views of every column, restricted to start <= date <= end."""
+        columns = self.refresh()
+        mask = np.ones(columns['day'].size, dtype=bool)
+        if start:
+            mask &= columns['day'] >= _day_number(start)
+        if end:
+            mask &= columns['day'] <= _day_number(end)
+        return {name: values[mask] for name, values in columns.items()}
+
+    def totals(self, start=None, end=None):
+        c = self._columns(start, end)
+        return {
+            'revenue': float(c['amount'].sum()),
+            'orders': int(np.unique(c['order_id']).size),
+            'units': int(c['qty'].sum()),
+            'customers': int(np.unique(c['customer_id']).size),
+        }
+
+    def by_medicine(self, start=None, end=None, order_by='qty', limit=10):
+        """Units and revenue per medicine, highest first by 'qty' or 'amount'."""
+        c = self._columns(start, end)
+        medicine_ids, inverse = np.unique(c['medicine_id'], return_inverse=True)
+        qty = np.bincount(inverse, weights=c['qty'], minlength=medicine_ids.size)
+        amount = np.bincount(inverse, weights=c['amount'], minlength=medicine_ids.size)
+        ranking = np.argsort(-(qty if order_by == 'qty' else amount), kind='stable')[:limit]
+        return [
+            {'medicine_id': int(medicine_ids[i]), 'qty': int(qty[i]), 'amount': float(amount[i])}
+            for i in ranking
+        ]
+
+    def hour_heatmap(self, start=None, end=None):
+        """7x24 revenue matrix, rows Monday..Sunday, columns hour of day."""
+        c = self._columns(start, end)
+        weekday = (c['day'] + 3) % 7  # 1970-01-01 was a Thursday
+        cells = weekday.astype(np.int64) * 24 + c['hour']
+        return np.bincount(cells, weights=c['amount'], minlength=7 * 24).reshape(7, 24)
+
+    def cohorts(self, start=None, end=None):
+        """
+        Active customers and revenue per (first purchase month, activity month).
+
+        The first purchase month is taken over all history, so a customer keeps
+        their cohort whatever range is being looked at.
+        """
+        columns = self.refresh()
+        all_months = columns['day'].astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        customer_ids, inverse = np.unique(columns['customer_id'], return_inverse=True)
+        first_month = np.full(customer_ids.size, np.iinfo(np.int64).max)
+        np.minimum.at(first_month, inverse, all_months)
+
+        mask = np.ones(columns['day'].size, dtype=bool)
+        if start:
+            mask &= columns['day'] >= _day_number(start)
+        if end:
+            mask &= columns['day'] <= _day_number(end)
+        cohort = first_month[inverse[mask]]
+        month = all_months[mask]
+        amount = columns['amount'][mask]
+
+        cells, cell_inverse = np.unique(np.stack([cohort, month]), axis=1, return_inverse=True)
+        cell_inverse = cell_inverse.ravel()
+        revenue = np.bincount(cell_inverse, weights=amount, minlength=cells.shape[1])
+        active = np.unique(np.stack([cell_inverse, inverse[mask]]), axis=1)
+        customers = np.bincount(active[0], minlength=cells.shape[1])
+        return [
+            {
+                'cohort': np.datetime64(int(cells[0, i]), 'M').astype(date),
+                'month': np.datetime64(int(cells[1, i]), 'M').astype(date),
+                'customers': int(customers[i]),
+                'revenue': float(revenue[i]),
+            }
+            for i in range(cells.shape[1])
+        ]
+
+
+sales_cube = SalesCube()
@@ -0,0 +1,181 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .changefeed import archiving
+from .models import (
+    Appointment, ArchivedAppointment, ArchivedOrder, ArchivedOrderItem, ArchivedPrescription,
+    ArchivedPrescriptionItem, ArchivedSupplierRequest, Order, OrderItem, Prescription,
+    PrescriptionItem, SupplierRequest,
+)
+
+ARCHIVE_CHUNK_SIZE = 1000
+
+# Only records that can no longer change are archived
+CLOSED_ORDER_STATUSES = ['Completed', 'Cancelled']
+CLOSED_APPOINTMENT_STATUSES = ['Approved', 'Rejected', 'Completed']
+CLOSED_PRESCRIPTION_STATUSES = ['Dispensed', 'Rejected']
+CLOSED_SUPPLIER_REQUEST_STATUSES = ['Completed']
+
+
+def archive_cutoff(days=None):
+    return timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+def _move(queryset, archive_model, copy, chunk_size, progress=None):
+    """
+    Move the rows of queryset to the archive, one chunk per transaction.
+
+    The archive copy commits before the hot rows are deleted and is written
+    with ignore_conflicts, so a run interrupted between the two steps can
+    simply be repeated. The deletions leave no change feed tombstones.
+    """
+    archive_db = router.db_for_write(archive_model)
+    moved = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        with transaction.atomic():
+            with transaction.atomic(using=archive_db):
+                copy(pks)
+            with archiving():
+                queryset.model.objects.filter(pk__in=pks).delete()
+        moved += len(pks)
+        if progress:
+            progress(queryset.model, moved)
+    return moved
+
+
+def _copy_orders(pks):
+    ArchivedOrder.objects.bulk_create([
+        ArchivedOrder(
+            id=order.pk,
+            customer_id=order.customer_id,
+            customer_name=order.customer.name,
+            branch_id=order.branch_id,
+            order_date=order.order_date,
+            total_amount=order.total_amount,
+            status=order.status,
+            client_id=order.client_id,
+        )
+        for order in Order.objects.filter(pk__in=pks).select_related('customer')
+    ], ignore_conflicts=True)
+    ArchivedOrderItem.objects.bulk_create([
+        ArchivedOrderItem(
+            id=item.pk,
+            order_id=item.order_id,
+            medicine_id=item.medicine_id,
+            medicine_name=item.medicine.name,
+            quantity=item.quantity,
+            unit_price=item.unit_price,
+        )
+        for item in OrderItem.objects.filter(order_id__in=pks).select_related('medicine')
+    ], ignore_conflicts=True)
+
+
+def _copy_appointments(pks):
+    ArchivedAppointment.objects.bulk_create([
+        ArchivedAppointment(
+            id=appointment.pk,
+            customer_id=appointment.customer_id,
+            customer_name=appointment.customer.name,
+            doctor_id=appointment.doctor_id,
+            doctor_name=appointment.doctor.name,
+            date=appointment.date,
+            reason=appointment.reason,
+            status=appointment.status,
+            created_at=appointment.created_at,
+        )
+        for appointment in Appointment.objects.filter(pk__in=pks).select_related('customer', 'doctor')
+    ], ignore_conflicts=True)
+
+
+def _copy_prescriptions(pks):
+    ArchivedPrescription.objects.bulk_create([
+        ArchivedPrescription(
+            id=prescription.pk,
+            doctor_id=prescription.doctor_id,
+            patient_id=prescription.patient_id,
+            date_created=prescription.date_created,
+            status=prescription.status,
+            remarks=prescription.remarks,
+        )
+        for prescription in Prescription.objects.filter(pk__in=pks)
+    ], ignore_conflicts=True)
+    ArchivedPrescriptionItem.objects.bulk_create([
+        ArchivedPrescriptionItem(
+            id=item.pk,
+            prescription_id=item.prescription_id,
+            medicine_id=item.medicine_id,
+            medicine_name=item.medicine.name,
+            dosage=item.dosage,
+            frequency=item.frequency,
+            duration=item.duration,
+        )
+        for item in PrescriptionItem.objects.filter(prescription_id__in=pks).select_related('medicine')
+    ], ignore_conflicts=True)
+
+
+def _copy_supplier_requests(pks):
+    ArchivedSupplierRequest.objects.bulk_create([
+        ArchivedSupplierRequest(
+            id=req.pk,
+            supplier_id=req.supplier_id,
+            supplier_name=req.supplier.name,
+            medicine_id=req.medicine_id,
+            medicine_name=req.medicine.name,
+            quantity=req.quantity,
+            status=req.status,
+            created_at=req.created_at,
+        )
+        for req in SupplierRequest.objects.filter(pk__in=pks).select_related('supplier', 'medicine')
+    ], ignore_conflicts=True)
+
+
+def archive_closed_records(days=None, chunk_size=ARCHIVE_CHUNK_SIZE, progress=None):
+    """Archive every closed record older than days, returning the number moved per model."""
+    cutoff = archive_cutoff(days)
+    return {
+        'orders': _move(
+            Order.objects.filter(order_date__lt=cutoff, status__in=CLOSED_ORDER_STATUSES),
+            ArchivedOrder, _copy_orders, chunk_size, progress,
+        ),
+        'appointments': _move(
+            Appointment.objects.filter(date__lt=cutoff, status__in=CLOSED_APPOINTMENT_STATUSES),
+            ArchivedAppointment, _copy_appointments, chunk_size, progress,
+        ),
+        'prescriptions': _move(
+            Prescription.objects.filter(date_created__lt=cutoff, status__in=CLOSED_PRESCRIPTION_STATUSES),
+            ArchivedPrescription, _copy_prescriptions, chunk_size, progress,
+        ),
+        'supplier_requests': _move(
+            SupplierRequest.objects.filter(created_at__lt=cutoff, status__in=CLOSED_SUPPLIER_REQUEST_STATUSES),
+            ArchivedSupplierRequest, _copy_supplier_requests, chunk_size, progress,
+        ),
+    }
+
+
+def orders_reach_archive(start_date=None):
+    """Whether a report starting at start_date (a date or ISO string) needs archived orders."""
+    newest = ArchivedOrder.objects.order_by('-order_date').values_list('order_date', flat=True).first()
+    if newest is None:
+        return False
+    return not start_date or str(start_date) <= timezone.localtime(newest).date().isoformat()
+
+
+def archived_daily_sales(branch_ids, start_date=None, end_date=None):
+    """Per-day revenue and order counts of archived orders from branch_ids, in the shape sales_report uses."""
+    orders = ArchivedOrder.objects.filter(branch_id__in=branch_ids)
+    if start_date:
+        orders = orders.filter(order_date__date__gte=start_date)
+    if end_date:
+        orders = orders.filter(order_date__date__lte=end_date)
+    return orders.annotate(date=TruncDate('order_date')).values('date').annotate(
+        daily_revenue=Sum('total_amount'),
+        daily_orders=Count('id')
+    ).order_by('-date')
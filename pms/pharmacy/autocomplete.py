@@ -0,0 +1,110 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import Customer, Doctor, Medicine, Supplier
+
+# Seconds before an index is rebuilt even without local changes, to pick up
+# edits made by other worker processes
+INDEX_MAX_AGE = 300
+MAX_RESULTS = 20
+
+
+class PrefixIndex:
+    """
+    Sorted (word, pk) pairs for one table, so a prefix lookup is a binary
+    search instead of a LIKE scan. Built lazily from load(), which returns
+    (pk, label) pairs, then kept current one row at a time as labels change.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._lock = threading.Lock()
+        self._words = []
+        self._labels = {}
+        self._built_at = None
+
+    def invalidate(self):
+        self._built_at = None
+
+    def changed(self, pk, label):
+        """Record that pk now has label, or None when it left the index, once the change commits."""
+        transaction.on_commit(lambda: self._update(pk, label))
+
+    def _update(self, pk, label):
+        # Only pk's own entries move, so a new row does not cost a rebuild of the
+        # whole index. They move in copies swapped in at once, since searches
+        # read the list and labels they got from _snapshot() without the lock
+        with self._lock:
+            if self._built_at is None:
+                return
+            old = self._labels.get(pk)
+            if old == label:
+                return
+            words, labels = list(self._words), dict(self._labels)
+            if old is not None:
+                for word in set(old.lower().split()):
+                    i = bisect_left(words, (word, pk))
+                    if i < len(words) and words[i] == (word, pk):
+                        del words[i]
+                del labels[pk]
+            if label is not None:
+                labels[pk] = label
+                for word in set(label.lower().split()):
+                    insort(words, (word, pk))
+            self._words, self._labels = words, labels
+
+    def _snapshot(self):
+        with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at > INDEX_MAX_AGE:
+                labels = dict(self._load())
+                self._words = sorted(
+                    (word, pk) for pk, label in labels.items() for word in set(label.lower().split())
+                )
+                self._labels = labels
+                self._built_at = time.monotonic()
+            return self._words, self._labels
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Return up to limit (pk, label) pairs whose words start with every word of query."""
+        terms = query.lower().split()
+        if not terms:
+            return []
+        words, labels = self._snapshot()
+        # Scan the index for the most selective (longest) term and check the rest on the label
+        lead = max(terms, key=len)
+        results = []
+        seen = set()
+        i = bisect_left(words, (lead,))
+        while i < len(words) and words[i][0].startswith(lead) and len(results) < limit:
+            pk = words[i][1]
+            i += 1
+            if pk in seen:
+                continue
+            seen.add(pk)
+            label_words = labels[pk].lower().split()
+            if all(any(word.startswith(term) for word in label_words) for term in terms):
+                results.append((pk, labels[pk]))
+        results.sort(key=lambda result: result[1].lower())
+        return results
+
+
+def _doctor_labels():
+    for pk, name, specialization in Doctor.objects.values_list('pk', 'name', 'specialization'):
+        yield pk, doctor_label(name, specialization)
+
+
+def doctor_label(name, specialization):
+    return f'{name} ({specialization})' if specialization else name
+
+
+AUTOCOMPLETE_INDEXES = {
+    'medicines': PrefixIndex(lambda: Medicine.objects.values_list('pk', 'name')),
+    'customers': PrefixIndex(lambda: Customer.objects.values_list('pk', 'name')),
+    'suppliers': PrefixIndex(lambda: Supplier.objects.values_list('pk', 'name')),
+    'doctors': PrefixIndex(_doctor_labels),
+    'patients': PrefixIndex(lambda: User.objects.filter(is_staff=False).values_list('pk', 'username')),
+}
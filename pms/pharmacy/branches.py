@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Branch, BranchStock
+
+# Stock at or below this level is reported as low
+LOW_STOCK_LEVEL = 10
+
+
+class OutOfStock(Exception):
+    def __init__(self, medicine_id):
+        super().__init__(medicine_id)
+        self.medicine_id = medicine_id
+
+
+def branch_db(branch_id):
+    """Database holding a branch's stock: its own 'branch_<id>' alias if configured, else 'default'."""
+    alias = f'branch_{branch_id}'
+    return alias if alias in settings.DATABASES else 'default'
+
+
+def stock_atomic(branch_id):
+    """Transaction on the branch's stock database; nest it inside the default database's transaction."""
+    return transaction.atomic(using=branch_db(branch_id))
+
+
+def stock_rows(branch_id):
+    return BranchStock.objects.using(branch_db(branch_id)).filter(branch_id=branch_id)
+
+
+def stock_levels(branch_id, medicine_ids=None):
+    """{medicine_id: quantity} at a branch, for the given medicines or all of them."""
+    if branch_id is None:
+        return {}
+    rows = stock_rows(branch_id)
+    if medicine_ids is not None:
+        rows = rows.filter(medicine_id__in=list(medicine_ids))
+    return dict(rows.values_list('medicine_id', 'quantity'))
+
+
+def take_stock(branch_id, quantities):
+    """
+    Remove {medicine_id: quantity} from a branch with one conditional UPDATE
+    per medicine, raising OutOfStock for the first one that is short.
+
+    Call it inside stock_atomic(branch_id) so a shortage also undoes the
+    medicines already taken.
+    """
+    rows = stock_rows(branch_id)
+    now = timezone.now()
+    for medicine_id, quantity in quantities.items():
+        if not rows.filter(medicine_id=medicine_id, quantity__gte=quantity).update(quantity=F('quantity') - quantity, updated_at=now):
+            raise OutOfStock(medicine_id)
+
+
+def put_stock(branch_id, quantities):
+    """Add {medicine_id: quantity} to a branch, creating stock rows on first delivery."""
+    db = branch_db(branch_id)
+    rows = stock_rows(branch_id)
+    now = timezone.now()
+    for medicine_id, quantity in quantities.items():
+        if rows.filter(medicine_id=medicine_id).update(quantity=F('quantity') + quantity, updated_at=now):
+            continue
+        try:
+            with transaction.atomic(using=db):
+                BranchStock.objects.using(db).create(branch_id=branch_id, medicine_id=medicine_id, quantity=quantity)
+        except IntegrityError:
+            # Created concurrently by another delivery
+            rows.filter(medicine_id=medicine_id).update(quantity=F('quantity') + quantity, updated_at=now)
+
+
+def set_stock(branch_id, medicine_id, quantity):
+    BranchStock.objects.using(branch_db(branch_id)).update_or_create(
+        branch_id=branch_id, medicine_id=medicine_id, defaults={'quantity': quantity},
+    )
+
+
+def delete_stock(medicine_id=None, branch_id=None):
+    """Remove the stock rows of a deleted medicine or branch from every database holding them."""
+    aliases = {branch_db(branch_id)} if branch_id is not None else stock_databases()
+    for alias in aliases:
+        rows = BranchStock.objects.using(alias).all()
+        if medicine_id is not None:
+            rows = rows.filter(medicine_id=medicine_id)
+        if branch_id is not None:
+            rows = rows.filter(branch_id=branch_id)
+        rows.delete()
+
+
+def stock_databases():
+    return {'default'} | {alias for alias in settings.DATABASES if alias.startswith('branch_')}
+
+
+def _summarize(alias, branch_ids):
+    try:
+        return list(
+            BranchStock.objects.using(alias).filter(branch_id__in=branch_ids)
+            .values('branch_id')
+            .annotate(
+                units=Sum('quantity'),
+                in_stock=Count('id', filter=Q(quantity__gt=0)),
+                low_stock=Count('id', filter=Q(quantity__lte=LOW_STOCK_LEVEL)),
+            )
+            .order_by()
+        )
+    finally:
+        # Worker threads get their own connections; do not leave them open
+        connections[alias].close()
+
+
+def branch_stock_summary():
+    """
+    Units, products in stock and low-stock products per branch.
+
+    Each stock database is queried from its own thread, so the report takes
+    as long as the slowest branch rather than the sum of all of them.
+    """
+    branches = list(Branch.objects.order_by('name'))
+    by_db = {}
+    for branch in branches:
+        by_db.setdefault(branch_db(branch.pk), []).append(branch.pk)
+    summary = {}
+    if by_db:
+        with ThreadPoolExecutor(max_workers=len(by_db)) as pool:
+            for rows in pool.map(lambda item: _summarize(*item), by_db.items()):
+                summary.update((row['branch_id'], row) for row in rows)
+    return [
+        {'branch': branch, **summary.get(branch.pk, {'units': 0, 'in_stock': 0, 'low_stock': 0})}
+        for branch in branches
+    ]
@@ -0,0 +1,88 @@
+import calendar
+from datetime import date, datetime, time, timedelta
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Appointment
+
+# Counts of past months never change without a signal bumping the version, so this only bounds memory
+MONTH_COUNTS_TIMEOUT = 24 * 3600
+APPOINTMENT_STATUSES = [value for value, _ in Appointment._meta.get_field('status').choices]
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_range(day):
+    """Aware [start, end) datetimes of a local day, usable with an index on the datetime column."""
+    return day_start(day), day_start(day + timedelta(days=1))
+
+
+def week_range(day):
+    monday = day - timedelta(days=day.weekday())
+    return day_start(monday), day_start(monday + timedelta(days=7))
+
+
+def month_range(year, month):
+    first = date(year, month, 1)
+    following = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return day_start(first), day_start(following)
+
+
+def _version_key(doctor_id):
+    return f'pharmacy:calendar-version:{doctor_id}'
+
+
+def _version(doctor_id):
+    key = _version_key(doctor_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key)
+    return version
+
+
+def invalidate_doctor(doctor_id):
+    cache.delete(_version_key(doctor_id))
+
+
+def month_counts(doctor_id, year, month):
+    """{date: {status: count}} of a doctor's appointments in a month, from one grouped query."""
+    key = f'pharmacy:calendar:{doctor_id}:{_version(doctor_id)}:{year:04d}-{month:02d}'
+    counts = cache.get(key)
+    if counts is None:
+        start, end = month_range(year, month)
+        rows = Appointment.objects.filter(doctor_id=doctor_id, date__gte=start, date__lt=end)\
+            .annotate(day=TruncDate('date'))\
+            .values('day', 'status')\
+            .annotate(count=Count('id'))\
+            .order_by()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row['day'], {})[row['status']] = row['count']
+        cache.set(key, counts, MONTH_COUNTS_TIMEOUT)
+    return counts
+
+
+def month_grid(doctor_id, year, month):
+    """Weeks of days for a month view, Monday first, each with its per-status counts."""
+    counts = month_counts(doctor_id, year, month)
+    weeks = []
+    for week in calendar.Calendar().monthdatescalendar(year, month):
+        days = []
+        for day in week:
+            day_counts = counts.get(day, {}) if day.month == month else {}
+            days.append({
+                'date': day,
+                'in_month': day.month == month,
+                'counts': [(status, day_counts[status]) for status in APPOINTMENT_STATUSES if status in day_counts],
+                'total': sum(day_counts.values()),
+            })
+        weeks.append(days)
+    return weeks
@@ -0,0 +1,120 @@
+import base64
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .branches import stock_rows
+from .models import (
+    Appointment, BranchStock, ChangeTombstone, Order, OrderItem, Prescription, PrescriptionItem, SupplierRequest,
+)
+from .sync import SyncError
+
+FEED_PAGE_SIZE = 500
+MAX_FEED_PAGE_SIZE = 5000
+# Rows are only served once they are this old, so a transaction that
+# committed late with an earlier updated_at cannot be skipped by a cursor
+FEED_LAG = timedelta(seconds=5)
+# Consumers that fall further behind than this miss deletions and must copy the tables again
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+FEEDS = {
+    'orders': Order,
+    'order-items': OrderItem,
+    'prescriptions': Prescription,
+    'prescription-items': PrescriptionItem,
+    'appointments': Appointment,
+    'supplier-requests': SupplierRequest,
+    'stock': BranchStock,
+}
+FEED_NAMES = {model: name for name, model in FEEDS.items()}
+
+# Set while rows move to the archive: they leave the hot tables but were not deleted
+_archiving = ContextVar('archiving', default=False)
+
+
+def tombstone_key(instance):
+    if isinstance(instance, BranchStock):
+        return f'{instance.branch_id}:{instance.medicine_id}'
+    return str(instance.pk)
+
+
+@contextmanager
+def archiving():
+    """Delete rows inside this block without telling feed consumers to delete them too."""
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def record_deletion(instance):
+    if not _archiving.get():
+        ChangeTombstone.objects.create(feed=FEED_NAMES[type(instance)], key=tombstone_key(instance))
+
+
+def encode_cursor(updated_at, pk, tombstone_id):
+    raw = json.dumps([updated_at.isoformat() if updated_at else None, pk, tombstone_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        stamp, pk, tombstone_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        updated_at = parse_datetime(stamp) if stamp else None
+        if stamp and updated_at is None:
+            raise ValueError(stamp)
+        return updated_at, int(pk), int(tombstone_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise SyncError('Invalid cursor.')
+
+
+def _rows(feed, branch_id):
+    if feed == 'stock':
+        if branch_id is None:
+            raise SyncError('The stock feed needs a branch.')
+        return stock_rows(branch_id)
+    return FEEDS[feed]._default_manager.all()
+
+
+def changes(feed, cursor=None, limit=FEED_PAGE_SIZE, branch_id=None):
+    """
+    Rows of a feed changed after cursor, oldest first, and the keys of rows
+    deleted since, each at most `limit` long. Returns (rows, deleted, next
+    cursor, has_more); keep calling with the new cursor while has_more.
+    """
+    if feed not in FEEDS:
+        raise SyncError(f'Unknown feed {feed!r}.')
+    limit = max(1, min(limit, MAX_FEED_PAGE_SIZE))
+    updated_at, pk, tombstone_id = decode_cursor(cursor) if cursor else (None, 0, 0)
+
+    rows = _rows(feed, branch_id).filter(updated_at__lt=timezone.now() - FEED_LAG).order_by('updated_at', 'id')
+    if updated_at is not None:
+        rows = rows.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+    page = list(rows.values()[:limit + 1])
+
+    tombstones = ChangeTombstone.objects.filter(feed=feed, id__gt=tombstone_id).order_by('id')
+    if feed == 'stock':
+        tombstones = tombstones.filter(key__startswith=f'{branch_id}:')
+    deleted = list(tombstones.values_list('id', 'key')[:limit + 1])
+
+    has_more = len(page) > limit or len(deleted) > limit
+    page, deleted = page[:limit], deleted[:limit]
+    if page:
+        updated_at, pk = page[-1]['updated_at'], page[-1]['id']
+    if deleted:
+        tombstone_id = deleted[-1][0]
+    if feed == 'stock':
+        # Stock ids are local to the branch database; rows are keyed by branch and medicine
+        for row in page:
+            del row['id']
+    return page, [key for _, key in deleted], encode_cursor(updated_at, pk, tombstone_id), has_more
+
+
+def prune_tombstones(retention=TOMBSTONE_RETENTION):
+    return ChangeTombstone.objects.filter(deleted_at__lt=timezone.now() - retention).delete()[0]
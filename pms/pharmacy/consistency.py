@@ -0,0 +1,113 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Abs, Coalesce
+from django.utils import timezone
+
+from .branches import branch_db, stock_databases
+from .models import Appointment, Branch, BranchStock, Medicine, Order, OrderItem, OutboxMessage, Prescription, SupplierRequest
+
+CHECK_CHUNK_SIZE = 5000
+# Amounts closer than this are equal; SQLite does decimal arithmetic in floating point
+TOLERANCE = Decimal('0.005')
+# Problem rows listed per chunk in the report
+EXAMPLES = 5
+
+STATUS_MODELS = [Order, Appointment, SupplierRequest, Prescription, OutboxMessage]
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _result(rows, found, repaired=0):
+    return {'found': found, 'repaired': repaired, 'examples': rows[:EXAMPLES]}
+
+
+def check_line_totals(lo, hi, repair=False, alias=None):
+    """Order lines whose line_total is not unit_price x quantity."""
+    expected = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=MONEY)
+    lines = OrderItem.objects.filter(pk__gte=lo, pk__lt=hi)\
+        .annotate(drift=Abs(F('line_total') - expected)).filter(drift__gt=TOLERANCE)
+    pks = list(lines.values_list('pk', flat=True))
+    repaired = OrderItem.objects.filter(pk__in=pks).update(line_total=expected, updated_at=timezone.now()) if repair and pks else 0
+    return _result(pks, len(pks), repaired)
+
+
+def check_order_totals(lo, hi, repair=False, alias=None):
+    """Orders whose total_amount is not the sum of their line totals."""
+    items_total = Coalesce(Sum('items__line_total'), Value(Decimal(0)), output_field=MONEY)
+    orders = Order.objects.filter(pk__gte=lo, pk__lt=hi).annotate(items_total=items_total)\
+        .annotate(drift=Abs(F('total_amount') - F('items_total'))).filter(drift__gt=TOLERANCE)
+    pks = list(orders.values_list('pk', flat=True))
+    repaired = 0
+    if repair and pks:
+        line_sum = OrderItem.objects.filter(order=OuterRef('pk')).values('order').annotate(total=Sum('line_total')).values('total')
+        repaired = Order.objects.filter(pk__in=pks).update(
+            total_amount=Coalesce(Subquery(line_sum, output_field=MONEY), Value(Decimal(0)), output_field=MONEY),
+            updated_at=timezone.now(),
+        )
+    return _result(pks, len(pks), repaired)
+
+
+def check_stock_rows(lo, hi, repair=False, alias='default'):
+    """
+    Stock rows of branches or medicines that no longer exist, and rows kept
+    in another database than their branch's. Stock can be set by hand, so
+    quantities themselves cannot be reconciled against deliveries and sales;
+    orphaned rows are deleted on repair, misplaced ones are only reported.
+    """
+    rows = BranchStock.objects.using(alias).filter(pk__gte=lo, pk__lt=hi)
+    medicine_ids = set(rows.values_list('medicine_id', flat=True).distinct())
+    branch_ids = set(rows.values_list('branch_id', flat=True).distinct())
+    missing_medicines = medicine_ids - set(Medicine.all_objects.filter(pk__in=medicine_ids).values_list('pk', flat=True))
+    missing_branches = branch_ids - set(Branch.objects.filter(pk__in=branch_ids).values_list('pk', flat=True))
+    misplaced = [pk for pk in branch_ids - missing_branches if branch_db(pk) != alias]
+
+    orphans = rows.filter(Q(medicine_id__in=missing_medicines) | Q(branch_id__in=missing_branches))
+    problems = list(orphans.values_list('pk', flat=True)) + list(rows.filter(branch_id__in=misplaced).values_list('pk', flat=True))
+    repaired = orphans.delete()[0] if repair and (missing_medicines or missing_branches) else 0
+    return _result([f'{alias}:{pk}' for pk in problems], len(problems), repaired)
+
+
+def check_statuses(lo, hi, repair=False, alias=None, model=None):
+    """Rows whose status is not one of the model's declared choices. Never repaired: the right status is unknown."""
+    declared = [value for value, _ in model._meta.get_field('status').choices]
+    rows = model._default_manager.filter(pk__gte=lo, pk__lt=hi).exclude(status__in=declared)
+    found = list(rows.values_list('pk', 'status'))
+    return _result([f'{pk}={status!r}' for pk, status in found], len(found))
+
+
+def _status_check(model):
+    def check(lo, hi, repair=False, alias=None):
+        return check_statuses(lo, hi, repair, alias, model)
+    return check
+
+
+# name: (function, model whose primary keys are chunked, databases to scan)
+CHECKS = {
+    'line_totals': (check_line_totals, OrderItem, lambda: ['default']),
+    'order_totals': (check_order_totals, Order, lambda: ['default']),
+    'stock_rows': (check_stock_rows, BranchStock, lambda: sorted(stock_databases())),
+    **{
+        f'{model._meta.model_name}_statuses': (_status_check(model), model, lambda: ['default'])
+        for model in STATUS_MODELS
+    },
+}
+
+
+def plan_chunks(names, chunk_size=CHECK_CHUNK_SIZE):
+    """(check name, database, first pk, pk after last) for every chunk of every check."""
+    chunks = []
+    for name in names:
+        _, model, aliases = CHECKS[name]
+        for alias in aliases():
+            bounds = model._base_manager.using(alias).aggregate(first=Min('pk'), last=Max('pk'))
+            if bounds['first'] is None:
+                continue
+            for lo in range(bounds['first'], bounds['last'] + 1, chunk_size):
+                chunks.append((name, alias, lo, lo + chunk_size))
+    return chunks
+
+
+def run_chunk(name, alias, lo, hi, repair=False):
+    """Run one chunk of one check; the unit of work handed to each worker process."""
+    function = CHECKS[name][0]
+    return name, alias, lo, hi, function(lo, hi, repair, alias)
@@ -0,0 +1,129 @@
+from datetime import timedelta
+from hashlib import md5
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .calendars import day_start
+from .models import Appointment, Order
+
+# Counts of closed ranges only change when a row dated in the past does, which bumps the version
+FACET_TIMEOUT = 24 * 3600
+LIST_PAGE_SIZE = 25
+# Date each list is filtered and ordered by
+DATE_FIELDS = {Order: 'order_date', Appointment: 'date'}
+
+
+def _version_key(model):
+    return f'pharmacy:facets-version:{model._meta.model_name}'
+
+
+def _version(model):
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key)
+    return version
+
+
+def invalidate_facets(model):
+    cache.delete(_version_key(model))
+
+
+def row_changed(model, when):
+    """Drop cached counts if a row dated `when` may be part of a closed range."""
+    if when is None or when < day_start(timezone.localdate()):
+        invalidate_facets(model)
+
+
+def rows_changed(model, pks):
+    past = model._default_manager.filter(pk__in=pks, **{f'{DATE_FIELDS[model]}__lt': day_start(timezone.localdate())})
+    if past.exists():
+        invalidate_facets(model)
+
+
+def filter_rows(queryset, start=None, end=None, **fields):
+    """Rows dated within [start, end], as aware bounds an index on the date can use, and matching fields."""
+    date_field = DATE_FIELDS[queryset.model]
+    if start:
+        queryset = queryset.filter(**{f'{date_field}__gte': day_start(start)})
+    if end:
+        queryset = queryset.filter(**{f'{date_field}__lt': day_start(end + timedelta(days=1))})
+    return queryset.filter(**{name: value for name, value in fields.items() if value})
+
+
+def status_counts(queryset, end=None):
+    """
+    {status: count, 'total': count} for queryset in one conditional
+    aggregate. Ranges ending before today are closed and served from the
+    cache until a row dated in the past changes.
+    """
+    model = queryset.model
+    statuses = [value for value, _ in model._meta.get_field('status').choices]
+    key = None
+    if end is not None and end < timezone.localdate():
+        digest = md5(str(queryset.query).encode()).hexdigest()
+        key = f'pharmacy:facets:{model._meta.model_name}:{_version(model)}:{digest}'
+        counts = cache.get(key)
+        if counts is not None:
+            return counts
+    aggregates = {f'status_{index}': Count('pk', filter=Q(status=status)) for index, status in enumerate(statuses)}
+    row = queryset.order_by().aggregate(total=Count('pk'), **aggregates)
+    counts = {status: row[f'status_{index}'] for index, status in enumerate(statuses)}
+    counts['total'] = row['total']
+    if key:
+        cache.set(key, counts, FACET_TIMEOUT)
+    return counts
+
+
+def facet_links(request, counts):
+    """One entry per status, with the URL of the same filters narrowed to it, for the filter bar."""
+    current = request.GET.get('status', '')
+    links = []
+    for status in [''] + [status for status in counts if status != 'total']:
+        params = request.GET.copy()
+        params.pop('page', None)
+        params['status'] = status
+        links.append({
+            'status': status or 'All',
+            'count': counts[status or 'total'],
+            'url': f'?{params.urlencode()}',
+            'active': status == current,
+        })
+    return links
+
+
+class CountedPaginator(Paginator):
+    """Paginator given its row count, here already known from the facet counts."""
+
+    def __init__(self, object_list, per_page, count):
+        super().__init__(object_list, per_page)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        return self._count
+
+
+def facet_page(request, queryset, form):
+    """
+    Filter queryset with a valid filter form and return (page, facet links).
+
+    Status facets are counted over every other filter, so each shows how
+    many rows picking it would give; the same counts size the paginator.
+    """
+    filters = dict(form.cleaned_data) if form.is_valid() else {}
+    status = filters.pop('status', '')
+    start, end = filters.pop('start', None), filters.pop('end', None)
+    rows = filter_rows(queryset, start, end, **filters)
+    counts = status_counts(rows, end)
+    if status:
+        rows = rows.filter(status=status)
+    page = CountedPaginator(rows, LIST_PAGE_SIZE, counts[status or 'total']).get_page(request.GET.get('page'))
+    return page, facet_links(request, counts)
@@ -1,16 +1,33 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from .models import Medicine, Supplier, Customer, Order, OrderItem, Appointment, Doctor, SupplierRequest, Prescription, PrescriptionItem, DoctorSchedule
+from .pricing import revision_queryset
+from .widgets import AutocompleteSelect
+from .models import Branch, Medicine, Supplier, Customer, Order, OrderItem, Appointment, Doctor, SupplierRequest, Prescription, PrescriptionItem, DoctorSchedule
 
 class MedicineForm(forms.ModelForm):
+    # Stock is kept per branch; the view applies this to the user's current branch
+    quantity = forms.IntegerField(min_value=0, label='Stock at this branch')
+
     class Meta:
         model = Medicine
-        fields = ['name', 'description', 'price', 'quantity', 'expiry_date']
+        fields = ['name', 'description', 'price', 'cost_price', 'quantity', 'expiry_date']
+        labels = {'cost_price': 'Unit cost'}
         widgets = {
             'expiry_date': forms.DateInput(attrs={'type': 'date'}),
         }
 
+class BranchForm(forms.ModelForm):
+    staff = forms.ModelMultipleChoiceField(
+        queryset=User.objects.filter(is_staff=True, is_active=True).order_by('username'),
+        widget=forms.CheckboxSelectMultiple,
+        required=False,
+    )
+
+    class Meta:
+        model = Branch
+        fields = ['name', 'address', 'staff']
+
 class DoctorForm(forms.ModelForm):
     class Meta:
         model = Doctor
@@ -21,6 +38,7 @@ class DoctorScheduleForm(forms.ModelForm):
         model = DoctorSchedule
         fields = ['doctor', 'day_of_week', 'start_time', 'end_time']
         widgets = {
+            'doctor': AutocompleteSelect('doctors'),
             'start_time': forms.TimeInput(attrs={'type': 'time'}),
             'end_time': forms.TimeInput(attrs={'type': 'time'}),
         }
@@ -39,11 +57,17 @@ class OrderForm(forms.ModelForm):
     class Meta:
         model = Order
         fields = ['customer']
+        widgets = {
+            'customer': AutocompleteSelect('customers'),
+        }
 
 class OrderItemForm(forms.ModelForm):
     class Meta:
         model = OrderItem
         fields = ['medicine', 'quantity']
+        widgets = {
+            'medicine': AutocompleteSelect('medicines'),
+        }
 
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField()
@@ -69,6 +93,7 @@ class AppointmentForm(forms.ModelForm):
         model = Appointment
         fields = ['doctor', 'date', 'reason']
         widgets = {
+            'doctor': AutocompleteSelect('doctors'),
             'date': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
         }
 
@@ -76,6 +101,9 @@ class SupplierRequestForm(forms.ModelForm):
     class Meta:
         model = SupplierRequest
         fields = ['supplier', 'medicine', 'quantity']
+        widgets = {
+            'medicine': AutocompleteSelect('medicines'),
+        }
 
 class StaffRegistrationForm(UserCreationForm):
     class Meta:
@@ -93,6 +121,9 @@ class PrescriptionForm(forms.ModelForm):
     class Meta:
         model = Prescription
         fields = ['patient', 'remarks']
+        widgets = {
+            'patient': AutocompleteSelect('patients'),
+        }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -102,3 +133,42 @@ class PrescriptionItemForm(forms.ModelForm):
     class Meta:
         model = PrescriptionItem
         fields = ['medicine', 'dosage', 'frequency', 'duration']
+        widgets = {
+            'medicine': AutocompleteSelect('medicines'),
+        }
+
+class PriceRevisionForm(forms.Form):
+    supplier = forms.ModelChoiceField(queryset=Supplier.objects.all(), required=False, widget=AutocompleteSelect('suppliers'),
+                                      help_text='Only medicines that have been ordered from this supplier.')
+    name = forms.CharField(max_length=100, required=False, label='Name contains')
+    min_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    change_type = forms.ChoiceField(choices=[('percent', 'Percentage'), ('amount', 'Absolute amount')])
+    change = forms.DecimalField(max_digits=10, decimal_places=2, help_text='Negative values lower prices.')
+    reason = forms.CharField(max_length=200, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        min_price, max_price = cleaned_data.get('min_price'), cleaned_data.get('max_price')
+        if min_price is not None and max_price is not None and min_price > max_price:
+            self.add_error('max_price', 'Must not be below the minimum price.')
+        if cleaned_data.get('change_type') == 'percent' and cleaned_data.get('change') is not None and cleaned_data['change'] <= -100:
+            self.add_error('change', 'A price cannot drop by 100% or more.')
+        return cleaned_data
+
+    def medicines(self):
+        data = self.cleaned_data
+        return revision_queryset(data['supplier'] and data['supplier'].pk, data['name'], data['min_price'], data['max_price'])
+
+class OrderFilterForm(forms.Form):
+    status = forms.ChoiceField(choices=[('', 'Any status')] + Order._meta.get_field('status').choices, required=False)
+    start = forms.DateField(required=False, label='From', widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    end = forms.DateField(required=False, label='To', widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    customer = forms.ModelChoiceField(queryset=Customer.objects.all(), required=False, widget=AutocompleteSelect('customers'))
+
+class AppointmentFilterForm(forms.Form):
+    status = forms.ChoiceField(choices=[('', 'Any status')] + Appointment._meta.get_field('status').choices, required=False)
+    start = forms.DateField(required=False, label='From', widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    end = forms.DateField(required=False, label='To', widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    customer = forms.ModelChoiceField(queryset=Customer.objects.all(), required=False, widget=AutocompleteSelect('customers'))
+    doctor = forms.ModelChoiceField(queryset=Doctor.objects.all(), required=False, widget=AutocompleteSelect('doctors'))
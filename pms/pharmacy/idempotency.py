@@ -0,0 +1,93 @@
+from datetime import timedelta
+from functools import wraps
+from uuid import uuid4
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+# How long a key is remembered
+IDEMPOTENCY_TTL = timedelta(hours=24)
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+PURGE_CHUNK_SIZE = 1000
+
+
+def new_key():
+    return uuid4().hex
+
+
+def _replay(record, endpoint):
+    if record.endpoint != endpoint:
+        return HttpResponse('Idempotency key was already used for a different request.', status=422, content_type='text/plain')
+    response = HttpResponse(bytes(record.body), status=record.status_code, content_type=record.content_type or None)
+    if record.location:
+        response['Location'] = record.location
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(request, key, now):
+    """Insert the key for this request, or return the stored record it collides with."""
+    fields = {'endpoint': request.path, 'status_code': 0, 'location': '', 'content_type': '', 'body': b'', 'expires_at': now + IDEMPOTENCY_TTL}
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=request.user, key=key, **fields), None
+    except IntegrityError:
+        pass
+    # An expired key that has not been purged yet is taken over in place
+    if IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__lte=now).update(**fields):
+        return IdempotencyKey.objects.get(user=request.user, key=key), None
+    return None, IdempotencyKey.objects.get(user=request.user, key=key)
+
+
+def idempotent(view):
+    """
+    Make a POST view safe to repeat: a request carrying an Idempotency-Key
+    header or an idempotency_key form field runs once per user and key, and
+    later requests with the same key get the stored response back.
+
+    The key is inserted in the same transaction as the view's own writes, so
+    a concurrent duplicate waits on the unique constraint until the first
+    request commits, and then replays its response.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'POST' or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        key = request.headers.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 100:
+            return HttpResponse('Idempotency key is too long.', status=400, content_type='text/plain')
+
+        with transaction.atomic():
+            record, existing = _claim(request, key, timezone.now())
+            if existing is not None:
+                return _replay(existing, request.path)
+            response = view(request, *args, **kwargs)
+            if response.streaming or response.status_code >= 500:
+                # Not replayable; let the client try again with the same key
+                record.delete()
+                return response
+            record.status_code = response.status_code
+            record.location = response.get('Location', '')
+            record.content_type = response.get('Content-Type', '')
+            record.body = response.content
+            record.save(update_fields=['status_code', 'location', 'content_type', 'body'])
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys(chunk_size=PURGE_CHUNK_SIZE):
+    """Delete expired keys a chunk per statement, returning how many were removed."""
+    purged = 0
+    while True:
+        pks = list(IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
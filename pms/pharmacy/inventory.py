@@ -0,0 +1,218 @@
+import csv
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.utils import timezone
+
+from .branches import stock_databases
+from .models import BranchStock, Medicine, Supplier, SupplierRequest
+
+# Stock moves with every sale, so it is left out of the cache key and a
+# valuation trails it by at most this many seconds
+VALUATION_TIMEOUT = 60
+CATALOG_VERSION_KEY = 'pharmacy:inventory-catalog-version'
+# Medicines read per query when streaming a bucket or folding in a branch database
+DRILL_DOWN_CHUNK_SIZE = 2000
+
+BUCKETS = [
+    ('expired', 'Expired'),
+    ('30', 'Expires within 30 days'),
+    ('90', 'Expires within 90 days'),
+    ('later', 'Expires after 90 days'),
+    ('none', 'No expiry date'),
+]
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+TOTALS = ('skus', 'units', 'at_price', 'at_cost', 'uncosted')
+CENTS = Decimal('0.01')
+
+
+def _catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def invalidate_valuation():
+    """Drop cached valuations after a price, cost, expiry date or supplier changed."""
+    cache.delete(CATALOG_VERSION_KEY)
+
+
+def bucket_filters(today, field='expiry_date'):
+    """{bucket: Q over the expiry date}, as ranges an index on the date can serve."""
+    return {
+        'expired': Q(**{f'{field}__lt': today}),
+        '30': Q(**{f'{field}__gte': today, f'{field}__lt': today + timedelta(days=30)}),
+        '90': Q(**{f'{field}__gte': today + timedelta(days=30), f'{field}__lt': today + timedelta(days=90)}),
+        'later': Q(**{f'{field}__gte': today + timedelta(days=90)}),
+        'none': Q(**{f'{field}__isnull': True}),
+    }
+
+
+def _classified(rows, today, medicine=''):
+    """
+    Annotate rows with the expiry bucket and supplier of a medicine, rows'
+    own or the one reached through the `medicine` relation. The supplier is
+    the one the medicine was last requested from, None if never.
+    """
+    latest_supplier = SupplierRequest.objects.filter(medicine=OuterRef(f'{medicine}pk'))\
+        .order_by('-created_at', '-pk').values('supplier_id')[:1]
+    filters = bucket_filters(today, f'{medicine}expiry_date')
+    bucket = Case(*[When(q, then=Value(name)) for name, q in filters.items()], output_field=CharField())
+    return rows.annotate(bucket=bucket, supplier=Subquery(latest_supplier, output_field=IntegerField()))
+
+
+def _empty():
+    return {'skus': 0, 'units': 0, 'at_price': Decimal(0), 'at_cost': Decimal(0), 'uncosted': 0}
+
+
+def _add(totals, row):
+    for name in TOTALS:
+        totals[name] += row[name] or 0
+
+
+def _default_stock(today):
+    """
+    Totals per (bucket, supplier) of the stock kept in the shared database:
+    one grouped query over its stock rows joined to the catalog.
+    """
+    rows = BranchStock.objects.using('default').filter(quantity__gt=0, medicine__deleted_at__isnull=True)
+    return _classified(rows, today, 'medicine__').values('bucket', 'supplier').order_by().annotate(
+        skus=Count('medicine', distinct=True),
+        units=Sum('quantity'),
+        at_price=Sum(F('quantity') * F('medicine__price'), output_field=MONEY),
+        at_cost=Sum(F('quantity') * F('medicine__cost_price'), output_field=MONEY),
+        uncosted=Count('medicine', distinct=True, filter=Q(medicine__cost_price__isnull=True)),
+    )
+
+
+def _branch_stock(alias, today):
+    """
+    Totals per (bucket, supplier) of a branch database. Its stock cannot be
+    joined to the catalog, so it is summed per medicine there and folded in
+    against the catalog a chunk of medicines at a time.
+    """
+    groups = defaultdict(_empty)
+    levels = BranchStock.objects.using(alias).values('medicine_id').order_by('medicine_id')\
+        .annotate(units=Sum('quantity')).filter(units__gt=0).values_list('medicine_id', 'units')
+    chunk = []
+    for row in levels.iterator(chunk_size=DRILL_DOWN_CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == DRILL_DOWN_CHUNK_SIZE:
+            _fold(groups, dict(chunk), today)
+            chunk = []
+    if chunk:
+        _fold(groups, dict(chunk), today)
+    return [{'bucket': bucket, 'supplier': supplier, **totals} for (bucket, supplier), totals in groups.items()]
+
+
+def _fold(groups, units, today):
+    medicines = _classified(Medicine.objects.filter(pk__in=list(units)), today)
+    for pk, bucket, supplier, price, cost in medicines.values_list('pk', 'bucket', 'supplier', 'price', 'cost_price'):
+        totals = groups[bucket, supplier]
+        totals['skus'] += 1
+        totals['units'] += units[pk]
+        totals['at_price'] += units[pk] * price
+        if cost is None:
+            totals['uncosted'] += 1
+        else:
+            totals['at_cost'] += units[pk] * cost
+
+
+def _all_totals(report):
+    yield report['total']
+    yield from report['buckets'].values()
+    for supplier in report['suppliers'].values():
+        yield from supplier.values()
+
+
+def valuation(today=None):
+    """
+    Stock value at price and at cost over every branch, by expiry bucket and
+    by supplier: {'buckets': {bucket: totals}, 'suppliers': {supplier_id:
+    {bucket: totals, 'total': totals}}, 'total': totals}. A medicine's
+    supplier is the one it was last requested from, None if never. A
+    medicine stocked at several branches counts once per stock database.
+
+    Cached until a price, a cost, an expiry date or a supplier changes, or
+    the day ends, when medicines move between buckets; stock levels are
+    picked up after at most VALUATION_TIMEOUT.
+    """
+    today = today or timezone.localdate()
+    key = f'pharmacy:inventory:{_catalog_version()}:{today.isoformat()}'
+    report = cache.get(key)
+    if report is not None:
+        return report
+
+    rows = list(_default_stock(today))
+    for alias in sorted(stock_databases() - {'default'}):
+        rows += _branch_stock(alias, today)
+    report = {'buckets': {name: _empty() for name, _ in BUCKETS}, 'suppliers': {}, 'total': _empty()}
+    for row in rows:
+        supplier = report['suppliers'].setdefault(row['supplier'], {'total': _empty()})
+        for totals in (report['buckets'][row['bucket']], supplier.setdefault(row['bucket'], _empty()), supplier['total'], report['total']):
+            _add(totals, row)
+    for totals in _all_totals(report):
+        for name in ('at_price', 'at_cost'):
+            # SQLite sums decimals in floating point
+            totals[name] = Decimal(totals[name]).quantize(CENTS)
+    cache.set(key, report, VALUATION_TIMEOUT)
+    return report
+
+
+def bucket_rows(bucket, supplier_id=None, today=None):
+    """
+    Stocked medicines of one bucket, optionally of one supplier ('none' for
+    medicines never requested), as (medicine, units) in id order, each
+    medicine with its supplier id and supplier_name. Medicines
+    are read DRILL_DOWN_CHUNK_SIZE at a time by id and their stock summed
+    over every stock database, so memory stays flat however large the bucket.
+    """
+    today = today or timezone.localdate()
+    supplier_name = Supplier.all_objects.filter(pk=OuterRef('supplier')).values('name')[:1]
+    medicines = _classified(Medicine.objects.filter(bucket_filters(today)[bucket]), today)\
+        .annotate(supplier_name=Subquery(supplier_name)).order_by('pk')
+    if supplier_id == 'none':
+        medicines = medicines.filter(supplier__isnull=True)
+    elif supplier_id is not None:
+        medicines = medicines.filter(supplier=supplier_id)
+    last_pk = 0
+    while True:
+        chunk = list(medicines.filter(pk__gt=last_pk)[:DRILL_DOWN_CHUNK_SIZE])
+        if not chunk:
+            return
+        units = defaultdict(int)
+        for alias in stock_databases():
+            levels = BranchStock.objects.using(alias).filter(medicine_id__in=[m.pk for m in chunk])\
+                .values('medicine_id').order_by().annotate(units=Sum('quantity')).values_list('medicine_id', 'units')
+            for pk, quantity in levels:
+                units[pk] += quantity
+        for medicine in chunk:
+            if units[medicine.pk] > 0:
+                yield medicine, units[medicine.pk]
+        last_pk = chunk[-1].pk
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes, so rows can be streamed."""
+
+    def write(self, value):
+        return value
+
+
+def bucket_csv(bucket, supplier_id=None):
+    """CSV lines of bucket_rows(), for a streaming response."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['id', 'name', 'supplier', 'expiry_date', 'units', 'price', 'cost_price', 'value_at_price', 'value_at_cost'])
+    for medicine, units in bucket_rows(bucket, supplier_id):
+        cost = medicine.cost_price
+        yield writer.writerow([
+            medicine.pk, medicine.name, medicine.supplier_name or '', medicine.expiry_date or '', units,
+            medicine.price, '' if cost is None else cost, units * medicine.price, '' if cost is None else units * cost,
+        ])
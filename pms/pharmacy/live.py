@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Appointment, Customer, Medicine, Order, Prescription, Supplier, SupplierRequest
+
+# Bursts of changes within this many seconds are folded into one recount
+COALESCE_SECONDS = 1
+# Recount at least this often while anyone is listening, to pick up changes made by other workers
+REFRESH_SECONDS = 30
+# Latest counters, shared by every worker and served to clients that cannot hold a stream open
+SNAPSHOT_KEY = 'pharmacy:dashboard-counters'
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def dashboard_counters(branch_ids):
+    """Every number shown on the staff dashboard, orders and requests only from branch_ids, in as few queries as possible."""
+    branch_orders = Order.objects.filter(branch_id__in=branch_ids)
+    today = timezone.localdate()
+    seven_days_ago = today - timedelta(days=6)
+    today_start = _day_start(today)
+
+    orders = branch_orders.aggregate(
+        order_count=Count('id'),
+        pending_orders_count=Count('id', filter=Q(status='Pending')),
+        todays_orders_count=Count('id', filter=Q(order_date__gte=today_start)),
+        todays_revenue=Sum('total_amount', filter=Q(order_date__gte=today_start)),
+    )
+    sales = branch_orders.filter(order_date__gte=_day_start(seven_days_ago))\
+        .annotate(date=TruncDate('order_date'))\
+        .values('date')\
+        .annotate(revenue=Sum('total_amount'))
+    sales_dict = {item['date']: item['revenue'] for item in sales}
+
+    return {
+        'medicine_count': Medicine.objects.count(),
+        'supplier_count': Supplier.objects.count(),
+        'customer_count': Customer.objects.count(),
+        'order_count': orders['order_count'],
+        'pending_orders_count': orders['pending_orders_count'],
+        'pending_requests_count': SupplierRequest.objects.filter(branch_id__in=branch_ids, status='Pending').count(),
+        'pending_prescriptions_count': Prescription.objects.filter(status='Pending').count(),
+        'pending_appointments_count': Appointment.objects.filter(status='Pending').count(),
+        'todays_revenue': float(orders['todays_revenue'] or 0),
+        'todays_orders_count': orders['todays_orders_count'],
+        'chart_labels': [(seven_days_ago + timedelta(days=i)).strftime('%b %d') for i in range(7)],
+        'chart_data': [float(sales_dict.get(seven_days_ago + timedelta(days=i), 0)) for i in range(7)],
+    }
+
+
+def snapshot_key(branch_ids):
+    return f'{SNAPSHOT_KEY}:{",".join(map(str, sorted(branch_ids)))}'
+
+
+def shared_counters(branch_ids):
+    """dashboard_counters() from the shared snapshot, recounted at most once per REFRESH_SECONDS however many clients ask."""
+    key = snapshot_key(branch_ids)
+    counters = cache.get(key)
+    if counters is None:
+        counters = dashboard_counters(branch_ids)
+        cache.set(key, counters, REFRESH_SECONDS)
+    return counters
+
+
+class Subscription:
+    """Counters for one set of branches changed since the stream last sent an update."""
+
+    def __init__(self, branch_ids):
+        self.branch_ids = tuple(sorted(branch_ids))
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, delta):
+        # Counters are absolute values, so a client that falls behind only ever has one update waiting
+        self.pending.update(delta)
+        self.ready.set()
+
+    async def next(self):
+        await self.ready.wait()
+        self.ready.clear()
+        delta, self.pending = self.pending, {}
+        return delta
+
+
+class DashboardPublisher:
+    """
+    Fans dashboard counter changes out to every open stream in this worker.
+
+    Model signals call notify() from any thread; the publisher recounts once
+    per burst of changes for each set of branches being watched and sends
+    each subscriber only the counters that moved, so the database load does
+    not grow with the number of viewers.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._changed = None
+        self._task = None
+        self._subscribers = set()
+        self._counters = {}
+
+    def notify(self):
+        loop = self._loop
+        if loop is not None and self._subscribers:
+            loop.call_soon_threadsafe(self._changed.set)
+
+    async def subscribe(self, branch_ids):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._changed = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        subscription = Subscription(branch_ids)
+        self._subscribers.add(subscription)
+        # Counters may be stale after a quiet spell, so recount for the newcomer too
+        self._changed.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=REFRESH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            if not self._subscribers:
+                continue
+            subscribers = list(self._subscribers)
+            previous, self._counters = self._counters, {}
+            for branch_ids in {subscription.branch_ids for subscription in subscribers}:
+                counters = await sync_to_async(dashboard_counters)(branch_ids)
+                await sync_to_async(cache.set)(snapshot_key(branch_ids), counters, REFRESH_SECONDS)
+                before = previous.get(branch_ids, {})
+                delta = {key: value for key, value in counters.items() if before.get(key) != value}
+                self._counters[branch_ids] = counters
+                if delta:
+                    for subscription in subscribers:
+                        if subscription.branch_ids == branch_ids:
+                            subscription.push(delta)
+            await asyncio.sleep(COALESCE_SECONDS)
+
+
+dashboard_publisher = DashboardPublisher()
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pharmacy.archive import ARCHIVE_CHUNK_SIZE, archive_closed_records
+
+
+class Command(BaseCommand):
+    help = 'Move closed orders, appointments, prescriptions and supplier requests older than a cutoff into the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help='Archive closed records older than this many days (default: ARCHIVE_AFTER_DAYS).')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE,
+                            help='Rows moved per transaction.')
+
+    def progress(self, model, moved):
+        self.stdout.write(f'{model.__name__}: {moved} archived')
+
+    def handle(self, *args, **options):
+        progress = self.progress if options['verbosity'] >= 2 else None
+        moved = archive_closed_records(options['days'], options['chunk_size'], progress)
+        for name, count in moved.items():
+            self.stdout.write(self.style.SUCCESS(f'{count} {name.replace("_", " ")} archived'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from pharmacy.recommendations import AFFINITY_CHUNK_SIZE, AFFINITY_TOP_K, build_affinities
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "customers also bought" table from order history. Run it periodically, e.g. nightly from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=AFFINITY_TOP_K,
+                            help='Related medicines kept per medicine.')
+        parser.add_argument('--chunk-size', type=int, default=AFFINITY_CHUNK_SIZE,
+                            help='Order lines fetched per round trip.')
+
+    def handle(self, *args, **options):
+        written = build_affinities(options['top_k'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{written} affinities written'))
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy.consistency import CHECK_CHUNK_SIZE, CHECKS, plan_chunks, run_chunk
+
+
+class Command(BaseCommand):
+    help = ('Check order line totals, order totals, branch stock rows and statuses for drift, in primary key '
+            'chunks spread over worker processes. --repair fixes what can be fixed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('checks', nargs='*', metavar='check',
+                            help=f"Checks to run, all by default: {', '.join(CHECKS)}.")
+        parser.add_argument('--repair', action='store_true', help='Fix line totals, order totals and orphaned stock rows.')
+        parser.add_argument('--chunk-size', type=int, default=CHECK_CHUNK_SIZE, help='Primary keys per chunk.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes; 1 runs every chunk in this process.')
+
+    def handle(self, *args, **options):
+        names = options['checks'] or list(CHECKS)
+        unknown = [name for name in names if name not in CHECKS]
+        if unknown:
+            raise CommandError(f"Unknown check {unknown[0]!r}; choose from {', '.join(CHECKS)}.")
+        totals = {name: {'found': 0, 'repaired': 0} for name in names}
+        verbose = options['verbosity'] > 1
+
+        pool = None
+        if options['workers'] > 1:
+            # Spawned rather than forked, so no worker inherits this process's
+            # database connections; each one sets Django up before its first chunk
+            pool = ProcessPoolExecutor(
+                max_workers=options['workers'], mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            )
+        try:
+            # One check at a time: order totals are only right once line totals are
+            for name in names:
+                chunks = plan_chunks([name], options['chunk_size'])
+                if pool is not None and len(chunks) > 1:
+                    futures = [pool.submit(run_chunk, *chunk, options['repair']) for chunk in chunks]
+                    results = (future.result() for future in as_completed(futures))
+                else:
+                    results = (run_chunk(*chunk, options['repair']) for chunk in chunks)
+                self._report(results, name, len(chunks), totals, verbose)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        unresolved = 0
+        for name, total in totals.items():
+            line = f"{name}: {total['found']} found"
+            if options['repair']:
+                line += f", {total['repaired']} repaired"
+            self.stdout.write(line, self.style.WARNING if total['found'] else self.style.SUCCESS)
+            unresolved += total['found'] - total['repaired']
+        if unresolved:
+            raise CommandError(f'{unresolved} inconsistencies left')
+
+    def _report(self, results, name, count, totals, verbose):
+        step = max(1, count // 10)
+        for done, (_, alias, lo, hi, result) in enumerate(results, 1):
+            totals[name]['found'] += result['found']
+            totals[name]['repaired'] += result['repaired']
+            if verbose and result['found']:
+                examples = ', '.join(str(example) for example in result['examples'])
+                self.stdout.write(f"{name} {alias} [{lo}, {hi}): {result['found']} found, e.g. {examples}")
+            if done % step == 0 or done == count:
+                self.stdout.write(f'{name}: {done}/{count} chunks checked')
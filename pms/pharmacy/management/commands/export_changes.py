@@ -0,0 +1,49 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from pharmacy.changefeed import FEED_PAGE_SIZE, FEEDS, changes, prune_tombstones
+from pharmacy.sync import SyncError
+
+
+class Command(BaseCommand):
+    help = ('Write the rows of a change feed changed since a cursor as JSON lines, then the cursor to resume from. '
+            'With --cursor-file the cursor is read from and saved to that file after every page.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('feed', nargs='?', help=f'One of: {", ".join(FEEDS)}.')
+        parser.add_argument('--cursor', help='Cursor returned by the previous export; omit to start from the beginning.')
+        parser.add_argument('--cursor-file', help='File keeping the cursor between runs.')
+        parser.add_argument('--branch', type=int, help='Branch whose rows the stock feed exports.')
+        parser.add_argument('--limit', type=int, default=FEED_PAGE_SIZE, help='Rows and deletions per page.')
+        parser.add_argument('--all', action='store_true', help='Keep exporting pages until the feed is caught up.')
+        parser.add_argument('--prune', action='store_true', help='Only delete tombstones past their retention.')
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            self.stdout.write(f'{prune_tombstones()} tombstones pruned')
+            return
+        feed = options['feed']
+        if feed not in FEEDS:
+            raise CommandError(f'Unknown feed {feed!r}. Feeds: {", ".join(FEEDS)}.')
+        cursor_file = Path(options['cursor_file']) if options['cursor_file'] else None
+        cursor = options['cursor']
+        if cursor is None and cursor_file and cursor_file.exists():
+            cursor = cursor_file.read_text().strip() or None
+
+        while True:
+            try:
+                rows, deleted, cursor, has_more = changes(feed, cursor, options['limit'], options['branch'])
+            except SyncError as exc:
+                raise CommandError(str(exc))
+            for row in rows:
+                self.stdout.write(json.dumps({'op': 'upsert', 'row': row}, cls=DjangoJSONEncoder))
+            for key in deleted:
+                self.stdout.write(json.dumps({'op': 'delete', 'key': key}))
+            if cursor_file:
+                cursor_file.write_text(cursor)
+            if not (options['all'] and has_more):
+                break
+        self.stdout.write(json.dumps({'cursor': cursor, 'has_more': has_more}))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pharmacy.purge import PURGE_CHUNK_SIZE, pending_deletions, purge_deleted
+
+
+class Command(BaseCommand):
+    help = ('Remove deleted medicines, suppliers, customers, doctors and staff accounts with their '
+            'orders, appointments and prescriptions, in small transactions. Run a single instance.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE, help='Rows deleted per transaction.')
+        parser.add_argument('--limit', type=int, help='Stop after purging this many deleted rows.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new deletions instead of exiting.')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds to wait between polls with --loop.')
+
+    def handle(self, *args, **options):
+        progress = self.stdout.write if options['verbosity'] > 1 else None
+        while True:
+            pending = {name: count for name, count in pending_deletions().items() if count}
+            if pending:
+                self.stdout.write('Pending: ' + ', '.join(f'{count} {name}' for name, count in pending.items()))
+                purged = purge_deleted(options['chunk_size'], progress, options['limit'])
+                self.stdout.write(self.style.SUCCESS(f'{purged} deleted rows purged'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
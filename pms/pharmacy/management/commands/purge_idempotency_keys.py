@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from pharmacy.idempotency import PURGE_CHUNK_SIZE, purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys past their expiry. Run it periodically, e.g. hourly from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE,
+                            help='Keys deleted per statement.')
+
+    def handle(self, *args, **options):
+        purged = purge_expired_keys(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{purged} expired idempotency keys deleted'))
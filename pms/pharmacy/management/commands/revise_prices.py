@@ -0,0 +1,30 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy.pricing import revise_prices, revision_queryset
+
+
+class Command(BaseCommand):
+    help = 'Raise or lower medicine prices in bulk, recording each change in the price history.'
+
+    def add_arguments(self, parser):
+        change = parser.add_mutually_exclusive_group(required=True)
+        change.add_argument('--percent', type=Decimal, help='Change by this percentage, e.g. 5 or -2.5.')
+        change.add_argument('--amount', type=Decimal, help='Change by this absolute amount, e.g. 0.50 or -1.')
+        parser.add_argument('--supplier', type=int, help='Only medicines that have been ordered from this supplier id.')
+        parser.add_argument('--name', help='Only medicines whose name contains this text.')
+        parser.add_argument('--min-price', type=Decimal)
+        parser.add_argument('--max-price', type=Decimal)
+        parser.add_argument('--reason', default='', help='Stored with every price history row.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many medicines match.')
+
+    def handle(self, *args, **options):
+        if options['percent'] is not None and options['percent'] <= -100:
+            raise CommandError('A price cannot drop by 100% or more.')
+        medicines = revision_queryset(options['supplier'], options['name'], options['min_price'], options['max_price'])
+        if options['dry_run']:
+            self.stdout.write(f'{medicines.count()} medicines match')
+            return
+        changed = revise_prices(medicines, options['percent'], options['amount'], reason=options['reason'])
+        self.stdout.write(self.style.SUCCESS(f'{changed} prices revised'))
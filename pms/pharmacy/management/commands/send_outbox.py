@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pharmacy.outbox import MAX_ATTEMPTS, OUTBOX_BATCH_SIZE, dispatch_batch
+
+
+class Command(BaseCommand):
+    help = 'Send queued notification emails in batches, retrying failures with backoff. Run a single instance.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help='Give up on a message after this many failed attempts.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting once the outbox is drained.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait between polls with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = dispatch_batch(options['batch_size'], options['max_attempts'])
+            if sent or failed:
+                self.stdout.write(f'{sent} sent, {failed} failed')
+            if sent + failed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
@@ -0,0 +1,178 @@
+import mimetypes
+import os
+from urllib.parse import urlparse
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .models import Branch, Customer, Doctor
+
+ROLE_SESSION_KEY = '_pharmacy_role'
+BRANCH_SESSION_KEY = '_pharmacy_branch'
+
+# Content-hashed names never change content, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+UNHASHED_CACHE_CONTROL = 'public, max-age=60'
+# Preferred first
+STATIC_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+BRANCHES_VERSION_KEY = 'pharmacy:branches-version'
+
+
+def role_version_key(user_id):
+    return f'pharmacy:role-version:{user_id}'
+
+
+def _version(key):
+    # A random token rather than a counter, so a cleared cache never matches an old session
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key)
+    return version
+
+
+def role_version(user_id):
+    return _version(role_version_key(user_id))
+
+
+def invalidate_role(user_id):
+    cache.delete(role_version_key(user_id))
+
+
+def invalidate_branches():
+    """Make every session re-read the branches its user may work at."""
+    cache.delete(BRANCHES_VERSION_KEY)
+
+
+def _allowed_branches(user):
+    # Staff work at the branches they are assigned to; customers and doctors may use any branch
+    branches = Branch.objects.order_by('name')
+    if user.is_staff and not user.is_superuser:
+        branches = branches.filter(staff=user)
+    return [[pk, name] for pk, name in branches.values_list('pk', 'name')]
+
+
+class RoleMiddleware:
+    """
+    Resolve whether the user has a doctor and/or customer profile, and which
+    branches they may work at, once and keep the answer in the session, so
+    views can check request.doctor_id, request.customer_id and
+    request.branch_id without querying. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.doctor_id = None
+        request.customer_id = None
+        request.branch_id = None
+        request.branches = []
+        user = request.user
+        if user.is_authenticated:
+            version = f'{role_version(user.pk)}:{_version(BRANCHES_VERSION_KEY)}'
+            role = request.session.get(ROLE_SESSION_KEY)
+            if not role or role.get('user') != user.pk or role.get('version') != version:
+                role = {
+                    'user': user.pk,
+                    'version': version,
+                    'doctor': Doctor.objects.filter(user=user).values_list('pk', flat=True).first(),
+                    'customer': Customer.objects.filter(user=user).values_list('pk', flat=True).first(),
+                    'branches': _allowed_branches(user),
+                }
+                request.session[ROLE_SESSION_KEY] = role
+            request.doctor_id = role['doctor']
+            request.customer_id = role['customer']
+            request.branches = role['branches']
+
+            # The branch chosen with switch_branch, or the first one the user may work at
+            allowed = [pk for pk, _ in role['branches']]
+            branch_id = request.session.get(BRANCH_SESSION_KEY)
+            if branch_id not in allowed:
+                branch_id = allowed[0] if allowed else None
+                request.session[BRANCH_SESSION_KEY] = branch_id
+            request.branch_id = branch_id
+        return self.get_response(request)
+
+
+def ensure_customer_id(request):
+    """Return the user's customer id, creating a customer profile on first use."""
+    if request.customer_id is None:
+        customer, created = Customer.objects.get_or_create(
+            user=request.user,
+            defaults={'name': request.user.username, 'email': request.user.email, 'phone': ''}
+        )
+        request.customer_id = customer.pk
+        role = request.session.get(ROLE_SESSION_KEY)
+        if role and role.get('user') == request.user.pk:
+            request.session[ROLE_SESSION_KEY] = {**role, 'customer': customer.pk}
+    return request.customer_id
+
+
+class StaticFilesMiddleware:
+    """
+    Serve collected files from STATIC_ROOT before sessions and auth run,
+    choosing the precompressed variant written by collectstatic that the
+    client accepts. Hashed names from the manifest get immutable caching.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = urlparse(settings.STATIC_URL).path
+        self.root = settings.STATIC_ROOT
+        self._hashed_names = None
+
+    def __call__(self, request):
+        if self.root and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def is_hashed(self, name):
+        if self._hashed_names is None:
+            self._hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return name in self._hashed_names
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        accepted = set()
+        for token in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            coding, _, params = token.strip().partition(';')
+            if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                accepted.add(coding.strip())
+        encoding, chosen = None, path
+        for coding, suffix in STATIC_ENCODINGS:
+            if coding in accepted and os.path.isfile(path + suffix):
+                encoding, chosen = coding, path + suffix
+                break
+
+        mtime = os.stat(chosen).st_mtime
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type, _ = mimetypes.guess_type(path)
+            response = FileResponse(open(chosen, 'rb'), content_type=content_type or 'application/octet-stream', filename=os.path.basename(path))
+            response.headers['Last-Modified'] = http_date(mtime)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        patch_vary_headers(response, ['Accept-Encoding'])
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if self.is_hashed(name) else UNHASHED_CACHE_CONTROL
+        return response
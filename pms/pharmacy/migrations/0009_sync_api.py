@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0008_appointment_status_doctorschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['updated_at', 'id'], name='medicine_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0009_sync_api'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('customer_id', models.BigIntegerField(db_index=True)),
+                ('customer_name', models.CharField(max_length=100)),
+                ('doctor_id', models.BigIntegerField(db_index=True)),
+                ('doctor_name', models.CharField(max_length=100)),
+                ('date', models.DateTimeField(db_index=True)),
+                ('reason', models.TextField()),
+                ('status', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('customer_id', models.BigIntegerField(db_index=True)),
+                ('customer_name', models.CharField(max_length=100)),
+                ('order_date', models.DateTimeField(db_index=True)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(max_length=20)),
+                ('client_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('order_id', models.BigIntegerField(db_index=True)),
+                ('medicine_id', models.BigIntegerField()),
+                ('medicine_name', models.CharField(max_length=100)),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPrescription',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('doctor_id', models.BigIntegerField(db_index=True)),
+                ('patient_id', models.BigIntegerField(db_index=True)),
+                ('date_created', models.DateTimeField(db_index=True)),
+                ('status', models.CharField(max_length=20)),
+                ('remarks', models.TextField(blank=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPrescriptionItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('prescription_id', models.BigIntegerField(db_index=True)),
+                ('medicine_id', models.BigIntegerField()),
+                ('medicine_name', models.CharField(max_length=100)),
+                ('dosage', models.CharField(max_length=100)),
+                ('frequency', models.CharField(max_length=100)),
+                ('duration', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedSupplierRequest',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('supplier_id', models.BigIntegerField(db_index=True)),
+                ('supplier_name', models.CharField(max_length=100)),
+                ('medicine_id', models.BigIntegerField(db_index=True)),
+                ('medicine_name', models.CharField(max_length=100)),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
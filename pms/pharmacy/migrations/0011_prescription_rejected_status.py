@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0010_archive_tables'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='prescription',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rejected', 'Rejected'), ('Dispensed', 'Dispensed')], default='Pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0012_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'date'], name='appointment_doctor_date_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_stock_to_main_branch(apps, schema_editor):
+    # Existing stock, orders, deliveries and staff all belong to one branch;
+    # branch databases only hold stock rows and start empty
+    db = schema_editor.connection.alias
+    if db != 'default':
+        return
+    Branch = apps.get_model('pharmacy', 'Branch')
+    BranchStock = apps.get_model('pharmacy', 'BranchStock')
+    Medicine = apps.get_model('pharmacy', 'Medicine')
+    Order = apps.get_model('pharmacy', 'Order')
+    SupplierRequest = apps.get_model('pharmacy', 'SupplierRequest')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+
+    main = Branch.objects.using(db).create(name='Main')
+    main.staff.set(User.objects.using(db).filter(is_staff=True))
+    stock = Medicine.objects.using(db).values_list('pk', 'quantity').iterator(chunk_size=2000)
+    rows = [BranchStock(branch_id=main.pk, medicine_id=pk, quantity=quantity) for pk, quantity in stock]
+    BranchStock.objects.using(db).bulk_create(rows, batch_size=500)
+    Order.objects.using(db).update(branch=main)
+    SupplierRequest.objects.using(db).update(branch=main)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0013_appointment_doctor_date_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='branch_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('address', models.TextField(blank=True)),
+                ('staff', models.ManyToManyField(blank=True, related_name='branches', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='pharmacy.branch'),
+        ),
+        migrations.AddField(
+            model_name='supplierrequest',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='pharmacy.branch'),
+        ),
+        migrations.CreateModel(
+            name='BranchStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pharmacy.branch')),
+                ('medicine', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pharmacy.medicine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['branch', 'updated_at', 'id'], name='branch_stock_updated_idx')],
+                'constraints': [models.UniqueConstraint(fields=('branch', 'medicine'), name='branch_stock_unique')],
+            },
+        ),
+        migrations.RunPython(move_stock_to_main_branch, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='medicine',
+            name='quantity',
+        ),
+    ]
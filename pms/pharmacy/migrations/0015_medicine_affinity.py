@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0014_branches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicineAffinity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('orders', models.PositiveIntegerField()),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pharmacy.medicine')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pharmacy.medicine')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('medicine', 'rank'), name='medicine_affinity_rank_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations, models, transaction
+from django.db.models import F, Max, OuterRef, Subquery
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+def snapshot_prices(apps, schema_editor):
+    # Existing lines take the current price, the best record there is. Each
+    # range of ids is its own short transaction, so the table is never
+    # locked for the whole backfill and an interrupted run can resume
+    db = schema_editor.connection.alias
+    if db != 'default':
+        return
+    Medicine = apps.get_model('pharmacy', 'Medicine')
+    OrderItem = apps.get_model('pharmacy', 'OrderItem')
+    price = Subquery(Medicine.objects.using(db).filter(pk=OuterRef('medicine_id')).values('price')[:1])
+    last_id = OrderItem.objects.using(db).aggregate(last=Max('pk'))['last'] or 0
+    for start in range(0, last_id + 1, BACKFILL_CHUNK_SIZE):
+        with transaction.atomic(using=db):
+            OrderItem.objects.using(db)\
+                .filter(pk__gte=start, pk__lt=start + BACKFILL_CHUNK_SIZE, unit_price__isnull=True)\
+                .update(unit_price=price, line_total=price * F('quantity'))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('pharmacy', '0018_price_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.RunPython(snapshot_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0022_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='cost_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='medicine',
+            name='expiry_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:38
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0024_live_name_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customer',
+            name='customer_live_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctor',
+            name='doctor_live_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='medicine',
+            name='medicine_live_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='supplier',
+            name='supplier_live_name_idx',
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(models.F('deleted_at'), django.db.models.functions.text.Lower('name'), name='customer_live_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(models.F('deleted_at'), django.db.models.functions.text.Lower('name'), name='doctor_live_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(models.F('deleted_at'), django.db.models.functions.text.Lower('name'), name='medicine_live_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(models.F('deleted_at'), django.db.models.functions.text.Lower('name'), name='supplier_live_lower_name_idx'),
+        ),
+    ]
@@ -1,13 +1,33 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
+from django.utils import timezone
 from datetime import date, timedelta
 
+class LiveManager(models.Manager):
+    # Hides rows marked deleted; they are removed in the background by purge_deleted
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class Medicine(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    quantity = models.PositiveIntegerField()
-    expiry_date = models.DateField(null=True, blank=True)
+    # Unit cost from the supplier; stock without one has no value at cost in the inventory report
+    cost_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    expiry_date = models.DateField(null=True, blank=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Live rows by lowercased name, for case-insensitive prefix searches; also serves purge_deleted's lookups of deleted rows
+            models.Index(models.F('deleted_at'), Lower('name'), name='medicine_live_lower_name_idx'),
+            models.Index(fields=['updated_at', 'id'], name='medicine_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -24,29 +44,115 @@ class Medicine(models.Model):
         else:
             return "Good Condition"
 
+# One price change of a medicine, from an edit or a bulk revision
+class PriceHistory(models.Model):
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='price_history')
+    old_price = models.DecimalField(max_digits=10, decimal_places=2)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2)
+    changed_at = models.DateTimeField(default=timezone.now)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    reason = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['medicine', 'changed_at'], name='price_history_medicine_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine_id}: {self.old_price} -> {self.new_price}"
+
+class Branch(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    address = models.TextField(blank=True)
+    staff = models.ManyToManyField(User, related_name='branches', blank=True)
+
+    def __str__(self):
+        return self.name
+
+class BranchStock(models.Model):
+    # Stored in the branch's own database when one is configured, so the
+    # references to the shared catalog cannot be database constraints
+    branch = models.ForeignKey(Branch, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    medicine = models.ForeignKey(Medicine, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    quantity = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'medicine'], name='branch_stock_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['branch', 'updated_at', 'id'], name='branch_stock_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of medicine {self.medicine_id} at branch {self.branch_id}"
+
 class Supplier(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     contact_person = models.CharField(max_length=100)
     email = models.EmailField()
     phone = models.CharField(max_length=20)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Live rows by lowercased name, for case-insensitive prefix searches; also serves purge_deleted's lookups of deleted rows
+            models.Index(models.F('deleted_at'), Lower('name'), name='supplier_live_lower_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 class Customer(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     email = models.EmailField()
     phone = models.CharField(max_length=20)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Live rows by lowercased name, for case-insensitive prefix searches; also serves purge_deleted's lookups of deleted rows
+            models.Index(models.F('deleted_at'), Lower('name'), name='customer_live_lower_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+# Staff account deleted from the staff page; the account is deactivated
+# at once and removed with its prescriptions by purge_deleted
+class UserDeletion(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='deletion')
+    requested_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Deletion of user {self.user_id}"
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
-    order_date = models.DateTimeField(auto_now_add=True)
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
+    order_date = models.DateTimeField(default=timezone.now)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=20, default='Pending', choices=[('Pending', 'Pending'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled')])
+    # ID generated by an offline point-of-sale terminal, used to make re-syncs idempotent
+    client_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Filtered lists: date ranges per branch or customer, status counted from the index alone
+        indexes = [
+            models.Index(fields=['branch', 'order_date', 'status'], name='order_branch_date_idx'),
+            models.Index(fields=['customer', 'order_date', 'status'], name='order_customer_date_idx'),
+            models.Index(fields=['order_date'], name='order_date_idx'),
+            models.Index(fields=['updated_at', 'id'], name='order_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} by {self.customer.name}"
@@ -55,16 +161,35 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # Price at the time of sale, so invoices and revenue do not follow later price changes
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='order_item_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.quantity} of {self.medicine.name} in Order {self.order.id}"
 
 class Doctor(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     specialization = models.CharField(max_length=100)
     phone = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Live rows by lowercased name, for case-insensitive prefix searches; also serves purge_deleted's lookups of deleted rows
+            models.Index(models.F('deleted_at'), Lower('name'), name='doctor_live_lower_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -98,6 +223,15 @@ class Appointment(models.Model):
         ('Completed', 'Completed')
     ])
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='appointment_updated_idx'),
+            models.Index(fields=['doctor', 'date'], name='appointment_doctor_date_idx'),
+            models.Index(fields=['date', 'status'], name='appointment_date_status_idx'),
+            models.Index(fields=['customer', 'date', 'status'], name='appointment_customer_date_idx'),
+        ]
 
     def __str__(self):
         return f"Appointment with {self.doctor.name} on {self.date}"
@@ -105,9 +239,18 @@ class Appointment(models.Model):
 class SupplierRequest(models.Model):
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE)
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    # Branch whose stock receives the delivery
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True)
     quantity = models.PositiveIntegerField()
     status = models.CharField(max_length=20, default='Pending', choices=[('Pending', 'Pending'), ('Completed', 'Completed')])
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='supplier_request_updated_idx'),
+            models.Index(fields=['created_at'], name='supplier_request_created_idx'),
+        ]
 
     def __str__(self):
         return f"Request to {self.supplier.name} for {self.medicine.name}"
@@ -118,14 +261,168 @@ class Prescription(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     status = models.CharField(
         max_length=20,
-        choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Dispensed', 'Dispensed')],
+        choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rejected', 'Rejected'), ('Dispensed', 'Dispensed')],
         default='Pending'
     )
     remarks = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='prescription_updated_idx'),
+            models.Index(fields=['date_created'], name='prescription_created_idx'),
+        ]
 
 class PrescriptionItem(models.Model):
     prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='items')
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
     dosage = models.CharField(max_length=100)
     frequency = models.CharField(max_length=100)
-    duration = models.CharField(max_length=100)
\ No newline at end of file
+    duration = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='prescription_item_updated_idx'),
+        ]
+
+# Archived copies of closed records, moved out of the hot tables by the
+# archive_records command. They keep the original primary keys and plain
+# integer references instead of foreign keys, so they can live in a separate
+# archive database.
+
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    customer_id = models.BigIntegerField(db_index=True)
+    customer_name = models.CharField(max_length=100)
+    branch_id = models.BigIntegerField(null=True, blank=True)
+    order_date = models.DateTimeField(db_index=True)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20)
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Order {self.id} by {self.customer_name} (archived)"
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order_id = models.BigIntegerField(db_index=True)
+    medicine_id = models.BigIntegerField()
+    medicine_name = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+class ArchivedAppointment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    customer_id = models.BigIntegerField(db_index=True)
+    customer_name = models.CharField(max_length=100)
+    doctor_id = models.BigIntegerField(db_index=True)
+    doctor_name = models.CharField(max_length=100)
+    date = models.DateTimeField(db_index=True)
+    reason = models.TextField()
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+class ArchivedPrescription(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    doctor_id = models.BigIntegerField(db_index=True)
+    patient_id = models.BigIntegerField(db_index=True)
+    date_created = models.DateTimeField(db_index=True)
+    status = models.CharField(max_length=20)
+    remarks = models.TextField(blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+class ArchivedPrescriptionItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    prescription_id = models.BigIntegerField(db_index=True)
+    medicine_id = models.BigIntegerField()
+    medicine_name = models.CharField(max_length=100)
+    dosage = models.CharField(max_length=100)
+    frequency = models.CharField(max_length=100)
+    duration = models.CharField(max_length=100)
+
+class ArchivedSupplierRequest(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    supplier_id = models.BigIntegerField(db_index=True)
+    supplier_name = models.CharField(max_length=100)
+    medicine_id = models.BigIntegerField(db_index=True)
+    medicine_name = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField(db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+# Email written in the same transaction as the change it reports and
+# delivered later by the send_outbox command
+class OutboxMessage(models.Model):
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    recipient = models.EmailField()
+    status = models.CharField(max_length=20, default='Pending', choices=[('Pending', 'Pending'), ('Sent', 'Sent'), ('Dead', 'Dead')])
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.recipient} ({self.status})"
+
+# Medicines most often bought together with a medicine, best first;
+# rebuilt as a whole by the build_affinities command
+class MedicineAffinity(models.Model):
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='+')
+    related = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    orders = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medicine', 'rank'], name='medicine_affinity_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.related_id} bought with {self.medicine_id} in {self.orders} orders"
+
+# Response to a POST that carried an idempotency key, replayed when the
+# same user sends the key again; expired rows are removed by purge_idempotency_keys
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=100)
+    endpoint = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField()
+    location = models.CharField(max_length=500, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    body = models.BinaryField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} for {self.endpoint} ({self.status_code})"
+
+# Deleted row of a change-feed model, so downstream copies can drop it too;
+# key is the primary key, or "branch:medicine" for stock rows
+class ChangeTombstone(models.Model):
+    feed = models.CharField(max_length=50)
+    key = models.CharField(max_length=50)
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['feed', 'id'], name='change_tombstone_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.feed} {self.key} deleted"
@@ -0,0 +1,42 @@
+from .models import Appointment, OutboxMessage
+
+
+def enqueue(messages):
+    """Queue (recipient, subject, body) tuples; call inside the transaction that made the change."""
+    OutboxMessage.objects.bulk_create([
+        OutboxMessage(recipient=recipient, subject=subject, body=body)
+        for recipient, subject, body in messages if recipient
+    ])
+
+
+def notify_appointments(pks, status):
+    appointments = Appointment.objects.filter(pk__in=pks).select_related('customer', 'doctor')
+    enqueue(
+        (
+            a.customer.email,
+            f'Your appointment has been {status.lower()}',
+            f'Dear {a.customer.name},\n\nYour appointment with {a.doctor.name} on '
+            f'{a.date:%b %d, %Y %H:%M} has been {status.lower()}.\n\nPharmacy Management System',
+        )
+        for a in appointments
+    )
+
+
+def notify_order_placed(order, lines):
+    """lines is a list of (medicine name, quantity, line total)."""
+    details = '\n'.join(f'  {name} x {quantity}: Rs. {amount}' for name, quantity, amount in lines)
+    enqueue([(
+        order.customer.email,
+        f'Order #{order.pk} confirmed',
+        f'Dear {order.customer.name},\n\nWe have received your order #{order.pk}:\n{details}\n\n'
+        f'Total: Rs. {order.total_amount}\n\nPharmacy Management System',
+    )])
+
+
+def notify_supplier_request(req):
+    enqueue([(
+        req.supplier.email,
+        f'Stock request: {req.medicine.name}',
+        f'Dear {req.supplier.contact_person},\n\nPlease supply {req.quantity} units of {req.medicine.name}.\n\n'
+        f'Request reference: #{req.pk}\n\nPharmacy Management System',
+    )])
@@ -0,0 +1,153 @@
+import copy
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.http import Http404
+
+from .models import Customer, Doctor, Medicine
+
+# Instances kept per process and model; least recently used ones are dropped first
+LOCAL_MAX_SIZE = 1024
+# Seconds an instance stays in the shared cache; invalidation normally replaces it much sooner
+SHARED_TIMEOUT = 3600
+
+
+class ObjectCache:
+    """
+    Read-through cache of one model's instances by primary key.
+
+    A bounded in-process LRU sits in front of the shared Django cache, which
+    sits in front of the database. Every object has a version token in the
+    shared cache; entries are stored under it and invalidate() replaces it,
+    so all worker processes stop serving the old copy at once. Callers get
+    their own copy and may modify it freely.
+
+    Soft-deleted rows are cached too, since historic rows still point at
+    them, but are only returned when asked for with include_deleted.
+    """
+
+    def __init__(self, model, max_size=LOCAL_MAX_SIZE, timeout=SHARED_TIMEOUT):
+        self.model = model
+        self.max_size = max_size
+        self.timeout = timeout
+        self._label = model._meta.label_lower
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _version_key(self, pk):
+        return f'pharmacy:obj-version:{self._label}:{pk}'
+
+    def _key(self, pk, version):
+        return f'pharmacy:obj:{self._label}:{pk}:{version}'
+
+    def _versions(self, pks):
+        keys = {self._version_key(pk): pk for pk in pks}
+        found = cache.get_many(keys)
+        versions = {keys[key]: version for key, version in found.items()}
+        for key, pk in keys.items():
+            if pk not in versions:
+                version = uuid4().hex
+                if not cache.add(key, version, None):
+                    version = cache.get(key, version)
+                versions[pk] = version
+        return versions
+
+    def get_many(self, pks, include_deleted=False):
+        """{pk: instance} for the pks that exist, loading only what neither cache holds."""
+        pks = set(pks)
+        if not pks:
+            return {}
+        versions = self._versions(pks)
+        found = {}
+        with self._lock:
+            for pk in pks:
+                entry = self._local.get(pk)
+                if entry is not None and entry[0] == versions[pk]:
+                    self._local.move_to_end(pk)
+                    found[pk] = entry[1]
+            self.local_hits += len(found)
+
+        wanted = {self._key(pk, versions[pk]): pk for pk in pks - found.keys()}
+        shared = {wanted[key]: instance for key, instance in cache.get_many(wanted).items()} if wanted else {}
+        loaded = self.model._base_manager.in_bulk(list(pks - found.keys() - shared.keys()))
+        if loaded:
+            cache.set_many({self._key(pk, versions[pk]): instance for pk, instance in loaded.items()}, self.timeout)
+
+        with self._lock:
+            self.shared_hits += len(shared)
+            self.misses += len(pks) - len(found) - len(shared)
+            for pk, instance in {**shared, **loaded}.items():
+                self._local[pk] = (versions[pk], instance)
+                self._local.move_to_end(pk)
+                found[pk] = instance
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+        return {
+            pk: copy.copy(instance) for pk, instance in found.items()
+            if include_deleted or getattr(instance, 'deleted_at', None) is None
+        }
+
+    def get(self, pk, include_deleted=False):
+        instance = self.get_many([pk], include_deleted).get(pk)
+        if instance is None:
+            raise self.model.DoesNotExist(f'{self.model.__name__} {pk} does not exist.')
+        return instance
+
+    def get_or_404(self, pk):
+        try:
+            return self.get(pk)
+        except self.model.DoesNotExist:
+            raise Http404(f'No {self.model._meta.verbose_name} matches the given query.')
+
+    def invalidate(self, pk):
+        cache.delete(self._version_key(pk))
+        with self._lock:
+            self._local.pop(pk, None)
+
+    def invalidate_many(self, pks):
+        """invalidate() for rows changed by a bulk update, which sends no signals."""
+        pks = list(pks)
+        cache.delete_many([self._version_key(pk) for pk in pks])
+        with self._lock:
+            for pk in pks:
+                self._local.pop(pk, None)
+
+    def stats(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': round((lookups - self.misses) / lookups, 3) if lookups else None,
+            'local_size': len(self._local),
+        }
+
+
+def fill_related(instances, field, object_cache):
+    """
+    Set the foreign key `field` of every instance from object_cache instead
+    of lazy queries. Soft-deleted targets are set too, as the relation would.
+    """
+    instances = list(instances)
+    related = object_cache.get_many({getattr(instance, f'{field}_id') for instance in instances}, include_deleted=True)
+    for instance in instances:
+        related_id = getattr(instance, f'{field}_id')
+        if related_id in related:
+            setattr(instance, field, related[related_id])
+    return instances
+
+
+medicine_cache = ObjectCache(Medicine)
+customer_cache = ObjectCache(Customer)
+doctor_cache = ObjectCache(Doctor)
+
+OBJECT_CACHES = {
+    'medicines': medicine_cache,
+    'customers': customer_cache,
+    'doctors': doctor_cache,
+}
@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+OUTBOX_BATCH_SIZE = 100
+# Messages still failing after this many attempts are moved to 'Dead'
+MAX_ATTEMPTS = 8
+MAX_BACKOFF = timedelta(hours=1)
+
+
+def backoff(attempts):
+    return min(timedelta(seconds=30 * 2 ** (attempts - 1)), MAX_BACKOFF)
+
+
+def dispatch_batch(batch_size=OUTBOX_BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """
+    Send up to batch_size due messages over one SMTP connection.
+
+    Returns (sent, failed). Meant to be run by a single dispatcher process.
+    """
+    now = timezone.now()
+    batch = list(OutboxMessage.objects.filter(status='Pending', next_attempt_at__lte=now).order_by('next_attempt_at', 'pk')[:batch_size])
+    if not batch:
+        return 0, 0
+
+    sent = []
+    failed = []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        # The server is unreachable: count it as a failed attempt for the whole batch
+        failed = [(message, exc) for message in batch]
+    else:
+        try:
+            for message in batch:
+                try:
+                    EmailMessage(message.subject, message.body, settings.DEFAULT_FROM_EMAIL, [message.recipient], connection=connection).send()
+                except Exception as exc:
+                    failed.append((message, exc))
+                else:
+                    sent.append(message.pk)
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    if sent:
+        OutboxMessage.objects.filter(pk__in=sent).update(status='Sent', sent_at=now, last_error='')
+    for message, exc in failed:
+        attempts = message.attempts + 1
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            attempts=attempts,
+            status='Dead' if attempts >= max_attempts else 'Pending',
+            next_attempt_at=now + backoff(attempts),
+            last_error=f'{type(exc).__name__}: {exc}',
+        )
+    return len(sent), len(failed)
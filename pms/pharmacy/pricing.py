@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Round
+from django.utils import timezone
+
+from .inventory import invalidate_valuation
+from .models import Medicine, PriceHistory, SupplierRequest
+from .objcache import medicine_cache
+
+HISTORY_BATCH_SIZE = 1000
+
+
+def revision_queryset(supplier_id=None, name=None, min_price=None, max_price=None):
+    """
+    Medicines a revision applies to. Medicines have no supplier of their own,
+    so a supplier selects the medicines that have been requested from it.
+    """
+    medicines = Medicine.objects.all()
+    if supplier_id:
+        medicines = medicines.filter(pk__in=SupplierRequest.objects.filter(supplier_id=supplier_id).values('medicine_id'))
+    if name:
+        medicines = medicines.filter(name__icontains=name)
+    if min_price is not None:
+        medicines = medicines.filter(price__gte=min_price)
+    if max_price is not None:
+        medicines = medicines.filter(price__lte=max_price)
+    return medicines
+
+
+def revise_prices(medicines, percent=None, amount=None, user=None, reason=''):
+    """
+    Raise or lower the price of every medicine in the queryset by a
+    percentage or an absolute amount, never below zero, with a single UPDATE.
+    A PriceHistory row is written per changed medicine. Returns how many
+    prices changed.
+    """
+    if (percent is None) == (amount is None):
+        raise ValueError('Give either a percentage or an amount.')
+    if percent is not None:
+        new_price = F('price') * Value(1 + Decimal(percent) / 100)
+    else:
+        new_price = F('price') + Value(Decimal(amount))
+    new_price = Round(Greatest(new_price, Value(Decimal(0))), 2)
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Old prices first: the filter may be on the price itself, so the
+        # changed rows are found again by the updated_at stamped on them
+        old_prices = dict(medicines.select_for_update().values_list('pk', 'price'))
+        medicines.update(price=new_price, updated_at=now)
+        new_prices = Medicine.objects.filter(updated_at=now).values_list('pk', 'price')
+        history = [
+            PriceHistory(medicine_id=pk, old_price=old_prices[pk], new_price=price, changed_at=now, changed_by=user, reason=reason)
+            for pk, price in new_prices
+            if pk in old_prices and price != old_prices[pk]
+        ]
+        PriceHistory.objects.bulk_create(history, batch_size=HISTORY_BATCH_SIZE)
+        transaction.on_commit(lambda: medicine_cache.invalidate_many(old_prices))
+        transaction.on_commit(invalidate_valuation)
+    return len(history)
+
+
+def record_price_change(medicine, old_price, user=None, reason=''):
+    """History row for a single edit; call it after saving the medicine."""
+    if medicine.price != old_price:
+        PriceHistory.objects.create(medicine=medicine, old_price=old_price, new_price=medicine.price, changed_by=user, reason=reason)
+
+
+def prices_at(when, medicines=None):
+    """
+    {medicine_id: price} as it was at `when`, in one query: the old price of
+    the first change after `when`, or the current price if there was none.
+    """
+    medicines = Medicine.all_objects.all() if medicines is None else medicines
+    later_change = PriceHistory.objects.filter(medicine=OuterRef('pk'), changed_at__gt=when).order_by('changed_at', 'pk')
+    return dict(
+        medicines.annotate(price_then=Coalesce(Subquery(later_change.values('old_price')[:1]), F('price')))
+        .values_list('pk', 'price_then')
+    )
@@ -0,0 +1,145 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .middleware import invalidate_role
+from .models import (
+    Appointment, Customer, Doctor, DoctorSchedule, IdempotencyKey, Medicine, MedicineAffinity, Order, OrderItem,
+    Prescription, PrescriptionItem, Supplier, SupplierRequest, UserDeletion,
+)
+
+# Rows deleted per transaction, so no single delete holds the database for long
+PURGE_CHUNK_SIZE = 500
+
+
+def soft_delete(instance):
+    """
+    Hide a medicine, supplier, customer or doctor at once and leave its
+    dependents to purge_deleted. The profile's login is detached so the user
+    can be given a fresh profile, as after a real delete.
+    """
+    instance.deleted_at = timezone.now()
+    fields = ['deleted_at']
+    if hasattr(instance, 'updated_at'):
+        # Lets the offline catalog feed pick the deletion up
+        fields.append('updated_at')
+    user_id = getattr(instance, 'user_id', None)
+    if user_id:
+        instance.user = None
+        fields.append('user')
+    instance.save(update_fields=fields)
+    if user_id:
+        transaction.on_commit(lambda: invalidate_role(user_id))
+
+
+def delete_user_later(user):
+    """Deactivate a user at once and queue the account for purge_deleted."""
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        UserDeletion.objects.get_or_create(user=user)
+
+
+def delete_in_chunks(queryset, chunk_size=PURGE_CHUNK_SIZE, progress=None):
+    """
+    Delete the rows of queryset chunk_size at a time, each chunk in its own
+    transaction. Signals still fire per row, so caches stay consistent.
+    progress(deleted) is called after every chunk. Returns the number of
+    rows deleted.
+    """
+    model = queryset.model
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            model._base_manager.filter(pk__in=pks).delete()
+        deleted += len(pks)
+        if progress:
+            progress(deleted)
+
+
+# Dependents of each kind of deleted row, deepest first, so that every chunk
+# only deletes the rows it names and never cascades into a large delete
+def _medicine_plan(pk):
+    return [
+        OrderItem.objects.filter(medicine_id=pk),
+        PrescriptionItem.objects.filter(medicine_id=pk),
+        SupplierRequest.objects.filter(medicine_id=pk),
+        MedicineAffinity.objects.filter(Q(medicine_id=pk) | Q(related_id=pk)),
+    ]
+
+
+def _supplier_plan(pk):
+    return [SupplierRequest.objects.filter(supplier_id=pk)]
+
+
+def _customer_plan(pk):
+    return [
+        OrderItem.objects.filter(order__customer_id=pk),
+        Order.objects.filter(customer_id=pk),
+        Appointment.objects.filter(customer_id=pk),
+    ]
+
+
+def _doctor_plan(pk):
+    return [
+        Appointment.objects.filter(doctor_id=pk),
+        DoctorSchedule.objects.filter(doctor_id=pk),
+    ]
+
+
+def _user_plan(pk):
+    plan = []
+    for customer_id in Customer.all_objects.filter(user_id=pk).values_list('pk', flat=True):
+        plan += _customer_plan(customer_id)
+    for doctor_id in Doctor.all_objects.filter(user_id=pk).values_list('pk', flat=True):
+        plan += _doctor_plan(doctor_id)
+    prescriptions = Q(prescription__doctor_id=pk) | Q(prescription__patient_id=pk)
+    return plan + [
+        PrescriptionItem.objects.filter(prescriptions),
+        Prescription.objects.filter(Q(doctor_id=pk) | Q(patient_id=pk)),
+        IdempotencyKey.objects.filter(user_id=pk),
+    ]
+
+
+PURGE_PLANS = [
+    (Medicine, Medicine.all_objects.filter(deleted_at__isnull=False), _medicine_plan),
+    (Supplier, Supplier.all_objects.filter(deleted_at__isnull=False), _supplier_plan),
+    (Customer, Customer.all_objects.filter(deleted_at__isnull=False), _customer_plan),
+    (Doctor, Doctor.all_objects.filter(deleted_at__isnull=False), _doctor_plan),
+    (User, User.objects.filter(deletion__isnull=False), _user_plan),
+]
+
+
+def pending_deletions():
+    """Rows marked deleted and not purged yet, per model name."""
+    return {model._meta.verbose_name_plural: rows.count() for model, rows, _ in PURGE_PLANS}
+
+
+def purge_deleted(chunk_size=PURGE_CHUNK_SIZE, progress=None, limit=None):
+    """
+    Remove up to `limit` rows marked deleted, dependents first.
+
+    progress(message) is called after every chunk and every purged row. A
+    purge interrupted midway continues where it stopped on the next run.
+    Returns the number of rows purged.
+    """
+    purged = 0
+    for model, rows, plan in PURGE_PLANS:
+        for pk in rows.order_by('pk').values_list('pk', flat=True):
+            if limit is not None and purged >= limit:
+                return purged
+            label = f'{model._meta.verbose_name} {pk}'
+            for queryset in plan(pk):
+                name = queryset.model._meta.verbose_name_plural
+                delete_in_chunks(queryset, chunk_size, progress and (lambda n: progress(f'{label}: {n} {name} deleted')))
+            # Branch stock rows go with the medicine through the post_delete signal
+            with transaction.atomic():
+                model._base_manager.filter(pk=pk).delete()
+            purged += 1
+            if progress:
+                progress(f'{label} purged')
+    return purged
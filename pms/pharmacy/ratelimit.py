@@ -0,0 +1,126 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+REJECTED_KEY = 'pharmacy:ratelimit:rejected:{}'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class TokenBucket:
+    """
+    Token bucket of `burst` tokens refilled at `rate` tokens per `per` seconds,
+    kept in the shared cache as a single integer per client.
+
+    The integer is the time, in milliseconds, at which the bucket will be
+    full again (the "theoretical arrival time" of GCRA). Taking a token is
+    one incr by the refill interval, atomic on Redis but not on the file
+    cache (see CACHES in settings); the request is allowed when that
+    time is at most `burst` intervals ahead of now, and refunded with decr
+    otherwise. The key expires when the bucket is full, so idle clients
+    cost nothing.
+    """
+
+    def __init__(self, rate, per, burst):
+        self.interval = int(per * 1000 / rate)
+        self.capacity = burst * self.interval
+
+    def take(self, key):
+        """Return 0 when a token was taken, else the seconds until one is available."""
+        now = _now_ms()
+        if cache.add(key, now + self.interval, math.ceil(self.interval / 1000)):
+            return 0
+        try:
+            full_at = cache.incr(key, self.interval)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.add(key, now + self.interval, math.ceil(self.interval / 1000))
+            return 0
+        if full_at - self.interval < now:
+            # The key outlived a full bucket by less than the timeout's
+            # one-second granularity; start again from a full bucket
+            full_at = now + self.interval
+            cache.set(key, full_at, math.ceil(self.interval / 1000))
+            return 0
+        if full_at - now > self.capacity:
+            cache.decr(key, self.interval)
+            return max(1, math.ceil((full_at - self.capacity - now) / 1000))
+        cache.touch(key, math.ceil((full_at - now) / 1000))
+        return 0
+
+
+def client_ip(request):
+    """
+    The client's address. Behind settings.PROXY_HOPS proxies REMOTE_ADDR is
+    the innermost proxy, so it is the entry that many from the right of
+    X-Forwarded-For, the one our outermost proxy added; entries further left
+    come from the client and could be forged.
+    """
+    hops = settings.PROXY_HOPS
+    if hops:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_key(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def rejected_counts():
+    """Requests refused per limited URL name since the counters were last cleared."""
+    keys = {REJECTED_KEY.format(name): name for name in settings.RATE_LIMITS}
+    counts = cache.get_many(keys)
+    return {name: counts.get(key, 0) for key, name in keys.items()}
+
+
+def _count_rejection(name):
+    key = REJECTED_KEY.format(name)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+class RateLimitMiddleware:
+    """
+    Throttle the URL names listed in settings.RATE_LIMITS per user, or per
+    IP for anonymous requests, answering 429 with Retry-After once the
+    client's bucket is empty. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.buckets = {
+            name: TokenBucket(limit['rate'], limit['per'], limit['burst'])
+            for name, limit in settings.RATE_LIMITS.items()
+        }
+        self.methods = {name: set(limit.get('methods', ['POST'])) for name, limit in settings.RATE_LIMITS.items()}
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = request.resolver_match.url_name if request.resolver_match else None
+        bucket = self.buckets.get(name)
+        if bucket is None or request.method not in self.methods[name]:
+            return None
+        retry_after = bucket.take(f'pharmacy:ratelimit:{name}:{client_key(request)}')
+        if not retry_after:
+            return None
+        _count_rejection(name)
+        response = HttpResponse(
+            f'Too many requests. Please try again in {retry_after} seconds.',
+            status=429, content_type='text/plain',
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
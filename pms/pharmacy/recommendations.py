@@ -0,0 +1,82 @@
+import heapq
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from django.db import transaction
+
+from .models import ArchivedOrder, ArchivedOrderItem, MedicineAffinity, OrderItem
+from .objcache import medicine_cache
+
+# Neighbours kept per medicine
+AFFINITY_TOP_K = 10
+# Rows fetched per round trip while scanning order lines
+AFFINITY_CHUNK_SIZE = 5000
+# Larger baskets are bulk or institutional purchases; they would add
+# quadratically many pairs while saying little about what goes together
+MAX_BASKET_SIZE = 30
+
+
+def _baskets(lines):
+    """Group (order_id, medicine_id) rows sorted by order_id into sets of medicines."""
+    order_id, basket = None, set()
+    for line_order_id, medicine_id in lines:
+        if line_order_id != order_id:
+            if basket:
+                yield basket
+            order_id, basket = line_order_id, set()
+        basket.add(medicine_id)
+    if basket:
+        yield basket
+
+
+def co_occurrence(chunk_size=AFFINITY_CHUNK_SIZE):
+    """
+    Sparse medicine-by-medicine matrix {medicine: Counter({other: orders with both})}
+    over every non-cancelled order, archived ones included.
+    """
+    live = OrderItem.objects.exclude(order__status='Cancelled')\
+        .values_list('order_id', 'medicine_id').order_by('order_id').iterator(chunk_size=chunk_size)
+    cancelled = set(ArchivedOrder.objects.filter(status='Cancelled').values_list('pk', flat=True))
+    archived = (
+        line for line in ArchivedOrderItem.objects.values_list('order_id', 'medicine_id')
+        .order_by('order_id').iterator(chunk_size=chunk_size)
+        if line[0] not in cancelled
+    )
+
+    matrix = defaultdict(Counter)
+    for lines in (live, archived):
+        for basket in _baskets(lines):
+            if len(basket) > MAX_BASKET_SIZE:
+                continue
+            for a, b in combinations(basket, 2):
+                matrix[a][b] += 1
+                matrix[b][a] += 1
+    return matrix
+
+
+def build_affinities(top_k=AFFINITY_TOP_K, chunk_size=AFFINITY_CHUNK_SIZE):
+    """Rebuild the MedicineAffinity table, returning the number of rows written."""
+    matrix = co_occurrence(chunk_size)
+    rows = []
+    for medicine_id, neighbours in matrix.items():
+        # Ties broken by id so rebuilds are stable
+        best = heapq.nsmallest(top_k, neighbours.items(), key=lambda pair: (-pair[1], pair[0]))
+        rows.extend(
+            MedicineAffinity(medicine_id=medicine_id, related_id=related_id, rank=rank, orders=orders)
+            for rank, (related_id, orders) in enumerate(best)
+        )
+    # Readers see either the old table or the new one
+    with transaction.atomic():
+        MedicineAffinity.objects.all().delete()
+        MedicineAffinity.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def also_bought(medicine_id, limit=5):
+    """Medicines most often bought together with medicine_id, from one indexed lookup."""
+    related_ids = list(
+        MedicineAffinity.objects.filter(medicine_id=medicine_id, rank__lt=limit)
+        .order_by('rank').values_list('related_id', flat=True)
+    )
+    medicines = medicine_cache.get_many(related_ids)
+    return [medicines[pk] for pk in related_ids if pk in medicines]
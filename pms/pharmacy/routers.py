@@ -0,0 +1,66 @@
+ARCHIVE_MODELS = {
+    'archivedorder',
+    'archivedorderitem',
+    'archivedappointment',
+    'archivedprescription',
+    'archivedprescriptionitem',
+    'archivedsupplierrequest',
+}
+
+
+class ArchiveRouter:
+    """Place the archive tables in the 'archive' database and everything else in 'default'."""
+
+    def _is_archive(self, model):
+        return model._meta.app_label == 'pharmacy' and model._meta.model_name in ARCHIVE_MODELS
+
+    def db_for_read(self, model, **hints):
+        return 'archive' if self._is_archive(model) else None
+
+    def db_for_write(self, model, **hints):
+        return 'archive' if self._is_archive(model) else None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'pharmacy' and model_name in ARCHIVE_MODELS:
+            return db == 'archive'
+        if db == 'archive':
+            return False
+        return None
+
+
+class BranchRouter:
+    """
+    Keep branch stock rows in per-branch databases ('branch_<id>') and
+    everything else, including the shared catalog, in 'default'.
+
+    Stock queries name their database explicitly through
+    pharmacy.branches.branch_db(); the router routes saves of loaded rows
+    and decides which tables each database gets.
+    """
+
+    def _is_stock(self, model):
+        return model._meta.app_label == 'pharmacy' and model._meta.model_name == 'branchstock'
+
+    def _for_instance(self, model, hints):
+        instance = hints.get('instance')
+        if self._is_stock(model) and instance is not None and instance.branch_id is not None:
+            from .branches import branch_db
+            return branch_db(instance.branch_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._for_instance(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._for_instance(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Stock rows point at branches and medicines in the shared database
+        if self._is_stock(type(obj1)) or self._is_stock(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db.startswith('branch_'):
+            return app_label == 'pharmacy' and model_name == 'branchstock'
+        return None
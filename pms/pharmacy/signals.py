@@ -0,0 +1,171 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .analytics import sales_cube
+from .autocomplete import AUTOCOMPLETE_INDEXES, doctor_label
+from .backends import invalidate_user
+from .branches import delete_stock
+from .calendars import invalidate_doctor
+from .changefeed import record_deletion
+from .facets import row_changed, rows_changed
+from .inventory import invalidate_valuation
+from .live import dashboard_publisher
+from .middleware import invalidate_branches, invalidate_role
+from .objcache import customer_cache, doctor_cache, medicine_cache
+from .models import (
+    Appointment, Branch, BranchStock, Customer, Doctor, Medicine, Order, OrderItem, Prescription, PrescriptionItem,
+    Supplier, SupplierRequest,
+)
+from .transitions import status_changed
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    pk = instance.pk
+    # After commit, so a concurrent request cannot cache the old row, such as a
+    # deactivated account or an old password hash, under the fresh key
+    transaction.on_commit(lambda: invalidate_user(pk))
+    transaction.on_commit(lambda: invalidate_role(pk))
+    listed = kwargs['signal'] is post_save and not instance.is_staff
+    AUTOCOMPLETE_INDEXES['patients'].changed(instance.pk, instance.username if listed else None)
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+@receiver([post_save, post_delete], sender=Customer)
+def profile_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    if user_id:
+        transaction.on_commit(lambda: invalidate_role(user_id))
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    # Cancelled lines have to be dropped from the sales cube
+    if instance.status == 'Cancelled':
+        sales_cube.invalidate()
+
+
+@receiver(status_changed, sender=Order)
+def order_status_changed(sender, pks, target, **kwargs):
+    if target == 'Cancelled':
+        sales_cube.invalidate()
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, **kwargs):
+    sales_cube.invalidate()
+
+
+def _listed(instance, kwargs):
+    # Soft-deleted rows leave the search indexes at once
+    return kwargs['signal'] is post_save and instance.deleted_at is None
+
+
+@receiver([post_save, post_delete], sender=Medicine)
+def medicine_changed(sender, instance, **kwargs):
+    AUTOCOMPLETE_INDEXES['medicines'].changed(instance.pk, instance.name if _listed(instance, kwargs) else None)
+
+
+@receiver([post_save, post_delete], sender=Customer)
+def customer_changed(sender, instance, **kwargs):
+    AUTOCOMPLETE_INDEXES['customers'].changed(instance.pk, instance.name if _listed(instance, kwargs) else None)
+
+
+@receiver([post_save, post_delete], sender=Supplier)
+def supplier_changed(sender, instance, **kwargs):
+    AUTOCOMPLETE_INDEXES['suppliers'].changed(instance.pk, instance.name if _listed(instance, kwargs) else None)
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    label = doctor_label(instance.name, instance.specialization)
+    AUTOCOMPLETE_INDEXES['doctors'].changed(instance.pk, label if _listed(instance, kwargs) else None)
+
+
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=Appointment)
+@receiver([post_save, post_delete], sender=Prescription)
+@receiver([post_save, post_delete], sender=SupplierRequest)
+@receiver([post_save, post_delete], sender=Medicine)
+@receiver([post_save, post_delete], sender=Supplier)
+@receiver([post_save, post_delete], sender=Customer)
+@receiver(status_changed)
+def dashboard_changed(sender, **kwargs):
+    # Recount once the change is visible to the publisher's own connection
+    transaction.on_commit(dashboard_publisher.notify)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def appointment_changed(sender, instance, **kwargs):
+    invalidate_doctor(instance.doctor_id)
+
+
+@receiver(status_changed, sender=Appointment)
+def appointment_status_changed(sender, pks, **kwargs):
+    for doctor_id in Appointment.objects.filter(pk__in=pks).values_list('doctor_id', flat=True).distinct():
+        invalidate_doctor(doctor_id)
+
+
+@receiver([post_save, post_delete], sender=Order)
+def order_facets_changed(sender, instance, **kwargs):
+    row_changed(Order, instance.order_date)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def appointment_facets_changed(sender, instance, created=False, **kwargs):
+    # A rescheduled appointment may have left a closed range
+    row_changed(Appointment, None if kwargs['signal'] is post_save and not created else instance.date)
+
+
+@receiver(status_changed, sender=Order)
+@receiver(status_changed, sender=Appointment)
+def facet_statuses_changed(sender, pks, **kwargs):
+    rows_changed(sender, pks)
+
+
+@receiver([post_save, post_delete], sender=Branch)
+@receiver(m2m_changed, sender=Branch.staff.through)
+def branches_changed(sender, **kwargs):
+    invalidate_branches()
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_delete, sender=Prescription)
+@receiver(post_delete, sender=PrescriptionItem)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_delete, sender=SupplierRequest)
+@receiver(post_delete, sender=BranchStock)
+def feed_row_deleted(sender, instance, **kwargs):
+    # Listening also turns bulk deletes of these models into row by row
+    # ones, so stock removed from branch databases leaves a tombstone too
+    record_deletion(instance)
+
+
+@receiver([post_save, post_delete], sender=Medicine)
+@receiver([post_save, post_delete], sender=SupplierRequest)
+def valuation_changed(sender, **kwargs):
+    # Prices, costs, expiry dates and the latest supplier request place and value stock
+    transaction.on_commit(invalidate_valuation)
+
+
+@receiver(post_delete, sender=Branch)
+def branch_deleted(sender, instance, **kwargs):
+    delete_stock(branch_id=instance.pk)
+
+
+@receiver(post_delete, sender=Medicine)
+def medicine_deleted(sender, instance, **kwargs):
+    # Stock rows may live in other databases, out of reach of the cascade
+    delete_stock(medicine_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Medicine)
+@receiver([post_save, post_delete], sender=Customer)
+@receiver([post_save, post_delete], sender=Doctor)
+def cached_object_changed(sender, instance, **kwargs):
+    object_cache = {Medicine: medicine_cache, Customer: customer_cache, Doctor: doctor_cache}[sender]
+    # After commit, so a concurrent read cannot put the old row back under the new version
+    transaction.on_commit(lambda: object_cache.invalidate(instance.pk))
@@ -0,0 +1,52 @@
+// Lazily fetched options for AutocompleteSelect widgets
+(function () {
+    function setup(container) {
+        var input = container.querySelector('.autocomplete-input');
+        var select = container.querySelector('select');
+        var results = container.querySelector('.autocomplete-results');
+        var url = container.dataset.autocompleteUrl;
+        var timer = null;
+        var pending = null;
+
+        function choose(id, text) {
+            select.innerHTML = '';
+            select.appendChild(new Option(text, id, true, true));
+            input.value = text;
+            results.innerHTML = '';
+        }
+
+        function show(items) {
+            results.innerHTML = '';
+            items.forEach(function (item) {
+                var option = document.createElement('button');
+                option.type = 'button';
+                option.className = 'autocomplete-option';
+                option.textContent = item.text;
+                option.addEventListener('mousedown', function (event) {
+                    event.preventDefault();
+                    choose(item.id, item.text);
+                });
+                results.appendChild(option);
+            });
+        }
+
+        input.addEventListener('input', function () {
+            // Typing invalidates the previous choice until a new one is picked
+            select.value = '';
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                if (pending) { pending.abort(); }
+                pending = new AbortController();
+                fetch(url + '?q=' + encodeURIComponent(input.value), {signal: pending.signal, credentials: 'same-origin'})
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) { show(data.results || []); })
+                    .catch(function () {});
+            }, 200);
+        });
+        input.addEventListener('blur', function () { results.innerHTML = ''; });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('.autocomplete').forEach(setup);
+    });
+})();
@@ -0,0 +1,212 @@
+import base64
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .branches import stock_atomic, stock_rows
+from .models import Customer, Medicine, Order, OrderItem
+
+# Upper bound on how many offline sales a terminal may push in one request
+MAX_SYNC_BATCH = 500
+# Page size of the catalog delta feed
+CATALOG_PAGE_SIZE = 500
+
+
+class SyncError(Exception):
+    pass
+
+
+def encode_cursor(updated_at, pk):
+    raw = f"{updated_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        stamp, pk = raw.rsplit('|', 1)
+        updated_at = parse_datetime(stamp)
+        if updated_at is None:
+            raise ValueError(stamp)
+        return updated_at, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise SyncError('Invalid cursor.')
+
+
+def _parse_sale(sale):
+    """Validate the shape of one offline sale, returning (client_id, customer_id, items, sold_at)."""
+    if not isinstance(sale, dict):
+        raise SyncError('Sale must be an object.')
+    client_id = sale.get('client_id')
+    if not isinstance(client_id, str) or not client_id or len(client_id) > 64:
+        raise SyncError('client_id must be a non-empty string of at most 64 characters.')
+
+    customer_id = sale.get('customer')
+    if not isinstance(customer_id, int):
+        raise SyncError('customer must be a customer id.')
+
+    raw_items = sale.get('items')
+    if not isinstance(raw_items, list) or not raw_items:
+        raise SyncError('items must be a non-empty list.')
+    items = Counter()
+    for item in raw_items:
+        if not isinstance(item, dict):
+            raise SyncError('Each item must be an object.')
+        medicine_id = item.get('medicine')
+        quantity = item.get('quantity')
+        if not isinstance(medicine_id, int):
+            raise SyncError('medicine must be a medicine id.')
+        if not isinstance(quantity, int) or quantity < 1:
+            raise SyncError('quantity must be a positive integer.')
+        items[medicine_id] += quantity
+
+    sold_at = None
+    if sale.get('sold_at'):
+        try:
+            sold_at = parse_datetime(str(sale['sold_at']))
+        except ValueError:
+            # Well formed but impossible, such as month 13
+            sold_at = None
+        if sold_at is None:
+            raise SyncError('sold_at must be an ISO 8601 datetime.')
+        if timezone.is_naive(sold_at):
+            sold_at = timezone.make_aware(sold_at)
+    return client_id, customer_id, items, sold_at
+
+
+def apply_sales(sales, branch_id):
+    """
+    Apply a batch of offline sales made at a branch in a single transaction.
+
+    Sales whose client_id has already been synced are reported as duplicates
+    and not applied again, so a terminal can safely resend a whole batch.
+    Returns one result dict per submitted sale, in submission order.
+    """
+    if not isinstance(sales, list):
+        raise SyncError('sales must be a list.')
+    if len(sales) > MAX_SYNC_BATCH:
+        raise SyncError(f'At most {MAX_SYNC_BATCH} sales can be synced per request.')
+
+    results = [None] * len(sales)
+    parsed = []
+    for index, sale in enumerate(sales):
+        client_id = sale.get('client_id') if isinstance(sale, dict) else None
+        try:
+            parsed.append((index, *_parse_sale(sale)))
+        except SyncError as exc:
+            results[index] = {'client_id': client_id, 'status': 'rejected', 'error': str(exc)}
+
+    client_ids = {p[1] for p in parsed}
+    customer_ids = {p[2] for p in parsed}
+    medicine_ids = {medicine_id for p in parsed for medicine_id in p[3]}
+
+    try:
+        with transaction.atomic(), stock_atomic(branch_id):
+            synced = dict(Order.objects.filter(client_id__in=client_ids).values_list('client_id', 'id'))
+            customers = set(Customer.objects.filter(pk__in=customer_ids).values_list('pk', flat=True))
+            medicines = Medicine.objects.in_bulk(medicine_ids)
+            stock = stock_rows(branch_id).select_for_update().filter(medicine_id__in=medicine_ids)
+            remaining = dict(stock.values_list('medicine_id', 'quantity'))
+
+            accepted = []
+            repeated = []
+            seen = set()
+            for index, client_id, customer_id, items, sold_at in parsed:
+                if client_id in synced or client_id in seen:
+                    results[index] = {'client_id': client_id, 'status': 'duplicate', 'order_id': synced.get(client_id)}
+                    repeated.append(index)
+                    continue
+                seen.add(client_id)
+                if customer_id not in customers:
+                    results[index] = {'client_id': client_id, 'status': 'rejected', 'error': 'Unknown customer.'}
+                    continue
+                missing = [pk for pk in items if pk not in medicines]
+                if missing:
+                    results[index] = {'client_id': client_id, 'status': 'rejected', 'error': f'Unknown medicine {missing[0]}.'}
+                    continue
+                short = [pk for pk, qty in items.items() if remaining.get(pk, 0) < qty]
+                if short:
+                    results[index] = {'client_id': client_id, 'status': 'rejected', 'error': f'Not enough stock for {medicines[short[0]].name}.'}
+                    continue
+                for pk, qty in items.items():
+                    remaining[pk] -= qty
+                accepted.append((index, client_id, customer_id, items, sold_at))
+
+            if accepted:
+                now = timezone.now()
+                orders = Order.objects.bulk_create([
+                    Order(
+                        customer_id=customer_id,
+                        branch_id=branch_id,
+                        client_id=client_id,
+                        order_date=sold_at or now,
+                        status='Completed',
+                        total_amount=sum(medicines[pk].price * qty for pk, qty in items.items()),
+                    )
+                    for _, client_id, customer_id, items, sold_at in accepted
+                ])
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, medicine_id=pk, quantity=qty, unit_price=medicines[pk].price, line_total=medicines[pk].price * qty)
+                    for order, (_, _, _, items, _) in zip(orders, accepted)
+                    for pk, qty in items.items()
+                ])
+
+                # One UPDATE for every medicine touched by the batch
+                sold = Counter()
+                for _, _, _, items, _ in accepted:
+                    sold.update(items)
+                stock_rows(branch_id).filter(medicine_id__in=sold.keys()).update(
+                    quantity=Case(*[When(medicine_id=pk, then=F('quantity') - qty) for pk, qty in sold.items()]),
+                    updated_at=now,
+                )
+
+                for order, (index, client_id, _, _, _) in zip(orders, accepted):
+                    results[index] = {'client_id': client_id, 'status': 'created', 'order_id': order.pk}
+                    synced[client_id] = order.pk
+                # Repeats within the same batch point at the order created for the first copy
+                for index in repeated:
+                    results[index]['order_id'] = synced.get(results[index]['client_id'])
+    except IntegrityError:
+        # Another terminal synced one of these client_ids concurrently; the retry will see it as a duplicate
+        raise SyncError('Batch conflicted with a concurrent sync, please retry.')
+
+    return results
+
+
+def _changes_page(rows, cursor, limit):
+    """One page of rows ordered by (updated_at, id) after cursor, with the cursor to resume from."""
+    rows = rows.order_by('updated_at', 'id')
+    if cursor:
+        updated_at, pk = decode_cursor(cursor)
+        rows = rows.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+    page = list(rows[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    next_cursor = encode_cursor(page[-1].updated_at, page[-1].pk) if page else cursor
+    return page, next_cursor, has_more
+
+
+def catalog_changes(cursor=None, limit=CATALOG_PAGE_SIZE):
+    """Return medicines changed after cursor, oldest first, plus the cursor to resume from."""
+    page, next_cursor, has_more = _changes_page(Medicine.all_objects.all(), cursor, limit)
+    changes = [
+        {
+            'id': m.pk,
+            'name': m.name,
+            'price': str(m.price),
+            'expiry_date': m.expiry_date.isoformat() if m.expiry_date else None,
+            'deleted': m.deleted_at is not None,
+        }
+        for m in page
+    ]
+    return changes, next_cursor, has_more
+
+
+def stock_changes(branch_id, cursor=None, limit=CATALOG_PAGE_SIZE):
+    """Return stock levels at a branch changed after cursor, oldest first, plus the cursor to resume from."""
+    page, next_cursor, has_more = _changes_page(stock_rows(branch_id), cursor, limit)
+    changes = [{'medicine': row.medicine_id, 'quantity': row.quantity} for row in page]
+    return changes, next_cursor, has_more
@@ -0,0 +1,12 @@
+from django import template
+from django.utils.html import format_html
+
+from pharmacy.idempotency import IDEMPOTENCY_FIELD, new_key
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_field():
+    """Hidden field with a fresh key, so resubmitting the rendered form cannot repeat its effect."""
+    return format_html('<input type="hidden" name="{}" value="{}">', IDEMPOTENCY_FIELD, new_key())
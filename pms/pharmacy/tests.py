@@ -0,0 +1,691 @@
+import csv
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import live, transitions
+from .archive import archive_closed_records
+from .autocomplete import PrefixIndex
+from .backends import CachedModelBackend, user_cache_key
+from .branches import OutOfStock, set_stock, stock_atomic, stock_levels, take_stock
+from .inventory import valuation
+from .models import (
+    Appointment, ArchivedOrder, ArchivedPrescription, Branch, ChangeTombstone, Customer, Doctor, Medicine, Order,
+    OrderItem, OutboxMessage, Prescription, PrescriptionItem, PriceHistory, Supplier, SupplierRequest, UserDeletion,
+)
+from .notifications import enqueue
+from .objcache import customer_cache
+from .outbox import backoff, dispatch_batch
+from .purge import soft_delete
+from .ratelimit import client_key
+from .sync import apply_sales
+from .transitions import transition
+
+
+def make_catalog():
+    branch, _ = Branch.objects.get_or_create(name='Main')
+    customer = Customer.objects.create(name='Asha', email='asha@example.com', phone='100')
+    medicine = Medicine.objects.create(name='Paracetamol', description='', price=Decimal('2.50'))
+    set_stock(branch.pk, medicine.pk, 10)
+    return branch, customer, medicine
+
+
+# Pages render without a collectstatic manifest
+plain_static = override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+
+
+class CacheIsolation:
+    """
+    Start every test with an empty cache: primary keys are reused from test to
+    test, and the invalidations that signals queue with on_commit never run
+    inside a TestCase.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class PharmacyTestCase(CacheIsolation, TestCase):
+    pass
+
+
+class SyncSalesTests(PharmacyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch, self.customer, self.medicine = make_catalog()
+
+    def sale(self, client_id, **extra):
+        return {'client_id': client_id, 'customer': self.customer.pk, 'items': [{'medicine': self.medicine.pk, 'quantity': 1}], **extra}
+
+    def test_impossible_sold_at_rejects_only_that_sale(self):
+        results = apply_sales([self.sale('bad', sold_at='2024-13-45T00:00:00'), self.sale('good')], self.branch.pk)
+        self.assertEqual(results[0], {'client_id': 'bad', 'status': 'rejected', 'error': 'sold_at must be an ISO 8601 datetime.'})
+        self.assertEqual(results[1]['status'], 'created')
+        self.assertQuerySetEqual(Order.objects.values_list('client_id', flat=True), ['good'])
+
+
+class UserCacheTests(PharmacyTestCase):
+    def test_user_is_dropped_from_cache_once_the_change_commits(self):
+        backend = CachedModelBackend()
+        user = User.objects.create_user('asha', password='x')
+        backend.get_user(user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+            # Dropping it now would let a concurrent request cache the old row again until the timeout
+            self.assertIsNotNone(cache.get(user_cache_key(user.pk)))
+        self.assertIsNone(cache.get(user_cache_key(user.pk)))
+        self.assertIsNone(backend.get_user(user.pk))
+
+
+@plain_static
+class SalesAnalyticsTests(PharmacyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+
+    def test_impossible_date_is_ignored(self):
+        response = self.client.get(reverse('sales_analytics'), {'start_date': '2020-02-30', 'end_date': '2020-03-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['start_date'])
+        self.assertEqual(response.context['end_date'], '2020-03-01')
+
+
+@plain_static
+class AutocompleteTests(PharmacyTestCase):
+    def test_non_numeric_selection_is_dropped(self):
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        self.assertEqual(self.client.get(reverse('order_list'), {'customer': 'abc'}).status_code, 200)
+        self.assertEqual(self.client.get(reverse('appointment_list'), {'doctor': 'x1'}).status_code, 200)
+
+    def test_index_updates_one_row_without_reloading(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            return [(1, 'Asha Rao'), (2, 'Ravi Kumar')]
+
+        index = PrefixIndex(load)
+        self.assertEqual(index.search('ra'), [(1, 'Asha Rao'), (2, 'Ravi Kumar')])
+        with self.captureOnCommitCallbacks(execute=True):
+            index.changed(3, 'Rana Das')
+            index.changed(1, 'Asha Menon')
+            index.changed(2, None)
+        self.assertEqual(index.search('ra'), [(3, 'Rana Das')])
+        self.assertEqual(index.search('asha'), [(1, 'Asha Menon')])
+        self.assertEqual(len(loads), 1)
+
+    def test_update_leaves_a_search_in_progress_alone(self):
+        index = PrefixIndex(lambda: [(1, 'Asha Rao'), (2, 'Ravi Kumar')])
+        words, labels = index._snapshot()
+        before = (list(words), dict(labels))
+        with self.captureOnCommitCallbacks(execute=True):
+            index.changed(2, None)
+            index.changed(3, 'Rana Das')
+        self.assertEqual((words, labels), before)
+        self.assertEqual(index.search('ra'), [(1, 'Asha Rao'), (3, 'Rana Das')])
+
+    def test_index_ignores_rolled_back_change(self):
+        index = PrefixIndex(lambda: [(1, 'Asha Rao')])
+        index.search('asha')
+        with self.captureOnCommitCallbacks(execute=False):
+            index.changed(2, 'Ashok Nair')
+        self.assertEqual(index.search('ash'), [(1, 'Asha Rao')])
+
+
+@plain_static
+class PriceRevisionTests(PharmacyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch, self.customer, self.medicine = make_catalog()
+        self.other = Medicine.objects.create(name='Ibuprofen', description='', price=Decimal('4.00'))
+        self.supplier = Supplier.objects.create(name='Acme', contact_person='Ravi', email='acme@example.com', phone='1')
+        SupplierRequest.objects.create(supplier=self.supplier, medicine=self.medicine, branch=self.branch, quantity=5)
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def revise(self, **extra):
+        data = {'supplier': self.supplier.pk, 'change_type': 'percent', 'change': '10', 'reason': 'Supplier increase'}
+        return self.client.post(reverse('price_revision'), {**data, **extra})
+
+    def test_form_renders_only_the_chosen_supplier(self):
+        Supplier.objects.create(name='Zenith', contact_person='Mira', email='zenith@example.com', phone='2')
+        response = self.revise(preview='')
+        self.assertEqual(response.context['matched'], 1)
+        self.assertContains(response, 'data-autocomplete-url="%s"' % reverse('autocomplete', args=['suppliers']))
+        self.assertContains(response, '>Acme</option>')
+        self.assertNotContains(response, 'Zenith')
+
+    def test_suppliers_are_searchable(self):
+        response = self.client.get(reverse('autocomplete', args=['suppliers']), {'q': 'ac'})
+        self.assertEqual(response.json()['results'], [{'id': self.supplier.pk, 'text': 'Acme'}])
+
+    def test_apply_revises_the_supplier_medicines(self):
+        self.assertRedirects(self.revise(apply=''), reverse('medicine_list'), fetch_redirect_response=False)
+        self.assertEqual(Medicine.objects.get(pk=self.medicine.pk).price, Decimal('2.75'))
+        self.assertEqual(Medicine.objects.get(pk=self.other.pk).price, Decimal('4.00'))
+        history = PriceHistory.objects.get()
+        self.assertEqual((history.medicine_id, history.old_price, history.new_price), (self.medicine.pk, Decimal('2.50'), Decimal('2.75')))
+        self.assertEqual((history.changed_by, history.reason), (self.staff, 'Supplier increase'))
+
+
+@plain_static
+class InventoryValuationTests(PharmacyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch, _, self.medicine = make_catalog()
+        self.medicine.cost_price = Decimal('1.50')
+        self.medicine.expiry_date = timezone.localdate() + timedelta(days=10)
+        self.medicine.save()
+        self.uncosted = Medicine.objects.create(name='Ibuprofen', description='', price=Decimal('4.00'))
+        set_stock(self.branch.pk, self.uncosted.pk, 4)
+        self.supplier = Supplier.objects.create(name='Acme', contact_person='Ravi', email='acme@example.com', phone='1')
+        SupplierRequest.objects.create(supplier=self.supplier, medicine=self.medicine, branch=self.branch, quantity=5)
+
+    def test_totals_by_bucket_and_supplier(self):
+        report = valuation()
+        self.assertEqual(report['total'], {'skus': 2, 'units': 14, 'at_price': Decimal('41.00'), 'at_cost': Decimal('15.00'), 'uncosted': 1})
+        self.assertEqual(report['buckets']['30']['at_price'], Decimal('25.00'))
+        self.assertEqual(report['buckets']['none']['units'], 4)
+        self.assertEqual(report['suppliers'][self.supplier.pk]['total']['at_cost'], Decimal('15.00'))
+        self.assertEqual(report['suppliers'][None]['none']['uncosted'], 1)
+
+    def test_stock_moves_keep_the_cached_valuation(self):
+        valuation()
+        with self.captureOnCommitCallbacks(execute=True):
+            with stock_atomic(self.branch.pk):
+                take_stock(self.branch.pk, {self.medicine.pk: 1})
+        with self.assertNumQueries(0):
+            valuation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.medicine.price = Decimal('3.00')
+            self.medicine.save()
+        self.assertEqual(valuation()['buckets']['30']['at_price'], Decimal('27.00'))
+
+    def test_csv_names_the_supplier(self):
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        response = self.client.get(reverse('inventory_export', args=['30']), {'supplier': self.supplier.pk})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:3], ['id', 'name', 'supplier'])
+        self.assertEqual(rows[1:], [[
+            str(self.medicine.pk), 'Paracetamol', 'Acme', self.medicine.expiry_date.isoformat(), '10',
+            '2.50', '1.50', '25.00', '15.00',
+        ]])
+
+
+def concurrent_change(model, pk, status):
+    """Patch transitions so another request moves pk to status between a bulk action's read and its update."""
+    sources_for = transitions.sources_for
+    calls = []
+
+    def racing_sources_for(sender, target):
+        calls.append(target)
+        if len(calls) == 2:
+            model.objects.filter(pk=pk).update(status=status)
+        return sources_for(sender, target)
+
+    return mock.patch.object(transitions, 'sources_for', racing_sources_for)
+
+
+class BulkModerationTests(PharmacyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch, self.customer, self.medicine = make_catalog()
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.branch.staff.add(self.staff)
+        self.customer.user = User.objects.create_user('asha', password='x')
+        self.customer.save()
+        supplier = Supplier.objects.create(name='Acme', contact_person='Ravi', email='acme@example.com', phone='1')
+        self.requests = [
+            SupplierRequest.objects.create(supplier=supplier, medicine=self.medicine, branch=self.branch, quantity=5)
+            for _ in range(2)
+        ]
+        doctor = Doctor.objects.create(name='Dr. Mehta', specialization='GP')
+        self.appointments = [
+            Appointment.objects.create(customer=self.customer, doctor=doctor, date=timezone.now(), reason='Checkup')
+            for _ in range(2)
+        ]
+
+    def receive(self):
+        return self.client.post(reverse('supplier_request_bulk'), {'action': 'receive', 'selected': [r.pk for r in self.requests]})
+
+    def approve(self):
+        return self.client.post(reverse('appointment_bulk'), {'action': 'approve', 'selected': [a.pk for a in self.appointments]})
+
+    def statuses(self, rows):
+        return [type(row).objects.get(pk=row.pk).status for row in rows]
+
+    def test_customers_cannot_moderate(self):
+        waiting = User.objects.create_user('waiting', password='x', is_active=False)
+        self.client.force_login(self.customer.user)
+        self.receive()
+        self.approve()
+        self.client.post(reverse('pending_users_bulk'), {'action': 'approve', 'selected': [waiting.pk]})
+        self.assertEqual(self.statuses(self.requests), ['Pending', 'Pending'])
+        self.assertEqual(stock_levels(self.branch.pk)[self.medicine.pk], 10)
+        self.assertEqual(self.statuses(self.appointments), ['Pending', 'Pending'])
+        self.assertFalse(User.objects.get(pk=waiting.pk).is_active)
+
+    def test_staff_receive_adds_stock(self):
+        self.client.force_login(self.staff)
+        self.receive()
+        self.assertEqual(self.statuses(self.requests), ['Completed', 'Completed'])
+        self.assertEqual(stock_levels(self.branch.pk)[self.medicine.pk], 20)
+
+    def test_conflicting_receive_rolls_back(self):
+        self.client.force_login(self.staff)
+        with concurrent_change(SupplierRequest, self.requests[0].pk, 'Completed'):
+            self.receive()
+        # The racing update shares the view's transaction here, so it is rolled back with everything else
+        self.assertEqual(self.statuses(self.requests), ['Pending', 'Pending'])
+        self.assertEqual(stock_levels(self.branch.pk)[self.medicine.pk], 10)
+
+    def test_conflicting_approval_rolls_back(self):
+        self.client.force_login(self.staff)
+        with concurrent_change(Appointment, self.appointments[0].pk, 'Rejected'):
+            self.approve()
+        self.assertEqual(self.statuses(self.appointments), ['Pending', 'Pending'])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class RefusingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP server down')
+
+
+@plain_static
+class BranchScopeTests(PharmacyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branch, self.customer, self.medicine = make_catalog()
+        self.other = Branch.objects.create(name='Harbour')
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.branch.staff.add(staff)
+        self.client.force_login(staff)
+        self.order = Order.objects.create(customer=self.customer, branch=self.other, total_amount=Decimal('5.00'))
+        self.item = OrderItem.objects.create(order=self.order, medicine=self.medicine, quantity=2, unit_price=Decimal('2.50'), line_total=Decimal('5.00'))
+        Order.objects.create(customer=self.customer, branch=self.branch, total_amount=Decimal('7.50'))
+
+    def test_orders_at_other_branches_are_out_of_reach(self):
+        self.assertRedirects(self.client.get(reverse('order_invoice', args=[self.order.pk])), reverse('order_list'))
+        self.client.get(reverse('order_status', args=[self.order.pk, 'Cancelled']))
+        self.client.post(reverse('order_item_delete', args=[self.order.pk, self.item.pk]))
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'Pending')
+        self.assertTrue(OrderItem.objects.filter(pk=self.item.pk).exists())
+        self.assertEqual(stock_levels(self.branch.pk)[self.medicine.pk], 10)
+
+    def test_figures_only_count_own_branches(self):
+        dashboard = self.client.get(reverse('dashboard'))
+        self.assertEqual(dashboard.context['order_count'], 1)
+        self.assertEqual(dashboard.context['todays_revenue'], 7.5)
+        self.assertEqual([order.branch_id for order in dashboard.context['recent_orders']], [self.branch.pk])
+        report = self.client.get(reverse('sales_report'))
+        self.assertEqual(report.context['total_orders'], 1)
+        self.assertEqual(report.context['total_revenue'], Decimal('7.50'))
+
+
+class OutboxTests(PharmacyTestCase):
+    def test_rolled_back_transaction_queues_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            enqueue([('asha@example.com', 'Order #1 confirmed', 'Thanks')])
+            raise RuntimeError('order failed')
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_delivered_message_is_sent_once(self):
+        enqueue([('asha@example.com', 'Order #1 confirmed', 'Thanks')])
+        call_command('send_outbox', stdout=StringIO())
+        call_command('send_outbox', stdout=StringIO())
+        self.assertEqual([m.to for m in mail.outbox], [['asha@example.com']])
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), ('Sent', 0))
+        self.assertIsNotNone(message.sent_at)
+
+    def test_failed_send_is_retried_with_backoff(self):
+        enqueue([('asha@example.com', 'Order #1 confirmed', 'Thanks')])
+        with self.settings(EMAIL_BACKEND='pharmacy.tests.RefusingBackend'):
+            before = timezone.now()
+            self.assertEqual(dispatch_batch(), (0, 1))
+            message = OutboxMessage.objects.get()
+            self.assertEqual((message.status, message.attempts), ('Pending', 1))
+            self.assertIn('SMTP server down', message.last_error)
+            self.assertGreaterEqual(message.next_attempt_at, before + backoff(1))
+            # Not due again until the backoff has passed
+            self.assertEqual(dispatch_batch(), (0, 0))
+
+            retried = timezone.now()
+            OutboxMessage.objects.update(next_attempt_at=retried)
+            dispatch_batch()
+            message.refresh_from_db()
+            self.assertEqual(message.attempts, 2)
+            self.assertGreaterEqual(message.next_attempt_at, retried + backoff(2))
+            self.assertGreater(backoff(2), backoff(1))
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatch_batch(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_message_is_dead_after_max_attempts(self):
+        enqueue([('asha@example.com', 'Order #1 confirmed', 'Thanks')])
+        with self.settings(EMAIL_BACKEND='pharmacy.tests.RefusingBackend'):
+            for _ in range(3):
+                OutboxMessage.objects.update(next_attempt_at=timezone.now())
+                dispatch_batch(max_attempts=3)
+        self.assertEqual(OutboxMessage.objects.get().status, 'Dead')
+
+
+class DashboardStreamTests(PharmacyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+
+    def test_wsgi_fallback_serves_shared_snapshot(self):
+        with mock.patch.object(live, 'dashboard_counters', wraps=live.dashboard_counters) as recount:
+            for _ in range(3):
+                response = self.client.get(reverse('dashboard_stream'))
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(recount.call_count, 1)
+        body = response.content.decode()
+        self.assertTrue(body.startswith(f'retry: {live.REFRESH_SECONDS * 1000}\n'))
+        self.assertIn('"order_count": 0', body)
+
+
+@plain_static
+class AppointmentCalendarTests(PharmacyTestCase):
+    def test_impossible_day_shows_today(self):
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        Doctor.objects.create(name='Dr. Mehta', specialization='GP')
+        response = self.client.get(reverse('appointment_calendar'), {'day': '2020-02-30'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['selected'], timezone.localdate())
+
+    def test_days_at_the_ends_of_the_calendar_are_clamped(self):
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        Doctor.objects.create(name='Dr. Mehta', specialization='GP')
+        for day, selected in [('9999-12-31', date(9998, 12, 31)), ('0001-01-01', date(2, 1, 1))]:
+            response = self.client.get(reverse('appointment_calendar'), {'day': day})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['selected'], selected)
+
+
+@plain_static
+class SoftDeleteTests(PharmacyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_order_of_deleted_customer_still_renders(self):
+        branch, customer, medicine = make_catalog()
+        branch.staff.add(self.staff)
+        order = Order.objects.create(customer=customer, branch=branch, total_amount=medicine.price)
+        OrderItem.objects.create(order=order, medicine=medicine, quantity=1, unit_price=medicine.price, line_total=medicine.price)
+        with self.captureOnCommitCallbacks(execute=True):
+            soft_delete(customer)
+            soft_delete(medicine)
+        for name in ('order_detail', 'order_invoice'):
+            response = self.client.get(reverse(name, args=[order.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Asha')
+            self.assertContains(response, 'Paracetamol')
+        # Lookups of live rows still leave it out
+        with self.assertRaises(Customer.DoesNotExist):
+            customer_cache.get(customer.pk)
+
+    def test_bulk_approve_skips_users_queued_for_deletion(self):
+        waiting = User.objects.create_user('waiting', password='x', is_active=False)
+        leaving = User.objects.create_user('leaving', password='x', is_active=False)
+        UserDeletion.objects.create(user=leaving)
+        self.client.post(reverse('pending_users_bulk'), {'action': 'approve', 'selected': [waiting.pk, leaving.pk]})
+        self.assertTrue(User.objects.get(pk=waiting.pk).is_active)
+        self.assertFalse(User.objects.get(pk=leaving.pk).is_active)
+
+
+class ChangeFeedTests(PharmacyTestCase):
+    def test_archiving_leaves_no_tombstones(self):
+        _, customer, medicine = make_catalog()
+        long_ago = timezone.now() - timedelta(days=30)
+        order = Order.objects.create(customer=customer, status='Completed', order_date=long_ago)
+        OrderItem.objects.create(order=order, medicine=medicine, quantity=1, unit_price=medicine.price, line_total=medicine.price)
+        doctor = User.objects.create_user('doctor')
+        prescription = Prescription.objects.create(doctor=doctor, patient=User.objects.create_user('patient'), status='Dispensed')
+        PrescriptionItem.objects.create(prescription=prescription, medicine=medicine, dosage='1', frequency='daily', duration='5 days')
+        Prescription.objects.update(date_created=long_ago)
+
+        moved = archive_closed_records(days=7)
+        self.assertEqual((moved['orders'], moved['prescriptions']), (1, 1))
+        self.assertTrue(ArchivedOrder.objects.filter(pk=order.pk).exists())
+        self.assertTrue(ArchivedPrescription.objects.filter(pk=prescription.pk).exists())
+        self.assertFalse(ChangeTombstone.objects.exists())
+
+    def test_deletion_leaves_tombstone(self):
+        _, customer, _ = make_catalog()
+        pk = Order.objects.create(customer=customer).pk
+        Order.objects.get(pk=pk).delete()
+        self.assertQuerySetEqual(ChangeTombstone.objects.values_list('feed', 'key'), [('orders', str(pk))])
+
+
+class AdminSearchTests(PharmacyTestCase):
+    def search(self, model, term):
+        request = RequestFactory().get('/admin/', {'q': term})
+        return admin.site._registry[model].get_search_results(request, model.objects.all(), term)
+
+    def test_prefix_search_matches_by_index_range(self):
+        Medicine.objects.create(name='Paracetamol', description='', price=1)
+        Medicine.objects.create(name='Ibuprofen', description='', price=1)
+        results, may_have_duplicates = self.search(Medicine, 'Para')
+        self.assertQuerySetEqual(results.values_list('name', flat=True), ['Paracetamol'])
+        self.assertFalse(may_have_duplicates)
+        plan = results.explain()
+        self.assertIn('SEARCH pharmacy_medicine USING INDEX medicine_live_lower_name_idx (deleted_at=? AND <expr>>? AND <expr><?)', plan)
+        self.assertNotIn('LIKE', str(results.query))
+
+    def test_prefix_search_ignores_case(self):
+        Medicine.objects.create(name='Paracetamol', description='', price=1)
+        Medicine.objects.create(name='paroxetine', description='', price=1)
+        results, _ = self.search(Medicine, 'par')
+        self.assertQuerySetEqual(results.order_by('name').values_list('name', flat=True), ['Paracetamol', 'paroxetine'])
+        results, _ = self.search(Medicine, 'PARA')
+        self.assertQuerySetEqual(results.values_list('name', flat=True), ['Paracetamol'])
+
+    def test_changelist_search(self):
+        Customer.objects.create(name='Asha', email='asha@example.com', phone='100')
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        with plain_static:
+            response = self.client.get(reverse('admin:pharmacy_order_changelist'), {'q': 'As'})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(reverse('admin:pharmacy_customer_changelist'), {'q': 'As'})
+        self.assertContains(response, 'asha@example.com')
+
+    def test_numeric_term_looks_up_primary_key(self):
+        medicine = Medicine.objects.create(name='42 Tablets', description='', price=1)
+        results, _ = self.search(Medicine, str(medicine.pk))
+        self.assertQuerySetEqual(results, [medicine])
+
+
+# As the scale-out profile configures SQLite
+SCALE_OUT_OPTIONS = {'timeout': 30, 'transaction_mode': 'IMMEDIATE', 'init_command': 'PRAGMA journal_mode=WAL'}
+
+
+def _worker(path, options, start, results, target, args):
+    # Forked from the test process: drop its in-memory connection and open the shared file instead
+    connection.connection = None
+    connection.settings_dict.update(NAME=path, OPTIONS=options)
+    try:
+        start.wait()
+        results.put(target(*args))
+    except BaseException as exc:
+        results.put(exc)
+    finally:
+        connection.close()
+
+
+class MultiProcessTestCase(CacheIsolation, TransactionTestCase):
+    """
+    Runs workers in separate processes against a file copy of the test
+    database, so they contend for SQLite's write lock as worker processes do.
+    """
+    workers = 8
+
+    def shared_database(self):
+        path = os.path.join(tempfile.mkdtemp(), 'shared.sqlite3')
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        connection.connection.backup(target)
+        # Switched once here: workers switching it together on first connect would contend for the lock
+        target.execute('PRAGMA journal_mode=WAL')
+        target.close()
+        return path
+
+    def run_workers(self, path, target, *args, options=SCALE_OUT_OPTIONS, together=True):
+        """Start target(*args) in every worker at once, or one after another; return their results."""
+        context = multiprocessing.get_context('fork')
+        start, results = context.Barrier(self.workers if together else 1), context.Queue()
+        processes = [context.Process(target=_worker, args=(path, options, start, results, target, args)) for _ in range(self.workers)]
+        outcomes = []
+        for process in processes:
+            process.start()
+            if not together:
+                outcomes.append(results.get(timeout=60))
+                process.join()
+        if together:
+            outcomes = [results.get(timeout=60) for _ in processes]
+            for process in processes:
+                process.join()
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        return outcomes
+
+    def query(self, path, sql, *params):
+        with sqlite3.connect(path) as shared:
+            return shared.execute(sql, params).fetchone()
+
+
+def _claim_stock(branch_id, medicine_id, attempts):
+    claimed = 0
+    for _ in range(attempts):
+        try:
+            with transaction.atomic(), stock_atomic(branch_id):
+                take_stock(branch_id, {medicine_id: 1})
+            claimed += 1
+        except OutOfStock:
+            pass
+    return claimed
+
+
+def _cancel(order_id):
+    with transaction.atomic():
+        return transition(Order.objects.get(pk=order_id), 'Cancelled')
+
+
+class ConcurrentClaimTests(MultiProcessTestCase):
+    def test_stock_is_never_oversold(self):
+        branch, _, medicine = make_catalog()
+        set_stock(branch.pk, medicine.pk, 50)
+        path = self.shared_database()
+        # Transactions start deferred, so only the conditional UPDATE, not a lock taken at BEGIN, keeps workers apart
+        claimed = self.run_workers(path, _claim_stock, branch.pk, medicine.pk, 20, options={**SCALE_OUT_OPTIONS, 'transaction_mode': 'DEFERRED'})
+        self.assertEqual(sum(claimed), 50)
+        self.assertEqual(self.query(path, 'SELECT quantity FROM pharmacy_branchstock WHERE medicine_id = ?', medicine.pk), (0,))
+
+    def test_status_moves_once(self):
+        _, customer, _ = make_catalog()
+        order = Order.objects.create(customer=customer)
+        path = self.shared_database()
+        self.assertEqual(sorted(self.run_workers(path, _cancel, order.pk)), [False] * (self.workers - 1) + [True])
+        self.assertEqual(self.query(path, 'SELECT status FROM pharmacy_order WHERE id = ?', order.pk), ('Cancelled',))
+
+
+def _buy(session, medicine_id, attempts, key=None):
+    client = Client(HTTP_IDEMPOTENCY_KEY=key) if key else Client()
+    client.cookies['sessionid'] = session
+    return [client.post(reverse('buy_medicine', args=[medicine_id]), {'quantity': 1}).status_code for _ in range(attempts)]
+
+
+def _log_in(attempts):
+    client = Client(REMOTE_ADDR='203.0.113.7')
+    return [client.post(reverse('login'), {'username': 'nobody', 'password': 'wrong'}).status_code for _ in range(attempts)]
+
+
+@plain_static
+class ScaleOutTests(MultiProcessTestCase):
+    """Worker processes sharing one database file and one file cache, as under the scale-out profile."""
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.mkdtemp(),
+        }}))
+        self.branch, customer, self.medicine = make_catalog()
+        customer.user = User.objects.create_user('asha', password='x')
+        customer.save()
+        # Logged in here, so every worker only finds the session through the shared database and cache
+        self.client.force_login(customer.user)
+        self.session = self.client.cookies['sessionid'].value
+
+    def orders(self, path):
+        return self.query(path, 'SELECT COUNT(*) FROM pharmacy_order')[0]
+
+    @override_settings(RATE_LIMITS={})
+    def test_concurrent_buys_never_oversell(self):
+        set_stock(self.branch.pk, self.medicine.pk, 20)
+        path = self.shared_database()
+        statuses = [status for worker in self.run_workers(path, _buy, self.session, self.medicine.pk, 5) for status in worker]
+        # 302 to the new order, or the purchase form again once stock ran out
+        self.assertEqual(sorted(set(statuses)), [200, 302])
+        self.assertEqual(statuses.count(302), 20)
+        self.assertEqual(self.orders(path), 20)
+        self.assertEqual(self.query(path, 'SELECT quantity FROM pharmacy_branchstock WHERE medicine_id = ?', self.medicine.pk), (0,))
+
+    @override_settings(RATE_LIMITS={})
+    def test_idempotency_key_is_shared(self):
+        path = self.shared_database()
+        statuses = self.run_workers(path, _buy, self.session, self.medicine.pk, 1, 'checkout-1')
+        self.assertEqual(statuses, [[302]] * self.workers)
+        self.assertEqual(self.orders(path), 1)
+
+    def test_rate_limit_is_shared(self):
+        path = self.shared_database()
+        statuses = [status for worker in self.run_workers(path, _log_in, 2, together=False) for status in worker]
+        # Buckets kept per process would let all 16 through
+        self.assertEqual(len(statuses) - statuses.count(429), 5)
+
+
+class ClientKeyTests(PharmacyTestCase):
+    def key(self, forwarded_for, remote_addr='10.0.0.2'):
+        request = RequestFactory().post('/login/', REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for)
+        request.user = mock.Mock(is_authenticated=False)
+        return client_key(request)
+
+    @override_settings(PROXY_HOPS=1)
+    def test_behind_proxy_keys_on_address_the_proxy_saw(self):
+        self.assertEqual(self.key('198.51.100.4'), 'ip:198.51.100.4')
+        self.assertNotEqual(self.key('198.51.100.4'), self.key('198.51.100.5'))
+        # Entries left of the proxy's own come from the client and are ignored
+        self.assertEqual(self.key('1.2.3.4, 198.51.100.4'), 'ip:198.51.100.4')
+        self.assertEqual(self.key(''), 'ip:10.0.0.2')
+
+    @override_settings(PROXY_HOPS=0)
+    def test_without_proxy_ignores_forwarded_for(self):
+        self.assertEqual(self.key('198.51.100.4'), 'ip:10.0.0.2')
@@ -0,0 +1,71 @@
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Appointment, Order, Prescription, SupplierRequest
+
+# Allowed status changes per model: {current status: {statuses it may move to}}
+TRANSITIONS = {
+    Order: {
+        'Pending': {'Completed', 'Cancelled'},
+    },
+    Appointment: {
+        'Pending': {'Approved', 'Rejected'},
+        'Approved': {'Completed'},
+    },
+    Prescription: {
+        'Pending': {'Approved', 'Rejected'},
+        'Approved': {'Dispensed', 'Rejected'},
+    },
+    SupplierRequest: {
+        'Pending': {'Completed'},
+    },
+}
+
+# Sent once per row that actually changed status, inside the caller's transaction
+status_changed = Signal()  # sender=model, pks, target
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def sources_for(model, target):
+    """Statuses of model that may move to target."""
+    sources = [source for source, targets in TRANSITIONS[model].items() if target in targets]
+    if not sources:
+        raise InvalidTransition(f'{model.__name__} cannot move to {target!r}.')
+    return sources
+
+
+def transition(instance, target):
+    """
+    Move instance to target with a conditional UPDATE ... WHERE status IN (...).
+
+    Returns True only for the caller whose UPDATE changed the row, so side
+    effects guarded by it run once even when the same action is submitted
+    twice concurrently. Call it inside transaction.atomic() together with
+    those side effects.
+    """
+    model = type(instance)
+    updated = model.objects.filter(pk=instance.pk, status__in=sources_for(model, target)).update(status=target, updated_at=timezone.now())
+    if updated != 1:
+        return False
+    instance.status = target
+    status_changed.send(sender=model, pks=[instance.pk], target=target)
+    return True
+
+
+def transition_queryset(queryset, target):
+    """Move every row of queryset that may go to target, returning the pks that changed."""
+    model = queryset.model
+    candidates = queryset.filter(status__in=sources_for(model, target))
+    pks = list(candidates.values_list('pk', flat=True))
+    if not pks:
+        return []
+    updated = model.objects.filter(pk__in=pks, status__in=sources_for(model, target)).update(status=target, updated_at=timezone.now())
+    if updated != len(pks):
+        # Another request moved part of the selection first. Raising rolls back
+        # the caller's transaction instead of running side effects for rows it did not change
+        raise InvalidTransition(f'{len(pks) - updated} {model._meta.verbose_name_plural} changed concurrently.')
+    status_changed.send(sender=model, pks=pks, target=target)
+    return pks
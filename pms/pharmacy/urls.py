@@ -4,12 +4,18 @@ from django.contrib.auth import views as auth_views
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
+    path('dashboard/stream/', views.dashboard_stream, name='dashboard_stream'),
+    path('branches/', views.branch_list, name='branch_list'),
+    path('branches/new/', views.branch_create, name='branch_create'),
+    path('branches/<int:pk>/edit/', views.branch_update, name='branch_update'),
+    path('branches/switch/', views.switch_branch, name='switch_branch'),
     path('login/', auth_views.LoginView.as_view(template_name='pharmacy/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     
     # Medicines
     path('medicines/', views.medicine_list, name='medicine_list'),
     path('medicines/add/', views.medicine_create, name='medicine_create'),
+    path('medicines/prices/', views.price_revision, name='price_revision'),
     path('medicines/<int:pk>/edit/', views.medicine_update, name='medicine_update'),
     path('medicines/<int:pk>/delete/', views.medicine_delete, name='medicine_delete'),
 
@@ -40,9 +46,11 @@ urlpatterns = [
     path('shop/', views.customer_medicine_list, name='customer_medicine_list'),
     path('shop/buy/<int:pk>/', views.buy_medicine, name='buy_medicine'),
     path('appointments/', views.appointment_list, name='appointment_list'),
+    path('appointments/calendar/', views.appointment_calendar, name='appointment_calendar'),
     path('appointments/book/', views.book_appointment, name='book_appointment'),
     path('appointments/<int:pk>/approve/', views.appointment_approve, name='appointment_approve'),
     path('appointments/<int:pk>/reject/', views.appointment_reject, name='appointment_reject'),
+    path('appointments/bulk/', views.appointment_bulk, name='appointment_bulk'),
     path('profile/', views.customer_profile, name='customer_profile'),
     path('profile/change-password/', views.change_password, name='change_password'),
 
@@ -62,6 +70,7 @@ urlpatterns = [
     path('requests/', views.supplier_request_list, name='supplier_request_list'),
     path('requests/add/', views.supplier_request_create, name='supplier_request_create'),
     path('requests/<int:pk>/status/<str:status>/', views.supplier_request_status, name='supplier_request_status'),
+    path('requests/bulk/', views.supplier_request_bulk, name='supplier_request_bulk'),
 
     # Staff Management
     path('staff/', views.staff_list, name='staff_list'),
@@ -70,6 +79,9 @@ urlpatterns = [
 
     # Reports
     path('reports/sales/', views.sales_report, name='sales_report'),
+    path('reports/analytics/', views.sales_analytics, name='sales_analytics'),
+    path('reports/inventory/', views.inventory_report, name='inventory_report'),
+    path('reports/inventory/<str:bucket>.csv', views.inventory_export, name='inventory_export'),
 
     # Prescriptions
     path('prescriptions/', views.prescription_list, name='prescription_list'),
@@ -81,4 +93,17 @@ urlpatterns = [
     path('users/pending/', views.pending_users_list, name='pending_users_list'),
     path('users/<int:pk>/approve/', views.approve_user, name='approve_user'),
     path('users/<int:pk>/reject/', views.reject_user, name='reject_user'),
+    path('users/pending/bulk/', views.pending_users_bulk, name='pending_users_bulk'),
+
+    # Autocomplete
+    path('api/autocomplete/<str:source>/', views.autocomplete, name='autocomplete'),
+
+    # Offline terminal sync
+    path('api/sync/sales/', views.sync_sales, name='sync_sales'),
+    path('api/sync/catalog/', views.sync_catalog, name='sync_catalog'),
+    path('api/sync/stock/', views.sync_stock, name='sync_stock'),
+    # Incremental change feed for downstream copies
+    path('api/changes/<str:feed>/', views.change_feed, name='change_feed'),
+    path('api/cache-stats/', views.cache_stats, name='cache_stats'),
+    path('api/rate-limits/', views.rate_limit_stats, name='rate_limit_stats'),
 ]
@@ -1,107 +1,241 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, update_session_auth_hash
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET, require_POST
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_date
+from django.utils.http import url_has_allowed_host_and_scheme
+import asyncio
+from asgiref.sync import sync_to_async
+import json
+from datetime import MAXYEAR, MINYEAR, date, timedelta
+from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Sum, Count
 from django.db.models.functions import TruncDate
 from django.forms import inlineformset_factory
-from .models import Medicine, Supplier, Customer, Order, OrderItem, Appointment, Doctor, SupplierRequest, Prescription, PrescriptionItem, DoctorSchedule
-from .forms import MedicineForm, SupplierForm, CustomerForm, OrderForm, OrderItemForm, UserRegistrationForm, AppointmentForm, DoctorForm, SupplierRequestForm, StaffRegistrationForm, PrescriptionForm, PrescriptionItemForm, DoctorScheduleForm
+from .models import Branch, Medicine, Supplier, Customer, Order, OrderItem, Appointment, Doctor, SupplierRequest, Prescription, PrescriptionItem, DoctorSchedule
+from .analytics import sales_cube
+from .archive import archived_daily_sales, orders_reach_archive
+from .autocomplete import AUTOCOMPLETE_INDEXES
+from .backends import invalidate_user
+from .branches import (
+    LOW_STOCK_LEVEL, OutOfStock, branch_stock_summary, put_stock, set_stock, stock_atomic, stock_levels, stock_rows,
+    take_stock,
+)
+from .calendars import day_range, month_grid, week_range
+from .changefeed import FEED_PAGE_SIZE, FEEDS, changes as feed_changes
+from .facets import facet_page, invalidate_facets
+from .idempotency import idempotent
+from .inventory import BUCKETS, bucket_csv, valuation
+from .live import REFRESH_SECONDS, dashboard_counters, dashboard_publisher, shared_counters
+from .middleware import BRANCH_SESSION_KEY, ensure_customer_id, invalidate_role
+from .notifications import notify_appointments, notify_order_placed, notify_supplier_request
+from .objcache import OBJECT_CACHES, customer_cache, doctor_cache, fill_related, medicine_cache
+from .pricing import record_price_change, revise_prices
+from .purge import delete_user_later, soft_delete
+from .ratelimit import rejected_counts
+from .recommendations import also_bought
+from .sync import SyncError, apply_sales, catalog_changes, stock_changes
+from .transitions import InvalidTransition, transition, transition_queryset
+from .forms import BranchForm, MedicineForm, SupplierForm, CustomerForm, OrderForm, OrderItemForm, UserRegistrationForm, AppointmentForm, DoctorForm, SupplierRequestForm, StaffRegistrationForm, PrescriptionForm, PrescriptionItemForm, DoctorScheduleForm, PriceRevisionForm, OrderFilterForm, AppointmentFilterForm
 
 @login_required
 def dashboard(request):
     # Redirect doctors to their own dashboard
-    if hasattr(request.user, 'doctor'):
+    if request.doctor_id:
         return redirect('doctor_dashboard')
 
     # Redirect customers to their own dashboard
     if not request.user.is_staff:
         return render(request, 'pharmacy/customer_dashboard.html')
 
-    medicine_count = Medicine.objects.count()
-    supplier_count = Supplier.objects.count()
-    customer_count = Customer.objects.count()
-    order_count = Order.objects.count()
-    
     # Alert for medicines expiring in the next 30 days
     expiring_medicines = Medicine.objects.filter(expiry_date__lte=timezone.now().date() + timedelta(days=30), expiry_date__gte=timezone.now().date())
     
-    # Alert for medicines with low stock (e.g., less than 10)
-    low_stock_medicines = Medicine.objects.filter(quantity__lte=10)
-
-    # Pending Approvals / Admin Actions
-    pending_orders_count = Order.objects.filter(status='Pending').count()
-    pending_requests_count = SupplierRequest.objects.filter(status='Pending').count()
-    pending_prescriptions_count = Prescription.objects.filter(status='Pending').count()
-    pending_appointments_count = Appointment.objects.filter(status='Pending').count()
-
-    # Analytics (Today's Snapshot)
-    today = timezone.now().date()
-    todays_revenue = Order.objects.filter(order_date__date=today).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    todays_orders_count = Order.objects.filter(order_date__date=today).count()
-
-    # Chart Data (Last 7 Days)
-    seven_days_ago = today - timedelta(days=6)
-    sales_data = Order.objects.filter(order_date__date__gte=seven_days_ago)\
-        .annotate(date=TruncDate('order_date'))\
-        .values('date')\
-        .annotate(revenue=Sum('total_amount'))\
-        .order_by('date')
-    
-    sales_dict = {item['date']: item['revenue'] for item in sales_data}
-    chart_labels = []
-    chart_data = []
-    
-    for i in range(7):
-        day = seven_days_ago + timedelta(days=i)
-        chart_labels.append(day.strftime('%b %d'))
-        chart_data.append(float(sales_dict.get(day, 0)))
+    # Alert for medicines with low stock at the current branch
+    low_stock = stock_rows(request.branch_id).filter(quantity__lte=LOW_STOCK_LEVEL)\
+        .order_by('quantity').values_list('medicine_id', 'quantity')[:3] if request.branch_id else []
+    names = dict(Medicine.objects.filter(pk__in=[pk for pk, _ in low_stock]).values_list('pk', 'name'))
+    low_stock_medicines = [{'name': names.get(pk), 'quantity': quantity} for pk, quantity in low_stock]
+
+    # Counts, today's snapshot and the last 7 days chart; the same numbers are pushed live by dashboard_stream
+    branch_ids = [pk for pk, _ in request.branches]
+    counters = dashboard_counters(branch_ids)
 
     # Activity Logs (Recent Orders)
-    recent_orders = Order.objects.select_related('customer').order_by('-order_date')[:5]
+    recent_orders = Order.objects.filter(branch_id__in=branch_ids).select_related('customer').order_by('-order_date')[:5]
 
     context = {
-        'medicine_count': medicine_count,
-        'supplier_count': supplier_count,
-        'customer_count': customer_count,
-        'order_count': order_count,
+        **counters,
         'expiring_medicines': expiring_medicines,
         'low_stock_medicines': low_stock_medicines,
-        'pending_orders_count': pending_orders_count,
-        'pending_requests_count': pending_requests_count,
-        'pending_prescriptions_count': pending_prescriptions_count,
-        'pending_appointments_count': pending_appointments_count,
-        'todays_revenue': todays_revenue,
-        'todays_orders_count': todays_orders_count,
-        'chart_labels': chart_labels,
-        'chart_data': chart_data,
         'recent_orders': recent_orders,
     }
     return render(request, 'pharmacy/dashboard.html', context)
 
+# Comment line sent when nothing changed, so proxies do not close an idle stream
+SSE_KEEPALIVE_SECONDS = 15
+
+async def dashboard_stream(request):
+    user = await request.auser()
+    if not user.is_staff:
+        return HttpResponseForbidden()
+
+    if not isinstance(request, ASGIRequest):
+        # Live push needs the ASGI application (pms.asgi). A WSGI worker would
+        # buffer an endless stream, so it sends the shared snapshot once and the
+        # browser reconnects when that is due to be refreshed; open dashboards
+        # never cost a recount each
+        counters = await sync_to_async(shared_counters)([pk for pk, _ in request.branches])
+        response = HttpResponse(f'retry: {REFRESH_SECONDS * 1000}\n\ndata: {json.dumps(counters)}\n\n', content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    async def events():
+        subscription = await dashboard_publisher.subscribe([pk for pk, _ in request.branches])
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    delta = await asyncio.wait_for(subscription.next(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                else:
+                    yield f'data: {json.dumps(delta)}\n\n'
+        finally:
+            dashboard_publisher.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# Upcoming appointments shown per page on the doctor dashboard
+UPCOMING_PAGE_SIZE = 10
+
 @login_required
 def doctor_dashboard(request):
-    if not hasattr(request.user, 'doctor'):
+    if not request.doctor_id:
         return redirect('dashboard')
     
-    doctor = request.user.doctor
-    today = timezone.now().date()
+    doctor = doctor_cache.get_or_404(request.doctor_id)
+    today_start, today_end = day_range(timezone.localdate())
     
-    # Appointments for today and upcoming
-    todays_appointments = Appointment.objects.filter(doctor=doctor, date__date=today).order_by('date')
-    upcoming_appointments = Appointment.objects.filter(doctor=doctor, date__date__gt=today).order_by('date')
+    # Appointments for today and upcoming, as datetime ranges so the (doctor, date) index is used
+    todays_appointments = Appointment.objects.filter(doctor=doctor, date__gte=today_start, date__lt=today_end)\
+        .select_related('customer').order_by('date')
+    upcoming = Appointment.objects.filter(doctor=doctor, date__gte=today_end).select_related('customer').order_by('date', 'id')
+    upcoming_page = Paginator(upcoming, UPCOMING_PAGE_SIZE).get_page(request.GET.get('page'))
     
     context = {
         'doctor': doctor,
         'todays_appointments': todays_appointments,
-        'upcoming_appointments': upcoming_appointments,
+        'upcoming_appointments': upcoming_page,
     }
     return render(request, 'pharmacy/doctor_dashboard.html', context)
 
+@login_required
+def appointment_calendar(request):
+    if request.user.is_staff:
+        doctors = Doctor.objects.order_by('name').only('id', 'name')
+        doctor_id = request.GET.get('doctor', '')
+        doctor = get_object_or_404(Doctor, pk=doctor_id) if doctor_id.isdigit() else doctors.first()
+    elif request.doctor_id:
+        doctors = None
+        doctor = doctor_cache.get_or_404(request.doctor_id)
+    else:
+        return redirect('dashboard')
+    if doctor is None:
+        messages.info(request, 'Add a doctor to see the appointment calendar.')
+        return redirect('doctor_list')
+
+    today = timezone.localdate()
+    # Keep a year of margin so the grid, week and month links never step outside what dates can hold
+    selected = min(max(_query_date(request, 'day') or today, date(MINYEAR + 1, 1, 1)), date(MAXYEAR - 1, 12, 31))
+    month = selected.replace(day=1)
+    week_start, week_end = week_range(selected)
+    week_appointments = Appointment.objects.filter(doctor=doctor, date__gte=week_start, date__lt=week_end)\
+        .select_related('customer').order_by('date')
+
+    context = {
+        'doctor': doctor,
+        'doctors': doctors,
+        'today': today,
+        'selected': selected,
+        'month': month,
+        'previous_month': (month - timedelta(days=1)).replace(day=1),
+        'next_month': (month + timedelta(days=31)).replace(day=1),
+        'weeks': month_grid(doctor.pk, month.year, month.month),
+        'week_start': timezone.localtime(week_start).date(),
+        'week_appointments': week_appointments,
+    }
+    return render(request, 'pharmacy/appointment_calendar.html', context)
+
+def _with_stock(medicines, branch_id):
+    # Stock lives apart from the catalog, possibly in another database
+    medicines = list(medicines)
+    levels = stock_levels(branch_id, [m.pk for m in medicines])
+    for medicine in medicines:
+        medicine.quantity = levels.get(medicine.pk, 0)
+    return medicines
+
+def _require_branch(request):
+    if request.branch_id is None:
+        messages.error(request, 'You are not assigned to a branch yet.')
+        return False
+    return True
+
+@login_required
+@require_POST
+def switch_branch(request):
+    branch = request.POST.get('branch', '')
+    if branch.isdigit() and int(branch) in [pk for pk, _ in request.branches]:
+        request.session[BRANCH_SESSION_KEY] = int(branch)
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('dashboard')
+
+@login_required
+def branch_list(request):
+    if not request.user.is_superuser:
+        return redirect('dashboard')
+    return render(request, 'pharmacy/branch_list.html', {'branches': branch_stock_summary()})
+
+@login_required
+def branch_create(request):
+    if not request.user.is_superuser:
+        return redirect('dashboard')
+    if request.method == 'POST':
+        form = BranchForm(request.POST)
+        if form.is_valid():
+            form.save()
+            return redirect('branch_list')
+    else:
+        form = BranchForm()
+    return render(request, 'pharmacy/generic_form.html', {'form': form, 'title': 'Add Branch'})
+
+@login_required
+def branch_update(request, pk):
+    if not request.user.is_superuser:
+        return redirect('dashboard')
+    branch = get_object_or_404(Branch, pk=pk)
+    if request.method == 'POST':
+        form = BranchForm(request.POST, instance=branch)
+        if form.is_valid():
+            form.save()
+            return redirect('branch_list')
+    else:
+        form = BranchForm(instance=branch)
+    return render(request, 'pharmacy/generic_form.html', {'form': form, 'title': 'Edit Branch'})
+
 @login_required
 def medicine_list(request):
     query = request.GET.get('q')
@@ -109,14 +243,18 @@ def medicine_list(request):
         medicines = Medicine.objects.filter(name__icontains=query)
     else:
         medicines = Medicine.objects.all()
-    return render(request, 'pharmacy/medicine_list.html', {'medicines': medicines})
+    return render(request, 'pharmacy/medicine_list.html', {'medicines': _with_stock(medicines, request.branch_id)})
 
 @login_required
 def medicine_create(request):
+    if not _require_branch(request):
+        return redirect('medicine_list')
     if request.method == 'POST':
         form = MedicineForm(request.POST)
         if form.is_valid():
-            form.save()
+            with transaction.atomic(), stock_atomic(request.branch_id):
+                medicine = form.save()
+                set_stock(request.branch_id, medicine.pk, form.cleaned_data['quantity'])
             return redirect('medicine_list')
     else:
         form = MedicineForm()
@@ -125,20 +263,54 @@ def medicine_create(request):
 @login_required
 def medicine_update(request, pk):
     medicine = get_object_or_404(Medicine, pk=pk)
+    if not _require_branch(request):
+        return redirect('medicine_list')
     if request.method == 'POST':
+        old_price = medicine.price
         form = MedicineForm(request.POST, instance=medicine)
         if form.is_valid():
-            form.save()
+            with transaction.atomic(), stock_atomic(request.branch_id):
+                form.save()
+                record_price_change(medicine, old_price, request.user)
+                set_stock(request.branch_id, medicine.pk, form.cleaned_data['quantity'])
             return redirect('medicine_list')
     else:
-        form = MedicineForm(instance=medicine)
+        form = MedicineForm(instance=medicine, initial={'quantity': stock_levels(request.branch_id, [medicine.pk]).get(medicine.pk, 0)})
     return render(request, 'pharmacy/generic_form.html', {'form': form, 'title': 'Edit Medicine'})
 
+@login_required
+@idempotent
+def price_revision(request):
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    matched = None
+    if request.method == 'POST':
+        form = PriceRevisionForm(request.POST)
+        if form.is_valid():
+            medicines = form.medicines()
+            if 'apply' not in request.POST:
+                matched = medicines.count()
+            else:
+                change = form.cleaned_data['change']
+                kind = form.cleaned_data['change_type']
+                changed = revise_prices(
+                    medicines,
+                    percent=change if kind == 'percent' else None,
+                    amount=change if kind == 'amount' else None,
+                    user=request.user,
+                    reason=form.cleaned_data['reason'],
+                )
+                messages.success(request, f'{changed} prices revised.')
+                return redirect('medicine_list')
+    else:
+        form = PriceRevisionForm()
+    return render(request, 'pharmacy/price_revision.html', {'form': form, 'matched': matched})
+
 @login_required
 def medicine_delete(request, pk):
     medicine = get_object_or_404(Medicine, pk=pk)
     if request.method == 'POST':
-        medicine.delete()
+        soft_delete(medicine)
         return redirect('medicine_list')
     return render(request, 'pharmacy/generic_confirm_delete.html', {'object': medicine, 'title': 'Medicine'})
 
@@ -174,7 +346,7 @@ def supplier_update(request, pk):
 def supplier_delete(request, pk):
     supplier = get_object_or_404(Supplier, pk=pk)
     if request.method == 'POST':
-        supplier.delete()
+        soft_delete(supplier)
         return redirect('supplier_list')
     return render(request, 'pharmacy/generic_confirm_delete.html', {'object': supplier, 'title': 'Supplier'})
 
@@ -210,41 +382,54 @@ def customer_update(request, pk):
 def customer_delete(request, pk):
     customer = get_object_or_404(Customer, pk=pk)
     if request.method == 'POST':
-        customer.delete()
+        soft_delete(customer)
         return redirect('customer_list')
     return render(request, 'pharmacy/generic_confirm_delete.html', {'object': customer, 'title': 'Customer'})
 
 @login_required
 def order_list(request):
+    form = OrderFilterForm(request.GET)
     if request.user.is_staff:
-        orders = Order.objects.all().order_by('-order_date')
+        orders = Order.objects.filter(branch_id=request.branch_id)
     else:
-        if hasattr(request.user, 'customer'):
-            orders = Order.objects.filter(customer=request.user.customer).order_by('-order_date')
+        del form.fields['customer']
+        if request.customer_id:
+            orders = Order.objects.filter(customer_id=request.customer_id)
         else:
             orders = Order.objects.none()
-    return render(request, 'pharmacy/order_list.html', {'orders': orders})
+    page, facets = facet_page(request, orders.select_related('customer').order_by('-order_date', '-pk'), form)
+    return render(request, 'pharmacy/order_list.html', {'orders': page, 'form': form, 'facets': facets})
 
 @login_required
+@idempotent
 def order_create(request):
+    if not _require_branch(request):
+        return redirect('order_list')
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
-            order = form.save()
+            order = form.save(commit=False)
+            order.branch_id = request.branch_id
+            order.save()
             return redirect('order_detail', pk=order.pk)
     else:
         form = OrderForm()
     return render(request, 'pharmacy/generic_form.html', {'form': form, 'title': 'Create Order'})
 
 @login_required
+@idempotent
 def order_detail(request, pk):
     order = get_object_or_404(Order, pk=pk)
     
     if not request.user.is_staff:
-        if hasattr(request.user, 'customer') and order.customer != request.user.customer:
+        if request.customer_id and order.customer_id != request.customer_id:
             return redirect('dashboard')
+    elif order.branch_id not in [pk for pk, _ in request.branches]:
+        return redirect('order_list')
 
-    items = order.items.all()
+    # Orders outlive a soft-deleted customer
+    order.customer = customer_cache.get(order.customer_id, include_deleted=True)
+    items = fill_related(order.items.all(), 'medicine', medicine_cache)
     form = None
 
     if request.user.is_staff:
@@ -252,16 +437,18 @@ def order_detail(request, pk):
             form = OrderItemForm(request.POST)
             if form.is_valid():
                 item = form.save(commit=False)
-                if item.medicine.quantity >= item.quantity:
-                    item.order = order
-                    item.medicine.quantity -= item.quantity
-                    item.medicine.save()
-                    item.save()
-                    order.total_amount += item.medicine.price * item.quantity
-                    order.save()
-                    return redirect('order_detail', pk=order.pk)
-                else:
+                try:
+                    with transaction.atomic(), stock_atomic(order.branch_id):
+                        take_stock(order.branch_id, {item.medicine_id: item.quantity})
+                        item.order = order
+                        item.unit_price = item.medicine.price
+                        item.line_total = item.unit_price * item.quantity
+                        item.save()
+                        update_total(order)
+                except OutOfStock:
                     form.add_error('quantity', 'Not enough stock available.')
+                else:
+                    return redirect('order_detail', pk=order.pk)
         else:
             form = OrderItemForm()
             
@@ -270,43 +457,65 @@ def order_detail(request, pk):
 @login_required
 def order_invoice(request, pk):
     order = get_object_or_404(Order, pk=pk)
-    items = order.items.all()
+    if not request.user.is_staff:
+        if request.customer_id and order.customer_id != request.customer_id:
+            return redirect('dashboard')
+    elif order.branch_id not in [pk for pk, _ in request.branches]:
+        return redirect('order_list')
+    # Orders outlive a soft-deleted customer
+    order.customer = customer_cache.get(order.customer_id, include_deleted=True)
+    items = fill_related(order.items.all(), 'medicine', medicine_cache)
     return render(request, 'pharmacy/invoice.html', {'order': order, 'items': items})
 
+def update_total(order):
+    # Summed from the price snapshots on the lines, never from current prices
+    order.total_amount = order.items.aggregate(total=Sum('line_total'))['total'] or 0
+    order.save(update_fields=['total_amount', 'updated_at'])
+
+def restock_items(order):
+    # One F() increment per medicine at the order's branch, so concurrent sales are not overwritten
+    returned = order.items.values('medicine_id').annotate(total=Sum('quantity'))
+    with stock_atomic(order.branch_id):
+        put_stock(order.branch_id, {row['medicine_id']: row['total'] for row in returned})
+
 @login_required
 def order_status(request, pk, status):
     order = get_object_or_404(Order, pk=pk)
     
     # Security check: Customers can only cancel their own orders
     if not request.user.is_staff:
-        if not hasattr(request.user, 'customer') or order.customer != request.user.customer:
+        if not request.customer_id or order.customer_id != request.customer_id:
             return redirect('order_list')
         if status != 'Cancelled':
             return redirect('order_list')
+    elif order.branch_id not in [pk for pk, _ in request.branches]:
+        return redirect('order_list')
 
     # Only allow changing status if it is currently Pending
-    if order.status == 'Pending':
-        if status == 'Cancelled':
-            # Restore stock for all items in the order
-            for item in order.items.all():
-                item.medicine.quantity += item.quantity
-                item.medicine.save()
-        order.status = status
-        order.save()
+    try:
+        with transaction.atomic():
+            if transition(order, status) and status == 'Cancelled':
+                # Restore stock for all items in the order
+                restock_items(order)
+    except InvalidTransition:
+        messages.error(request, f'Orders cannot be marked as {status}.')
     return redirect('order_list')
 
 @login_required
 def order_item_delete(request, order_pk, item_pk):
     order = get_object_or_404(Order, pk=order_pk)
+    # Only staff at the order's branch edit its lines, as on order_detail
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    if order.branch_id not in [pk for pk, _ in request.branches]:
+        return redirect('order_list')
     item = get_object_or_404(OrderItem, pk=item_pk, order=order)
     if request.method == 'POST':
-        # Restore stock
-        item.medicine.quantity += item.quantity
-        item.medicine.save()
-        # Update order total
-        order.total_amount -= item.medicine.price * item.quantity
-        order.save()
-        item.delete()
+        with transaction.atomic(), stock_atomic(order.branch_id):
+            # Restore stock
+            put_stock(order.branch_id, {item.medicine_id: item.quantity})
+            item.delete()
+            update_total(order)
         return redirect('order_detail', pk=order.pk)
     return render(request, 'pharmacy/generic_confirm_delete.html', {'object': item, 'title': 'Order Item'})
 
@@ -353,30 +562,33 @@ def customer_medicine_list(request):
         medicines = Medicine.objects.filter(name__icontains=query)
     else:
         medicines = Medicine.objects.all()
-    is_doctor = hasattr(request.user, 'doctor')
-    return render(request, 'pharmacy/customer_medicine_list.html', {'medicines': medicines, 'is_doctor': is_doctor})
+    is_doctor = bool(request.doctor_id)
+    return render(request, 'pharmacy/customer_medicine_list.html', {'medicines': _with_stock(medicines, request.branch_id), 'is_doctor': is_doctor})
 
 @login_required
+@idempotent
 def buy_medicine(request, pk):
-    medicine = get_object_or_404(Medicine, pk=pk)
+    medicine = medicine_cache.get_or_404(pk)
+    branch_id = request.branch_id
+    if branch_id is None:
+        messages.error(request, 'No branch is open for orders yet.')
+        return redirect('customer_medicine_list')
     if request.method == 'POST':
         quantity = int(request.POST.get('quantity', 1))
-        if medicine.quantity >= quantity:
-            # Ensure user has a customer profile
-            customer, created = Customer.objects.get_or_create(
-                user=request.user,
-                defaults={'name': request.user.username, 'email': request.user.email, 'phone': ''}
-            )
-            
-            order = Order.objects.create(customer=customer, total_amount=medicine.price * quantity)
-            OrderItem.objects.create(order=order, medicine=medicine, quantity=quantity)
-            
-            medicine.quantity -= quantity
-            medicine.save()
-            return redirect('order_detail', pk=order.pk)
-        else:
+        # Ensure user has a customer profile
+        customer_id = ensure_customer_id(request)
+        try:
+            with transaction.atomic(), stock_atomic(branch_id):
+                take_stock(branch_id, {medicine.pk: quantity})
+                order = Order.objects.create(customer_id=customer_id, branch_id=branch_id, total_amount=medicine.price * quantity)
+                OrderItem.objects.create(order=order, medicine=medicine, quantity=quantity, unit_price=medicine.price, line_total=order.total_amount)
+                notify_order_placed(order, [(medicine.name, quantity, order.total_amount)])
+        except OutOfStock:
             messages.error(request, 'Not enough stock available.')
-    return render(request, 'pharmacy/purchase_form.html', {'medicine': medicine})
+        else:
+            return redirect('order_detail', pk=order.pk)
+    medicine.quantity = stock_levels(branch_id, [medicine.pk]).get(medicine.pk, 0)
+    return render(request, 'pharmacy/purchase_form.html', {'medicine': medicine, 'also_bought': also_bought(medicine.pk)})
 
 @login_required
 def book_appointment(request):
@@ -384,11 +596,7 @@ def book_appointment(request):
         form = AppointmentForm(request.POST)
         if form.is_valid():
             appointment = form.save(commit=False)
-            customer, created = Customer.objects.get_or_create(
-                user=request.user,
-                defaults={'name': request.user.username, 'email': request.user.email, 'phone': ''}
-            )
-            appointment.customer = customer
+            appointment.customer_id = ensure_customer_id(request)
             appointment.status = 'Pending'
             appointment.save()
             messages.success(request, 'Appointment booked successfully! Please wait for approval.')
@@ -399,36 +607,71 @@ def book_appointment(request):
 
 @login_required
 def appointment_list(request):
+    form = AppointmentFilterForm(request.GET)
     if request.user.is_staff:
-        appointments = Appointment.objects.all().order_by('-date')
-    elif hasattr(request.user, 'doctor'):
-        appointments = Appointment.objects.filter(doctor=request.user.doctor).order_by('-date')
+        appointments = Appointment.objects.all()
+    elif request.doctor_id:
+        del form.fields['doctor']
+        appointments = Appointment.objects.filter(doctor_id=request.doctor_id)
     else:
-        customer, created = Customer.objects.get_or_create(
-            user=request.user,
-            defaults={'name': request.user.username, 'email': request.user.email, 'phone': ''}
-        )
-        appointments = Appointment.objects.filter(customer=customer).order_by('-date')
-    return render(request, 'pharmacy/appointment_list.html', {'appointments': appointments})
+        del form.fields['customer'], form.fields['doctor']
+        appointments = Appointment.objects.filter(customer_id=ensure_customer_id(request))
+    page, facets = facet_page(request, appointments.select_related('customer', 'doctor').order_by('-date', '-pk'), form)
+    return render(request, 'pharmacy/appointment_list.html', {'appointments': page, 'form': form, 'facets': facets})
 
 @login_required
 def appointment_approve(request, pk):
-    if not (request.user.is_staff or hasattr(request.user, 'doctor')):
+    if not (request.user.is_staff or request.doctor_id):
         return redirect('dashboard')
     appointment = get_object_or_404(Appointment, pk=pk)
-    appointment.status = 'Approved'
-    appointment.save()
-    messages.success(request, 'Appointment approved.')
+    with transaction.atomic():
+        approved = transition(appointment, 'Approved')
+        if approved:
+            notify_appointments([appointment.pk], 'Approved')
+    if approved:
+        messages.success(request, 'Appointment approved.')
+    else:
+        messages.error(request, 'Only pending appointments can be approved.')
     return redirect('appointment_list')
 
 @login_required
 def appointment_reject(request, pk):
-    if not (request.user.is_staff or hasattr(request.user, 'doctor')):
+    if not (request.user.is_staff or request.doctor_id):
         return redirect('dashboard')
     appointment = get_object_or_404(Appointment, pk=pk)
-    appointment.status = 'Rejected'
-    appointment.save()
-    messages.success(request, 'Appointment rejected.')
+    with transaction.atomic():
+        rejected = transition(appointment, 'Rejected')
+        if rejected:
+            notify_appointments([appointment.pk], 'Rejected')
+    if rejected:
+        messages.success(request, 'Appointment rejected.')
+    else:
+        messages.error(request, 'Only pending appointments can be rejected.')
+    return redirect('appointment_list')
+
+def _selected_ids(request):
+    return [int(pk) for pk in request.POST.getlist('selected') if pk.isdigit()]
+
+@login_required
+@require_POST
+def appointment_bulk(request):
+    if not (request.user.is_staff or request.doctor_id):
+        return redirect('dashboard')
+    status = {'approve': 'Approved', 'reject': 'Rejected'}.get(request.POST.get('action'))
+    if status:
+        appointments = Appointment.objects.filter(pk__in=_selected_ids(request), status='Pending')
+        # Doctors can only moderate their own appointments
+        if not request.user.is_staff:
+            appointments = appointments.filter(doctor_id=request.doctor_id)
+        try:
+            with transaction.atomic():
+                pks = transition_queryset(appointments, status)
+                notify_appointments(pks, status)
+                count = len(pks)
+        except InvalidTransition:
+            messages.error(request, 'Some of the selected appointments were updated by someone else. Please try again.')
+        else:
+            messages.success(request, f'{count} appointment(s) {status.lower()}.')
     return redirect('appointment_list')
 
 @login_required
@@ -463,7 +706,7 @@ def doctor_update(request, pk):
 def doctor_delete(request, pk):
     doctor = get_object_or_404(Doctor, pk=pk)
     if request.method == 'POST':
-        doctor.delete()
+        soft_delete(doctor)
         return redirect('doctor_list')
     return render(request, 'pharmacy/generic_confirm_delete.html', {'object': doctor, 'title': 'Doctor'})
 
@@ -499,15 +742,21 @@ def doctor_schedule_delete(request, pk):
 
 @login_required
 def supplier_request_list(request):
-    requests = SupplierRequest.objects.all().order_by('-created_at')
+    requests = SupplierRequest.objects.filter(branch_id=request.branch_id).order_by('-created_at')
     return render(request, 'pharmacy/supplier_request_list.html', {'requests': requests})
 
 @login_required
 def supplier_request_create(request):
+    if not _require_branch(request):
+        return redirect('supplier_request_list')
     if request.method == 'POST':
         form = SupplierRequestForm(request.POST)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                req = form.save(commit=False)
+                req.branch_id = request.branch_id
+                req.save()
+                notify_supplier_request(req)
             return redirect('supplier_request_list')
     else:
         form = SupplierRequestForm()
@@ -515,20 +764,39 @@ def supplier_request_create(request):
 
 @login_required
 def supplier_request_status(request, pk, status):
+    if not request.user.is_staff:
+        return redirect('dashboard')
     req = get_object_or_404(SupplierRequest, pk=pk)
-    if status == 'Completed' and req.status != 'Completed':
-        req.medicine.quantity += req.quantity
-        req.medicine.save()
-    req.status = status
-    req.save()
+    try:
+        with transaction.atomic(), stock_atomic(req.branch_id):
+            if transition(req, status) and status == 'Completed':
+                put_stock(req.branch_id, {req.medicine_id: req.quantity})
+    except InvalidTransition:
+        messages.error(request, f'Supplier requests cannot be marked as {status}.')
+    return redirect('supplier_request_list')
+
+@login_required
+@require_POST
+def supplier_request_bulk(request):
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    if request.POST.get('action') == 'receive':
+        try:
+            # Only the current branch's requests, so every delivery lands in one stock database
+            with transaction.atomic(), stock_atomic(request.branch_id):
+                selected = SupplierRequest.objects.filter(pk__in=_selected_ids(request), branch_id=request.branch_id)
+                pks = transition_queryset(selected, 'Completed')
+                received = SupplierRequest.objects.filter(pk__in=pks).values('medicine_id').annotate(total=Sum('quantity'))
+                put_stock(request.branch_id, {row['medicine_id']: row['total'] for row in received})
+        except InvalidTransition:
+            messages.error(request, 'Some of the selected requests were updated by someone else. Please try again.')
+        else:
+            messages.success(request, f'{len(pks)} request(s) received.')
     return redirect('supplier_request_list')
 
 @login_required
 def customer_profile(request):
-    customer, created = Customer.objects.get_or_create(
-        user=request.user,
-        defaults={'name': request.user.username, 'email': request.user.email, 'phone': ''}
-    )
+    customer = get_object_or_404(Customer, pk=ensure_customer_id(request))
     if request.method == 'POST':
         form = CustomerForm(request.POST, instance=customer)
         if form.is_valid():
@@ -554,7 +822,7 @@ def change_password(request):
 def staff_list(request):
     if not request.user.is_staff:
         return redirect('dashboard')
-    staff_members = User.objects.filter(is_staff=True)
+    staff_members = User.objects.filter(is_staff=True, deletion__isnull=True)
     return render(request, 'pharmacy/staff_list.html', {'staff_members': staff_members})
 
 @login_required
@@ -577,7 +845,7 @@ def staff_delete(request, pk):
     staff_user = get_object_or_404(User, pk=pk)
     if request.method == 'POST':
         if staff_user != request.user: # Prevent deleting yourself
-            staff_user.delete()
+            delete_user_later(staff_user)
         return redirect('staff_list')
     return render(request, 'pharmacy/generic_confirm_delete.html', {'object': staff_user, 'title': 'Staff Member'})
 
@@ -590,7 +858,8 @@ def sales_report(request):
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
     
-    orders = Order.objects.all()
+    branch_ids = [pk for pk, _ in request.branches]
+    orders = Order.objects.filter(branch_id__in=branch_ids)
     
     if start_date:
         orders = orders.filter(order_date__date__gte=start_date)
@@ -606,6 +875,19 @@ def sales_report(request):
         daily_revenue=Sum('total_amount'),
         daily_orders=Count('id')
     ).order_by('-date')
+
+    # Fold in archived orders when the range reaches back into them
+    if orders_reach_archive(start_date):
+        merged = {day['date']: dict(day) for day in daily_sales}
+        for day in archived_daily_sales(branch_ids, start_date, end_date):
+            if day['date'] in merged:
+                merged[day['date']]['daily_revenue'] += day['daily_revenue']
+                merged[day['date']]['daily_orders'] += day['daily_orders']
+            else:
+                merged[day['date']] = day
+        daily_sales = sorted(merged.values(), key=lambda day: day['date'], reverse=True)
+        total_revenue = sum(day['daily_revenue'] for day in daily_sales)
+        total_orders = sum(day['daily_orders'] for day in daily_sales)
     
     context = {
         'total_revenue': total_revenue, 
@@ -616,6 +898,87 @@ def sales_report(request):
     }
     return render(request, 'pharmacy/sales_report.html', context)
 
+def _query_date(request, name):
+    """The YYYY-MM-DD date in a query parameter, None if it is missing or not a real date."""
+    try:
+        return parse_date(request.GET.get(name) or '')
+    except ValueError:
+        # Well formed but impossible, such as February 30
+        return None
+
+@login_required
+def sales_analytics(request):
+    if not request.user.is_staff:
+        return redirect('dashboard')
+
+    start = _query_date(request, 'start_date')
+    end = _query_date(request, 'end_date')
+    start_date = start.isoformat() if start else None
+    end_date = end.isoformat() if end else None
+
+    totals = sales_cube.totals(start, end)
+    top_sellers = sales_cube.by_medicine(start, end, order_by='qty')
+    top_revenue = sales_cube.by_medicine(start, end, order_by='amount')
+    heatmap = sales_cube.hour_heatmap(start, end)
+    cohorts = sales_cube.cohorts(start, end)
+
+    # Only the medicines that are actually shown need their names
+    names = dict(Medicine.objects.filter(pk__in={row['medicine_id'] for row in top_sellers + top_revenue}).values_list('pk', 'name'))
+    for row in top_sellers + top_revenue:
+        row['name'] = names.get(row['medicine_id'], f"#{row['medicine_id']}")
+
+    peak = heatmap.max() or 1
+    heatmap_rows = [
+        {'day': day, 'cells': [{'revenue': value, 'intensity': round(value / peak, 2)} for value in heatmap[i]]}
+        for i, day in enumerate(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])
+    ]
+
+    context = {
+        'totals': totals,
+        'top_sellers': top_sellers,
+        'top_revenue': top_revenue,
+        'heatmap_rows': heatmap_rows,
+        'hours': range(24),
+        'cohorts': cohorts,
+        'start_date': start_date,
+        'end_date': end_date,
+    }
+    return render(request, 'pharmacy/sales_analytics.html', context)
+
+@login_required
+def inventory_report(request):
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    report = valuation()
+    buckets = [{'name': name, 'label': label, **report['buckets'][name]} for name, label in BUCKETS]
+    names = dict(Supplier.all_objects.filter(pk__in=[pk for pk in report['suppliers'] if pk]).values_list('pk', 'name'))
+    suppliers = [
+        {
+            'name': names.get(pk, f'#{pk}') if pk else 'Never requested',
+            'param': pk or 'none',
+            'total': totals['total'],
+            'cells': [{'bucket': name, **totals.get(name, {'skus': 0, 'at_price': 0, 'at_cost': 0})} for name, _ in BUCKETS],
+        }
+        for pk, totals in report['suppliers'].items()
+    ]
+    suppliers.sort(key=lambda row: row['total']['at_price'], reverse=True)
+    context = {'total': report['total'], 'buckets': buckets, 'suppliers': suppliers, 'bucket_labels': [label for _, label in BUCKETS]}
+    return render(request, 'pharmacy/inventory_report.html', context)
+
+@login_required
+@require_GET
+def inventory_export(request, bucket):
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    if bucket not in dict(BUCKETS):
+        raise Http404('Unknown expiry bucket.')
+    supplier = request.GET.get('supplier')
+    if supplier and supplier != 'none' and not supplier.isdigit():
+        raise Http404('Unknown supplier.')
+    response = StreamingHttpResponse(bucket_csv(bucket, supplier or None), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="inventory-{bucket}.csv"'
+    return response
+
 @login_required
 def prescription_list(request):
     if request.user.is_staff:
@@ -650,64 +1013,72 @@ def prescription_create(request):
 
 @login_required
 def prescription_detail(request, pk):
-    prescription = get_object_or_404(Prescription, pk=pk)
+    prescription = get_object_or_404(Prescription.objects.select_related('doctor', 'patient'), pk=pk)
     # Security check
     if not request.user.is_staff and request.user != prescription.patient and request.user != prescription.doctor:
         return redirect('dashboard')
-    return render(request, 'pharmacy/prescription_detail.html', {'prescription': prescription})
+    items = fill_related(prescription.items.all(), 'medicine', medicine_cache)
+    return render(request, 'pharmacy/prescription_detail.html', {'prescription': prescription, 'items': items})
 
 @login_required
+@idempotent
 def prescription_action(request, pk, action):
     if not request.user.is_staff:
         return redirect('dashboard')
     
     prescription = get_object_or_404(Prescription, pk=pk)
     
+    if not _require_branch(request):
+        return redirect('prescription_detail', pk=pk)
+
     if action == 'approve':
-        # Check stock availability
-        for item in prescription.items.all():
-            if item.medicine.quantity < 1: # Assuming 1 unit per item for simplicity
+        # Check stock availability at the current branch
+        items = list(prescription.items.select_related('medicine'))
+        levels = stock_levels(request.branch_id, [item.medicine_id for item in items])
+        for item in items:
+            if levels.get(item.medicine_id, 0) < 1: # Assuming 1 unit per item for simplicity
                 messages.error(request, f"Not enough stock for {item.medicine.name}")
                 return redirect('prescription_detail', pk=pk)
         
-        prescription.status = 'Approved'
-        prescription.save()
-        messages.success(request, 'Prescription approved.')
+        if transition(prescription, 'Approved'):
+            messages.success(request, 'Prescription approved.')
+        else:
+            messages.error(request, 'Only pending prescriptions can be approved.')
         
     elif action == 'reject':
-        prescription.status = 'Rejected'
-        prescription.save()
-        messages.warning(request, 'Prescription rejected.')
+        if transition(prescription, 'Rejected'):
+            messages.warning(request, 'Prescription rejected.')
+        else:
+            messages.error(request, 'This prescription can no longer be rejected.')
         
-    elif action == 'dispense':
-        if prescription.status != 'Approved':
-            messages.error(request, 'Prescription must be approved first.')
-            return redirect('prescription_detail', pk=pk)
-            
+    elif action == 'dispense' and request.method == 'POST':
         # Create Order
         try:
             customer = prescription.patient.customer
         except Customer.DoesNotExist:
             messages.error(request, 'Patient does not have a customer profile.')
             return redirect('prescription_detail', pk=pk)
-            
-        order = Order.objects.create(customer=customer, total_amount=0)
-        total = 0
-        
-        for item in prescription.items.all():
-            # Dispense 1 unit per prescribed item (logic can be enhanced to support qty)
-            qty = 1
-            if item.medicine.quantity >= qty:
-                OrderItem.objects.create(order=order, medicine=item.medicine, quantity=qty)
-                item.medicine.quantity -= qty
-                item.medicine.save()
-                total += item.medicine.price * qty
-        
-        order.total_amount = total
-        order.save()
-        
-        prescription.status = 'Dispensed'
-        prescription.save()
+
+        with transaction.atomic():
+            # Only the request that moves the prescription to Dispensed creates the order
+            if not transition(prescription, 'Dispensed'):
+                messages.error(request, 'Prescription must be approved first.')
+                return redirect('prescription_detail', pk=pk)
+
+            order = Order.objects.create(customer=customer, branch_id=request.branch_id, total_amount=0)
+
+            for item in prescription.items.select_related('medicine'):
+                # Dispense 1 unit per prescribed item (logic can be enhanced to support qty)
+                qty = 1
+                try:
+                    with stock_atomic(request.branch_id):
+                        take_stock(request.branch_id, {item.medicine_id: qty})
+                except OutOfStock:
+                    continue
+                OrderItem.objects.create(order=order, medicine=item.medicine, quantity=qty, unit_price=item.medicine.price, line_total=item.medicine.price * qty)
+
+            update_total(order)
+
         messages.success(request, 'Medicines dispensed and order created.')
         return redirect('order_detail', pk=order.pk)
         
@@ -717,14 +1088,14 @@ def prescription_action(request, pk, action):
 def pending_users_list(request):
     if not request.user.is_staff:
         return redirect('dashboard')
-    pending_users = User.objects.filter(is_active=False).order_by('-date_joined')
+    pending_users = User.objects.filter(is_active=False, deletion__isnull=True).order_by('-date_joined')
     return render(request, 'pharmacy/pending_users_list.html', {'pending_users': pending_users})
 
 @login_required
 def approve_user(request, pk):
     if not request.user.is_staff:
         return redirect('dashboard')
-    user = get_object_or_404(User, pk=pk)
+    user = get_object_or_404(User, pk=pk, deletion__isnull=True)
     user.is_active = True
     user.save()
     messages.success(request, f'User {user.username} approved successfully.')
@@ -738,3 +1109,127 @@ def reject_user(request, pk):
     user.delete()
     messages.success(request, f'User {user.username} rejected.')
     return redirect('pending_users_list')
+
+
+@login_required
+@require_POST
+def sync_sales(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required.'}, status=403)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON.'}, status=400)
+    # Terminals sync into the user's current branch unless they name another one they work at
+    branch_id = payload.get('branch', request.branch_id) if isinstance(payload, dict) else request.branch_id
+    if branch_id is None or branch_id not in [pk for pk, _ in request.branches]:
+        return JsonResponse({'error': 'Unknown branch.'}, status=400)
+    try:
+        results = apply_sales(payload.get('sales') if isinstance(payload, dict) else None, branch_id)
+    except SyncError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    # Bulk inserts send no model signals, and sales may be dated in the past
+    dashboard_publisher.notify()
+    invalidate_facets(Order)
+    return JsonResponse({'results': results})
+
+@login_required
+@require_GET
+def sync_catalog(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required.'}, status=403)
+    try:
+        changes, cursor, has_more = catalog_changes(request.GET.get('cursor'))
+    except SyncError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'medicines': changes, 'cursor': cursor, 'has_more': has_more})
+
+@login_required
+@require_GET
+def sync_stock(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required.'}, status=403)
+    branch = request.GET.get('branch')
+    branch_id = int(branch) if branch and branch.isdigit() else request.branch_id
+    if branch_id is None or branch_id not in [pk for pk, _ in request.branches]:
+        return JsonResponse({'error': 'Unknown branch.'}, status=400)
+    try:
+        changes, cursor, has_more = stock_changes(branch_id, request.GET.get('cursor'))
+    except SyncError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'branch': branch_id, 'stock': changes, 'cursor': cursor, 'has_more': has_more})
+
+@login_required
+@require_GET
+def change_feed(request, feed):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required.'}, status=403)
+    if feed not in FEEDS:
+        return JsonResponse({'error': f'Unknown feed. Feeds: {", ".join(FEEDS)}.'}, status=404)
+    limit = request.GET.get('limit', '')
+    branch_id = None
+    if feed == 'stock':
+        branch = request.GET.get('branch')
+        branch_id = int(branch) if branch and branch.isdigit() else request.branch_id
+        if branch_id is None or branch_id not in [pk for pk, _ in request.branches]:
+            return JsonResponse({'error': 'Unknown branch.'}, status=400)
+    try:
+        rows, deleted, cursor, has_more = feed_changes(
+            feed, request.GET.get('cursor'), int(limit) if limit.isdigit() else FEED_PAGE_SIZE, branch_id,
+        )
+    except SyncError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'feed': feed, 'changes': rows, 'deleted': deleted, 'cursor': cursor, 'has_more': has_more})
+
+
+@login_required
+@require_GET
+def cache_stats(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required.'}, status=403)
+    # Counters are per worker process
+    return JsonResponse({name: object_cache.stats() for name, object_cache in OBJECT_CACHES.items()})
+
+@login_required
+@require_GET
+def rate_limit_stats(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required.'}, status=403)
+    rejected = rejected_counts()
+    return JsonResponse({name: {**limit, 'rejected': rejected[name]} for name, limit in settings.RATE_LIMITS.items()})
+
+@login_required
+@require_GET
+def autocomplete(request, source):
+    index = AUTOCOMPLETE_INDEXES.get(source)
+    if index is None:
+        return JsonResponse({'error': 'Unknown source.'}, status=404)
+    # Only staff and doctors may look up people
+    if source in ('customers', 'patients') and not (request.user.is_staff or request.doctor_id):
+        return JsonResponse({'error': 'Not allowed.'}, status=403)
+    results = index.search(request.GET.get('q', ''))
+    return JsonResponse({'results': [{'id': pk, 'text': label} for pk, label in results]})
+
+
+@login_required
+@require_POST
+def pending_users_bulk(request):
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    pending = User.objects.filter(pk__in=_selected_ids(request), is_active=False)
+    action = request.POST.get('action')
+    if action == 'approve':
+        with transaction.atomic():
+            # Accounts queued for deletion stay inactive, as in approve_user
+            ids = list(pending.filter(deletion__isnull=True).values_list('pk', flat=True))
+            count = User.objects.filter(pk__in=ids, is_active=False).update(is_active=True)
+            # update() skips the signals that normally drop cached users; drop them once it commits
+            for pk in ids:
+                transaction.on_commit(lambda pk=pk: invalidate_user(pk))
+                transaction.on_commit(lambda pk=pk: invalidate_role(pk))
+        messages.success(request, f'{count} user(s) approved.')
+    elif action == 'reject':
+        with transaction.atomic():
+            count = pending.delete()[1].get(User._meta.label, 0)
+        messages.success(request, f'{count} user(s) rejected.')
+    return redirect('pending_users_list')
@@ -0,0 +1,57 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+
+
+class AutocompleteSelect(forms.Select):
+    """
+    Select that renders only the chosen option and looks the rest up from
+    the autocomplete endpoint as the user types, instead of one <option>
+    per row of the queryset.
+    """
+    template_name = 'pharmacy/widgets/autocomplete_select.html'
+
+    class Media:
+        js = ['pharmacy/autocomplete.js']
+
+    def __init__(self, source, attrs=None):
+        super().__init__(attrs)
+        self.source = source
+
+    def use_required_attribute(self, initial):
+        # The select is hidden, so browser validation could not point at it
+        return False
+
+    def _clean_pks(self, value):
+        # Submitted values are unchecked; drop the ones that are not primary keys, as ModelChoiceField does
+        pk_field = self.choices.queryset.model._meta.pk
+        pks = []
+        for v in value:
+            if v in ('', None):
+                continue
+            try:
+                pks.append(pk_field.to_python(v))
+            except ValidationError:
+                continue
+        return pks
+
+    def optgroups(self, name, value, attrs=None):
+        choices = [('', '---------')]
+        if hasattr(self.choices, 'queryset'):
+            selected = self._clean_pks(value)
+            if selected:
+                choices += [self.choices.choice(obj) for obj in self.choices.queryset.filter(pk__in=selected)]
+        all_choices, self.choices = self.choices, choices
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = all_choices
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['autocomplete_url'] = reverse('autocomplete', args=[self.source])
+        context['widget']['selected_label'] = next(
+            (option['label'] for _, options, _ in context['widget']['optgroups'] for option in options if option['selected'] and option['value'] != ''),
+            '',
+        )
+        return context
@@ -20,13 +20,37 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
+# Deployment profile
+# 'single' is one process with per-process caches, as in development.
+# 'scaleout' is several processes behind a load balancer sharing one database:
+# DEBUG off, a cache every process shares (see CACHES) and SQLite writers that
+# queue for the write lock instead of failing. Every setting below can still be
+# overridden on its own through its PMS_* variable.
+
+DEPLOY_PROFILE = os.environ.get('PMS_PROFILE', 'single')
+SCALE_OUT = {'single': False, 'scaleout': True}[DEPLOY_PROFILE]
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-z*a)&fqoww1h2ap-6vu3+r_ze0+g6r+fi0o!_vfi6jb#j8xog_'
+# Every process must use the same key, or sessions and CSRF tokens signed by one are rejected by the others.
+SECRET_KEY = os.environ.get('PMS_SECRET_KEY', 'django-insecure-z*a)&fqoww1h2ap-6vu3+r_ze0+g6r+fi0o!_vfi6jb#j8xog_')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('PMS_DEBUG', '0' if SCALE_OUT else '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('PMS_ALLOWED_HOSTS', '').split(',') if host.strip()]
+CSRF_TRUSTED_ORIGINS = [origin.strip() for origin in os.environ.get('PMS_CSRF_TRUSTED_ORIGINS', '').split(',') if origin.strip()]
+
+# Behind a load balancer that terminates TLS, sets X-Forwarded-Proto and
+# X-Forwarded-Host and appends the client's address to X-Forwarded-For.
+# PMS_PROXY_HOPS is the number of proxies that append to X-Forwarded-For; the
+# address the outermost of them received the request from is the client's.
+BEHIND_PROXY = os.environ.get('PMS_BEHIND_PROXY') == '1'
+PROXY_HOPS = int(os.environ.get('PMS_PROXY_HOPS', 1)) if BEHIND_PROXY else 0
+if BEHIND_PROXY:
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    USE_X_FORWARDED_HOST = True
+    SESSION_COOKIE_SECURE = True
+    CSRF_COOKIE_SECURE = True
 
 
 # Application definition
@@ -43,11 +67,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so /healthz and /readyz skip host validation, sessions and authentication
+    'pharmacy.health.HealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'pharmacy.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'pharmacy.ratelimit.RateLimitMiddleware',
+    'pharmacy.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,6 +99,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'pms.wsgi.application'
+# The live dashboard only pushes updates when served through pms.asgi by an
+# ASGI server; under WSGI (and runserver) it refreshes every 30 seconds
 
 
 # Database
@@ -78,9 +109,133 @@ WSGI_APPLICATION = 'pms.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('PMS_DB_PATH', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('PMS_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+if SCALE_OUT:
+    DATABASES['default']['OPTIONS'] = {
+        # Seconds a writer waits for another process's write lock before failing
+        'timeout': int(os.environ.get('PMS_DB_TIMEOUT', 20)),
+        # Take the write lock when a transaction starts, so two processes never
+        # both read and then fail to upgrade to writing
+        'transaction_mode': 'IMMEDIATE',
+        # Readers do not block the writer, and the writer does not block readers
+        'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+    }
+
+DATABASE_ROUTERS = []
+
+# Optional separate SQLite file for archived orders, appointments, prescriptions
+# and supplier requests. Create its tables with: migrate --database archive
+if os.environ.get('PMS_ARCHIVE_DB'):
+    DATABASES['archive'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['PMS_ARCHIVE_DB'],
+    }
+    DATABASE_ROUTERS.append('pharmacy.routers.ArchiveRouter')
+
+# Optional per-branch stock databases, e.g. PMS_BRANCH_DBS="1=/data/branch1.sqlite3,2=/data/branch2.sqlite3".
+# Branches without an entry keep their stock in 'default'. Create each file with
+# `manage.py migrate --database branch_<id>` before the branch receives stock.
+for entry in filter(None, os.environ.get('PMS_BRANCH_DBS', '').split(',')):
+    branch_id, _, path = entry.partition('=')
+    DATABASES[f'branch_{int(branch_id)}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+    }
+if any(alias.startswith('branch_') for alias in DATABASES):
+    # First, so branch databases receive no tables other than stock
+    DATABASE_ROUTERS.insert(0, 'pharmacy.routers.BranchRouter')
+
+# Closed records older than this many days are moved out of the hot tables
+ARCHIVE_AFTER_DAYS = int(os.environ.get('PMS_ARCHIVE_AFTER_DAYS', 365))
+
+
+# Cache
+# Version tokens, cached objects, rate limit buckets and cached sessions live
+# here, so every process must share it: set PMS_CACHE_URL=redis://host:6379/0
+# (needs the redis package), or the scale-out profile falls back to files under
+# PMS_CACHE_DIR, which suits several processes on one machine. The directory is
+# created on first write. 'single' keeps the per-process memory cache.
+# FileBasedCache's incr() is a read followed by a write and its add() a check
+# followed by a write, neither atomic across processes. Rate limit buckets
+# can then lose a concurrent token and let a burst slightly past its limit
+# through, so use Redis where the limits must hold exactly.
+
+CACHE_URL = os.environ.get('PMS_CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        },
+    }
+elif SCALE_OUT:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('PMS_CACHE_DIR', BASE_DIR / 'cache'),
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('PMS_CACHE_MAX_ENTRIES', 10000))},
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+
+# Sessions
+# 'db' keeps Django's default table, 'cached' serves reads from the cache and
+# only writes through to the DB, 'cookie' keeps sessions in signed cookies.
+
+SESSION_PROFILE = os.environ.get('PMS_SESSION_PROFILE', 'cached')
+
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached': 'django.contrib.sessions.backends.cached_db',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_PROFILE]
+
+# Serves the per-request user lookup from the cache
+AUTHENTICATION_BACKENDS = [
+    'pharmacy.backends.CachedModelBackend',
+]
+
+
+# Email
+# Notifications are queued in the outbox table and delivered by send_outbox.
+# Set PMS_EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend to
+# write them to EMAIL_FILE_PATH locally instead.
+
+EMAIL_BACKEND = os.environ.get('PMS_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('PMS_EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('PMS_EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('PMS_EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('PMS_EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('PMS_EMAIL_USE_TLS') == '1'
+EMAIL_TIMEOUT = 10
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = os.environ.get('PMS_DEFAULT_FROM_EMAIL', 'pharmacy@localhost')
+
+
+# Rate limiting
+# Token buckets per user (or IP when anonymous, from X-Forwarded-For behind a
+# proxy, see PROXY_HOPS) for the URL names below: up to
+# `burst` requests at once, refilled at `rate` requests per `per` seconds.
+# Only the listed methods are counted. PMS_RATE_LIMITS=off disables them all.
+
+RATE_LIMITS = {
+    'buy_medicine': {'rate': 10, 'per': 60, 'burst': 5},
+    'login': {'rate': 5, 'per': 60, 'burst': 5},
+    'register': {'rate': 3, 'per': 600, 'burst': 3},
+    'book_appointment': {'rate': 5, 'per': 300, 'burst': 3},
+}
+if os.environ.get('PMS_RATE_LIMITS') == 'off':
+    RATE_LIMITS = {}
 
 
 # Password validation
@@ -119,13 +274,23 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
-STATICFILES_DIRS = [
-    BASE_DIR / 'static',
-]
+# collectstatic writes content-hashed copies plus .gz/.br variants here,
+# which StaticFilesMiddleware serves with far-future cache headers. With DEBUG
+# off pages need the manifest, so run collectstatic when deploying each process
+STATIC_ROOT = os.environ.get('PMS_STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'pharmacy.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
-# Create the static directory if it doesn't exist to avoid staticfiles.W004
-if not (BASE_DIR / 'static').exists():
-    (BASE_DIR / 'static').mkdir(exist_ok=True)
+# Only when present: several processes importing settings at once must not
+# race to create it, and a read-only deployment cannot
+STATICFILES_DIRS = [path for path in [BASE_DIR / 'static'] if path.is_dir()]
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field